@@ -0,0 +1,241 @@
+# archive_utils.py
+"""
+Read-only access to datasets packed in zip or tar archives, without extracting.
+
+An archive stands in for a folder: its members get paths like
+"/data/set.zip/sub/img_001.png" (archive path + "/" + member name), so the
+catalog, the corpus index and the file list treat them like regular files.
+read_text(), open_binary() and stat_path() accept both kinds of path.
+
+Members stored without compression (typical for images in a zip, and
+everything in a plain .tar) are read straight from a memory map of the
+archive. Compressed zip members are inflated on demand. Compressed tarballs
+can only be read front to back, so ingestion reads their captions in one
+streaming pass (iter_read) and single-member reads are slow.
+"""
+import io
+import os
+import mmap
+import struct
+import tarfile
+import threading
+import time
+import zipfile
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+ZIP_LOCAL_HEADER = struct.Struct("<4s5H3L2H")  # Ends with file name length, extra field length
+
+_open_archives = {}  # Archive path -> DatasetArchive, per process
+_open_lock = threading.Lock()
+
+
+def is_archive(path):
+    """True if path is an archive file this module can read."""
+    return path.lower().endswith(ARCHIVE_EXTENSIONS) and os.path.isfile(path)
+
+
+def split_archive_path(path):
+    """
+    Splits a member path into (archive path, member name), e.g.
+    '/data/set.zip/sub/a.txt' -> ('/data/set.zip', 'sub/a.txt').
+    Returns None for paths that aren't inside an archive.
+    """
+    lowered = path.lower()
+    for ext in ARCHIVE_EXTENSIONS:
+        for sep in {os.sep, "/"}:
+            index = lowered.find(ext + sep)
+            if index != -1:
+                archive_path = path[:index + len(ext)]
+                if os.path.isfile(archive_path):
+                    return archive_path, path[index + len(ext) + 1:].replace(os.sep, "/")
+    return None
+
+
+def open_archive(archive_path):
+    """Returns the (cached, shared) DatasetArchive for a path, reopening it if the file changed."""
+    st = os.stat(archive_path)
+    stamp = (st.st_size, st.st_mtime_ns)
+    with _open_lock:
+        archive = _open_archives.get(archive_path)
+        if archive is None or archive.stamp != stamp:
+            if archive is not None:
+                archive.close()
+            archive = _open_archives[archive_path] = DatasetArchive(archive_path, stamp)
+        return archive
+
+
+def read_text(path):
+    """Reads a caption file (regular or archive member) as text, ignoring undecodable bytes."""
+    member = split_archive_path(path)
+    if member is None:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+    data = open_archive(member[0]).read(member[1])
+    return data.decode("utf-8", errors="ignore").replace("\r\n", "\n")  # Same newlines as text mode
+
+
+def open_binary(path):
+    """Opens a regular file or archive member for binary reading (seekable)."""
+    member = split_archive_path(path)
+    if member is None:
+        return open(path, "rb")
+    return open_archive(member[0]).open(member[1])
+
+
+def stat_path(path):
+    """Returns (size, mtime_ns) of a regular file or archive member. Raises OSError if it doesn't exist."""
+    member = split_archive_path(path)
+    if member is None:
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+    return open_archive(member[0]).stat(member[1])
+
+
+class _MemoryReader(io.RawIOBase):
+    """Seekable read-only file over a memoryview, so Pillow can decode a stored member in place."""
+
+    def __init__(self, view):
+        super().__init__()
+        self._view = view
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = max(0, min(len(buffer), len(self._view) - self._pos))
+        buffer[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+class DatasetArchive:
+    """
+    One open zip or tar archive. Member listing comes from the zip central
+    directory (or one pass over the tar headers) without reading any data.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path, stamp=None):
+        self.path = path
+        self.stamp = stamp
+        self._lock = threading.Lock()  # zipfile/tarfile objects aren't safe for concurrent reads
+        self._mmap = None
+        self._members = {}  # Member name -> (size, mtime_ns)
+        self._offsets = {}  # Stored (uncompressed) member -> where its bytes start in the archive
+        self._stored_headers = {}  # Stored zip member -> local header offset; its data offset is found on first use
+        if zipfile.is_zipfile(path):
+            self.kind = "zip"
+            self._zip = zipfile.ZipFile(path)
+            self._file = open(path, "rb")
+            for info in self._zip.infolist():
+                if info.is_dir():
+                    continue
+                mtime_ns = int(time.mktime(info.date_time + (0, 0, -1)) * 1e9)
+                if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:  # Stored and not encrypted
+                    self._stored_headers[info.filename] = info.header_offset
+                self._members[info.filename] = (info.file_size, mtime_ns)
+        else:
+            self.kind = "tar"
+            self._tar = tarfile.open(path, "r:*")
+            compressed = not path.lower().endswith(".tar")
+            for info in self._tar:
+                if info.isfile():
+                    if not compressed and not info.sparse:
+                        self._offsets[info.name] = info.offset_data
+                    self._members[info.name] = (info.size, int(info.mtime * 1e9))
+        # Random access is cheap unless it's a compressed tarball (which has to be decompressed from the start)
+        self.random_access = self.kind == "zip" or self.path.lower().endswith(".tar")
+
+    def _zip_data_offset(self, header_offset):
+        """Where a stored member's bytes start: after its local header, which can differ from the central one."""
+        self._file.seek(header_offset)
+        header = ZIP_LOCAL_HEADER.unpack(self._file.read(ZIP_LOCAL_HEADER.size))
+        name_length, extra_length = header[-2], header[-1]
+        return header_offset + ZIP_LOCAL_HEADER.size + name_length + extra_length
+
+    def close(self):
+        with self._lock:
+            if self.kind == "zip":
+                self._zip.close()
+                self._file.close()
+            else:
+                self._tar.close()
+            self._mmap = None  # Views handed out keep the mapping alive until they are dropped
+
+    def scan(self, extensions):
+        """Like corpus_index.scan_folder: {member name: (size, mtime_ns)} for members with these extensions."""
+        return {name: stat for name, stat in self._members.items()
+                if name.lower().endswith(extensions) and not name.startswith("__MACOSX/")}
+
+    def stat(self, name):
+        try:
+            return self._members[name]
+        except KeyError:
+            raise FileNotFoundError(f"No such member in {self.path}: {name}") from None
+
+    def _view(self, name):
+        """A memoryview of a stored member's bytes in the mapped archive, or None if it is compressed."""
+        offset = self._offsets.get(name)
+        if offset is None:
+            header_offset = self._stored_headers.get(name)
+            if header_offset is None:
+                return None
+            with self._lock:
+                offset = self._offsets[name] = self._zip_data_offset(header_offset)
+        if self._mmap is None:
+            with self._lock:
+                if self._mmap is None:
+                    with open(self.path, "rb") as f:
+                        self._mmap = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return self._mmap[offset:offset + self._members[name][0]]
+
+    def read(self, name):
+        """Returns a member's bytes."""
+        self.stat(name)  # FileNotFoundError for unknown members
+        view = self._view(name)
+        if view is not None:
+            return bytes(view)
+        with self._lock:
+            if self.kind == "zip":
+                return self._zip.read(name)
+            return self._tar.extractfile(name).read()
+
+    def open(self, name):
+        """Returns a seekable binary file for a member: a view of the mapping if stored, else its bytes in memory."""
+        self.stat(name)
+        view = self._view(name)
+        if view is not None:
+            return _MemoryReader(view)
+        return io.BytesIO(self.read(name))
+
+    def iter_read(self, names):
+        """
+        Yields (name, bytes) for the given members in archive order. For a
+        compressed tarball this is one sequential pass instead of a
+        decompression from the start for every member.
+        """
+        wanted = set(names)
+        if self.random_access:
+            for name in self._members:
+                if name in wanted:
+                    yield name, self.read(name)
+            return
+        with tarfile.open(self.path, "r:*") as tar:  # Own handle: a long pass shouldn't block other readers
+            for info in tar:
+                if info.name in wanted and info.isfile():
+                    yield info.name, tar.extractfile(info).read()
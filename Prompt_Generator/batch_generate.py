@@ -0,0 +1,226 @@
+# batch_generate.py
+"""
+Headless batch prompt generation, no Qt required.
+
+Example:
+    python batch_generate.py /path/to/dataset -n 1000000 --mode shuffle --prefix PonyXL \\
+        --word-limit 15 --format jsonl --seed 42 --workers 8 -o prompts.jsonl
+
+Several folders are mixed by weight, each loaded from its own cached index:
+    python batch_generate.py /data/anime /data/photo --weights 3 1 --mode shuffle -n 1000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from collections import deque
+from functools import lru_cache
+from multiprocessing import Pool
+from archive_utils import is_archive
+from corpus_index import CorpusIndex
+from corpus_shards import NO_FILTER, Shard, ShardedCorpus, has_filter
+from file_utils import load_prefixes, load_files
+from prompt_utils import read_prompt_file, build_prompt
+from tag_index import TagIndex, parse_tag_query
+from tokenizer_utils import DEFAULT_TOKENIZER, TOKENIZERS, join_tokens
+
+CHUNK_SIZE = 10000  # Prompts per worker task
+
+# Per-process generation state, set up once by init_worker()
+_state = {}
+
+
+def print_error(message):
+    print(f"Error: {message}", file=sys.stderr)
+
+
+def init_worker(corpus, prefix_list, mode, word_limit, seed, tokenizer=DEFAULT_TOKENIZER, query=NO_FILTER):
+    _state.update(corpus=corpus, prefix_list=prefix_list or [""], mode=mode,
+                  word_limit=word_limit, seed=seed, tokenizer=tokenizer, query=query)
+    # Samplers are built here, once per process, rather than pickled over from the parent
+    _state["sampler"] = corpus.shuffle_sampler(query) if mode in ("shuffle", "coherent") else None
+
+
+@lru_cache(maxsize=65536)
+def _cached_prompt_file(filepath):
+    return read_prompt_file(filepath)
+
+
+def generate_chunk(task):
+    """
+    Generates one chunk of prompts as (source, prompt) pairs.
+    Each chunk has its own seed derived from the run seed, so output is
+    reproducible regardless of how many workers share the work.
+    """
+    chunk_index, count = task
+    seed = _state["seed"]
+    chunk_seed = None if seed is None else seed * 1000003 + chunk_index
+    rng = random.Random(chunk_seed)
+    prefix_list = _state["prefix_list"]
+    if _state["mode"] == "shuffle":
+        batches = _state["sampler"].sample_batch(count, _state["word_limit"], seed=chunk_seed)
+        tokenizer = _state["tokenizer"]
+        return [(None, build_prompt(prefix_list, join_tokens(words, tokenizer), rng)) for words in batches]
+    corpus, query = _state["corpus"], _state["query"]
+    if _state["mode"] == "coherent":
+        tokenizer = _state["tokenizer"]
+        return [(None, build_prompt(prefix_list, join_tokens(corpus.coherent_sample(_state["word_limit"], query, rng), tokenizer), rng))
+                for _ in range(count)]
+
+    results = []
+    for _ in range(count):
+        filepath = corpus.pick_random_file(query, rng)
+        try:
+            content = _cached_prompt_file(filepath)
+        except OSError as e:
+            print_error(f"Error reading file: {e}")
+            continue
+        results.append((filepath, build_prompt(prefix_list, content, rng)))
+    return results
+
+
+def iter_tasks(total, chunk_size):
+    chunk_index = 0
+    for start in range(0, total, chunk_size):
+        yield chunk_index, min(chunk_size, total - start)
+        chunk_index += 1
+
+
+def imap_bounded(pool, func, tasks, window):
+    """
+    Like Pool.imap (ordered results), but keeps at most `window` tasks in flight,
+    so a slow consumer doesn't let finished chunks pile up in memory.
+    """
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def write_prompts(chunks, out, output_format, prefix_type):
+    for chunk in chunks:
+        lines = []
+        for source, prompt in chunk:
+            if output_format == "jsonl":
+                lines.append(json.dumps({"prompt": prompt, "source": source, "prefix_type": prefix_type}, ensure_ascii=False))
+            else:
+                lines.append(prompt.replace("\n", " "))
+        if lines:
+            out.write("\n".join(lines) + "\n")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate prompts from a caption folder without the GUI.")
+    parser.add_argument("folders", nargs="+", metavar="folder",
+                        help="Folder (or .zip/.tar archive) containing .txt caption files; several are mixed by --weights")
+    parser.add_argument("--weights", type=float, nargs="+", default=None,
+                        help="Sampling weight of each folder, in order (default: 1 each)")
+    parser.add_argument("--recursive", action="store_true", help="Include captions in subfolders")
+    parser.add_argument("-n", "--count", type=int, default=10, help="Number of prompts to generate")
+    parser.add_argument("--mode", choices=("random", "shuffle", "coherent"), default="random",
+                        help="random: whole caption files, shuffle: words drawn from all files, "
+                             "coherent: distinct words that appear together in captions")
+    parser.add_argument("--prefix", dest="prefix_type", default=None, help="Prefix type from the prefixes file (default: first one)")
+    parser.add_argument("--prefixes", dest="prefixes_file", default="prefixes.json", help="Prefixes JSON file")
+    parser.add_argument("--word-limit", type=int, default=15, help="Words per shuffled prompt")
+    parser.add_argument("--tokenizer", choices=tuple(TOKENIZERS), default=DEFAULT_TOKENIZER,
+                        help="How captions are split into words for shuffle mode")
+    parser.add_argument("--tags", default="",
+                        help="Only use captions with these comma-separated tags; prefix a tag with '-' to exclude it "
+                             "(a filter that starts with '-' needs --tags=-hat, or use --exclude)")
+    parser.add_argument("--exclude", default="", help="Leave out captions with any of these comma-separated tags")
+    parser.add_argument("--format", dest="output_format", choices=("text", "jsonl"), default="text")
+    parser.add_argument("-o", "--output", default="-", help="Output file ('-' for stdout)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible output")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Prompts per worker task")
+    return parser.parse_args(argv)
+
+
+def tag_query(tags, exclude, tokenizer):
+    """The (include, exclude) query of --tags plus --exclude, or NO_FILTER if neither is given."""
+    if not (tags or exclude):
+        return NO_FILTER
+    include, excluded = parse_tag_query(tags, tokenizer)
+    for tokens in parse_tag_query(exclude, tokenizer):  # A '-' in --exclude is redundant, but allowed
+        excluded.extend(tokens)
+    return include, excluded
+
+
+def load_shard(folder, weight, args, query):
+    """Loads one folder as a Shard, with the tag index and co-occurrence graph the run needs. None on error."""
+    recursive = args.recursive and not is_archive(folder)
+    shard = Shard(folder, weight, recursive)
+    text_files, all_words = load_files(folder, print_error, args.tokenizer, recursive)
+    shard.text_files = text_files
+    shard.set_words(all_words)
+    if has_filter(query) or args.mode == "coherent":
+        index = CorpusIndex(folder, args.tokenizer, recursive=recursive)
+        index.load()  # Just saved by load_files
+        if has_filter(query):
+            shard.tag_index = TagIndex.from_corpus_index(index, folder)
+        if args.mode == "coherent":
+            try:
+                shard.cooccurrence = index.cooccurrence_graph()
+            except OSError as e:
+                print_error(f"Could not build co-occurrence graph: {e}")
+                return None
+            shard.set_words(shard.cooccurrence.vocabulary)
+    shard.loaded = True
+    return shard
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    for folder in args.folders:
+        if not (os.path.isdir(folder) or is_archive(folder)):
+            print_error(f"Invalid folder path: {folder}")
+            return 1
+    weights = args.weights or [1.0] * len(args.folders)
+    if len(weights) != len(args.folders) or min(weights) < 0 or not sum(weights):
+        print_error("Give one non-negative weight per folder, not all zero.")
+        return 1
+
+    prefixes = load_prefixes(args.prefixes_file, print_error)
+    prefix_type = args.prefix_type or (next(iter(prefixes), ""))
+    if prefix_type not in prefixes:
+        print_error(f"Prefix '{prefix_type}' not found in {args.prefixes_file}")
+        return 1
+
+    query = tag_query(args.tags, args.exclude, args.tokenizer)
+    corpus = ShardedCorpus()
+    for folder, weight in zip(args.folders, weights):
+        shard = load_shard(folder, weight, args, query)
+        if shard is None:
+            return 1
+        corpus.add(shard)
+    if not (corpus.match_count() if args.mode == "random" else corpus.has_words()):
+        print_error("No text files found.")
+        return 1
+    if has_filter(query) and not corpus.match_count(query):
+        print_error("No captions match the tag filter.")
+        return 1
+
+    init_args = (corpus, prefixes[prefix_type], args.mode, args.word_limit, args.seed, args.tokenizer, query)
+    tasks = iter_tasks(args.count, max(1, args.chunk_size))
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        if args.workers <= 1:
+            init_worker(*init_args)
+            write_prompts(map(generate_chunk, tasks), out, args.output_format, prefix_type)
+        else:
+            with Pool(args.workers, initializer=init_worker, initargs=init_args) as pool:
+                chunks = imap_bounded(pool, generate_chunk, tasks, window=2 * args.workers)
+                write_prompts(chunks, out, args.output_format, prefix_type)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
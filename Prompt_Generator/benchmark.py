@@ -0,0 +1,436 @@
+# benchmark.py
+"""
+Headless benchmarks for the hot paths, run on a generated synthetic dataset.
+
+Times folder ingestion (cold and warm index), random/shuffle/coherent prompt
+generation, tag filter queries, caption -> image pairing, thumbnail
+decoding and gallery scrolling, and writes the results as JSON so runs can be compared over time.
+No display needed: Qt runs on the offscreen platform.
+
+Example:
+    python benchmark.py --files 100k --images 300 -o results.json
+    python benchmark.py --files 1k --compare results.json
+"""
+import os
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")  # Before anything imports Qt
+
+import argparse
+import json
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from PIL import Image
+from tokenizer_utils import TOKENIZERS
+
+BENCHMARK_VERSION = 1
+# Common image sizes in captioned datasets, (width, height)
+IMAGE_SIZES = ((512, 512), (768, 1024), (1024, 1024), (832, 1216), (1216, 832), (1536, 2048), (3000, 4000))
+THUMBNAIL_SIZE = (512, 512)
+BATCH_REPEATS = 5  # Timed runs of the one-call batch benchmarks (the median is reported)
+THEMES = 50  # Groups of tags that tend to appear together (e.g. an outfit), for the co-occurrence graph
+THEME_TAGS = 12
+SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "sha", "to", "vi", "ze", "an", "el", "or", "un", "bri", "gal", "dor")
+
+
+def parse_count(text):
+    """Parses counts like '1000', '100k' or '1m'."""
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1000000}.get(text[-1:], 1)
+    try:
+        return int(float(text[:-1] if scale > 1 else text) * scale)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid count: {text}") from None
+
+
+# --- Synthetic dataset ---
+def make_tag_names(count, rng):
+    """Makes `count` distinct tag names, about a third of them two words long ("long hair" style)."""
+    names = set()
+    while len(names) < count:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if rng.random() < 0.3:
+            word += " " + "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+        names.add(word)
+    return sorted(names)
+
+
+def make_caption(tags, cum_weights, themes, rng):
+    """One caption: a Zipf-distributed mix of tags plus a few from one theme, comma-separated."""
+    chosen = dict.fromkeys(rng.choices(tags, cum_weights=cum_weights, k=rng.randint(8, 40)))
+    chosen.update(dict.fromkeys(rng.sample(rng.choice(themes), rng.randint(2, 5))))
+    return ", ".join(chosen)
+
+
+def make_image(path, size, rng):
+    """Writes a smooth, noisy test image (compresses like a photo rather than a flat fill)."""
+    width, height = size
+    channels = (
+        Image.linear_gradient("L").resize(size),
+        Image.effect_noise((max(1, width // 8), max(1, height // 8)), rng.randint(20, 80)).resize(size, Image.Resampling.BILINEAR),
+        Image.radial_gradient("L").resize(size),
+    )
+    img = Image.merge("RGB", channels)
+    if path.endswith(".png"):
+        img.save(path, compress_level=6)
+    else:
+        img.save(path, quality=90)
+
+
+def generate_dataset(folder, files, images, tag_count, seed):
+    """
+    Writes `files` caption files (and paired images for the first `images` of
+    them) into folder. A folder already generated with the same parameters is
+    reused. Returns the parameters, which also go into the results.
+    """
+    params = {"files": files, "images": images, "tags": tag_count, "seed": seed}
+    marker = os.path.join(folder, ".synthetic.json")
+    try:
+        with open(marker, "r", encoding="utf-8") as f:
+            if json.load(f) == params:
+                return params
+    except (OSError, json.JSONDecodeError):
+        pass
+    if os.path.isdir(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+
+    rng = random.Random(seed)
+    tags = make_tag_names(tag_count, rng)
+    rng.shuffle(tags)  # Frequency rank shouldn't follow alphabetical order
+    running, cum_weights = 0.0, []
+    for rank in range(1, len(tags) + 1):
+        running += 1.0 / rank  # Zipf (s = 1): a few very common tags and a long tail
+        cum_weights.append(running)
+    themes = [rng.sample(tags, THEME_TAGS) for _ in range(THEMES)]
+
+    width = len(str(files))
+    started = time.perf_counter()
+    for i in range(files):
+        stem = os.path.join(folder, f"{i:0{width}d}")
+        with open(stem + ".txt", "w", encoding="utf-8") as f:
+            f.write(make_caption(tags, cum_weights, themes, rng))
+        if i < images:
+            make_image(stem + (".png" if rng.random() < 0.3 else ".jpg"), rng.choice(IMAGE_SIZES), rng)
+        if (i + 1) % 100000 == 0:
+            print(f"Generated {i + 1}/{files} files...", file=sys.stderr)
+    print(f"Generated {files} files in {time.perf_counter() - started:.1f}s.", file=sys.stderr)
+
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump(params, f)
+    return params
+
+
+# --- Timing ---
+def summarize(durations, items=None):
+    """Summary of a list of per-call durations (seconds). items: units of work in total, for a throughput figure."""
+    ordered = sorted(durations)
+    total = sum(ordered)
+    result = {
+        "calls": len(ordered),
+        "total_s": total,
+        "median_ms": 1000 * ordered[len(ordered) // 2] if ordered else None,
+        "p95_ms": 1000 * ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] if ordered else None,
+    }
+    if items is not None:
+        result["per_s"] = items / total if total > 0 else None
+    return result
+
+
+def time_calls(func, args_list):
+    """Calls func(*args) for each args tuple, returning the durations."""
+    durations = []
+    for args in args_list:
+        started = time.perf_counter()
+        func(*args)
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def timed(func, *args):
+    """Returns (result, seconds) of one call."""
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+# --- Benchmarks ---
+def bench_ingest(folder, tokenizer, workers):
+    """Loads the folder through FolderLoadThread (run in this thread), first with no index, then with it."""
+    from corpus_index import CorpusIndex, scan_folder
+    from folder_load_thread import FolderLoadThread
+
+    results = {}
+    stats, seconds = timed(scan_folder, folder)
+    results["scan_folder"] = {"files": len(stats), "seconds": seconds, "per_s": len(stats) / seconds}
+
+    index = CorpusIndex(folder, tokenizer)
+    for path in (index.index_path, index.vocab_path, index.graph_path):
+        if os.path.exists(path):
+            os.remove(path)
+    for name in ("ingest_cold", "ingest_warm"):
+        thread = FolderLoadThread(folder, tokenizer, max_workers=workers)
+        loaded = []
+        thread.batchLoaded.connect(lambda files, words: loaded.extend(files))
+        thread.loadFailed.connect(lambda message: print(f"Error: {message}", file=sys.stderr))
+        _, seconds = timed(thread.run)
+        results[name] = {"files": len(loaded), "seconds": seconds, "per_s": len(loaded) / seconds}
+    return results
+
+
+def bench_generation(folder, tokenizer, count, word_limit, seed):
+    from corpus_index import CorpusIndex
+    from prompt_utils import random_file_prompt, shuffled_prompt
+    from sampler import WeightedSampler
+    from tag_index import TagIndex
+
+    rng = random.Random(seed)
+    index = CorpusIndex(folder, tokenizer)
+    index.load()
+    text_files = [os.path.join(folder, name) for name in index.entries]
+    results = {}
+
+    durations = time_calls(lambda: random_file_prompt(text_files, [""], rng), [()] * count)
+    results["random_prompt"] = summarize(durations, count)
+
+    sampler, seconds = timed(WeightedSampler, index.all_words)
+    results["sampler_build"] = {"words": len(sampler), "seconds": seconds}
+    durations = time_calls(lambda: shuffled_prompt(sampler, [""], word_limit, rng, tokenizer), [()] * count)
+    results["shuffle_prompt"] = summarize(durations, count)
+    batch_count = 10 * count
+    sampler.sample_batch(1, word_limit, seed)  # Warm-up: the first call imports NumPy
+    durations = sorted(time_calls(sampler.sample_batch, [(batch_count, word_limit, seed)] * BATCH_REPEATS))
+    seconds = durations[len(durations) // 2]  # Median of the repeats
+    results["shuffle_batch"] = {"prompts": batch_count, "repeats": BATCH_REPEATS, "seconds": seconds,
+                                "per_s": batch_count / seconds}
+
+    graph, seconds = timed(index.cooccurrence_graph)
+    results["cooccurrence_build"] = {"pairs": len(graph), "seconds": seconds}
+    graph_sampler = WeightedSampler(graph.vocabulary)
+    durations = time_calls(lambda: graph.sample(word_limit, graph_sampler, rng), [()] * count)
+    results["coherent_prompt"] = summarize(durations, count)
+
+    tag_index, seconds = timed(TagIndex.from_corpus_index, index)
+    results["tag_index_build"] = {"files": len(tag_index), "terms": len(tag_index.terms), "seconds": seconds}
+    # Distinct queries, so none is answered from the result cache: a common tag, a common and a rarer one, an exclusion
+    common, rare = sampler.sample_indices(count, rng), sampler.sample_indices(count, rng)
+    words = index.all_words.word_at
+    queries = [([words(a), words(b)] if i % 3 else [words(a)], [words(b)] if i % 3 == 2 else [])
+               for i, (a, b) in enumerate(zip(common, rare))]
+    durations = time_calls(tag_index.matching_ids, queries)
+    results["tag_query"] = summarize(durations, len(queries))
+    return results
+
+
+def bench_pairing(folder, count, seed):
+    """Builds the caption/image catalog like the UI does, then looks up images for random captions."""
+    from corpus_index import scan_folder
+    from dataset_catalog import DatasetCatalog
+    from file_utils import load_images
+
+    rng = random.Random(seed)
+    text_files = [os.path.join(folder, name) for name in scan_folder(folder)]
+    image_files = load_images(folder)
+    started = time.perf_counter()
+    catalog = DatasetCatalog()
+    catalog.add_captions(text_files, 0)
+    catalog.add_images(image_files)
+    build_seconds = time.perf_counter() - started
+
+    picks = [rng.choice(text_files) for _ in range(100 * count)]
+    started = time.perf_counter()
+    found = sum(1 for text_file in picks if catalog.image_for(text_file))
+    seconds = time.perf_counter() - started
+    return {
+        "catalog_build": {"files": len(text_files) + len(image_files), "seconds": build_seconds},
+        "image_lookup": {"lookups": len(picks), "found": found, "seconds": seconds, "per_s": len(picks) / seconds},
+    }
+
+
+def bench_images(folder):
+    """Thumbnail latency per image: decoding from scratch, then from the disk and memory cache tiers."""
+    from file_utils import load_images
+    from image_thread import load_thumbnail
+    from thumbnail_cache import ThumbnailCache
+
+    image_files = load_images(folder)
+    if not image_files:
+        return {}
+    results = {}
+    for ext in (".jpg", ".png"):
+        subset = [(path, THUMBNAIL_SIZE) for path in image_files if path.endswith(ext)]
+        if subset:
+            results[f"thumbnail_decode{ext.replace('.', '_')}"] = summarize(time_calls(load_thumbnail, subset), len(subset))
+
+    disk_dir = tempfile.mkdtemp(prefix="thumbs_")
+    try:
+        args = [(path, THUMBNAIL_SIZE, ThumbnailCache(disk_dir=disk_dir)) for path in image_files]
+        time_calls(load_thumbnail, args)  # Fill the disk tier
+        cache = ThumbnailCache(disk_dir=disk_dir)  # Empty memory tier: every call is a disk hit
+        args = [(path, THUMBNAIL_SIZE, cache) for path in image_files]
+        results["thumbnail_disk_hit"] = summarize(time_calls(load_thumbnail, args), len(args))
+        results["thumbnail_memory_hit"] = summarize(time_calls(load_thumbnail, args), len(args))
+    finally:
+        shutil.rmtree(disk_dir, ignore_errors=True)
+    return results
+
+
+def bench_gallery(folder, screens=200):
+    """
+    Scrolls the gallery grid down a screen at a time: frame time (viewport
+    update plus a full repaint), and how many cells the loader keeps at most.
+    Decoding carries on in the background, so frames mostly draw placeholders.
+    """
+    from PyQt6.QtWidgets import QApplication
+    from corpus_index import scan_folder
+    from dataset_catalog import DatasetCatalog
+    from file_list_model import FileListModel
+    from file_utils import load_images
+    from gallery_view import GalleryView
+    from thumbnail_cache import ThumbnailCache
+
+    app = QApplication.instance() or QApplication([])
+    text_files = [os.path.join(folder, name) for name in scan_folder(folder)]
+    catalog = DatasetCatalog()
+    catalog.add_images(load_images(folder))
+    model = FileListModel()
+    model.set_files(text_files)
+    view = GalleryView(model, catalog.image_for, ThumbnailCache(use_disk=False))
+    view.resize(1200, 800)
+    view.show()
+    app.processEvents()
+    scroll_bar = view.verticalScrollBar()
+    frames = []
+    max_cells = 0
+    for _ in range(screens):
+        started = time.perf_counter()
+        scroll_bar.setValue(scroll_bar.value() + view.viewport().height())
+        view.update_wanted()
+        view.viewport().grab()
+        frames.append(time.perf_counter() - started)
+        app.processEvents()  # Lets finished cells and lazily fetched rows in
+        max_cells = max(max_cells, len(view.loader.cells))
+        if scroll_bar.value() >= scroll_bar.maximum() and not model.canFetchMore():
+            break
+    view.shutdown()
+    view.close()
+    result = summarize(frames, len(frames))
+    result.update(rows_shown=model.rowCount(), max_cells=max_cells)
+    return {"gallery_scroll": result}
+
+
+# --- Reporting ---
+def environment():
+    def version(module_name):
+        try:
+            return __import__(module_name).__version__
+        except (ImportError, AttributeError):
+            return None
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    from PyQt6.QtCore import PYQT_VERSION_STR
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": version("numpy"),
+        "pillow": version("PIL"),
+        "pyqt": PYQT_VERSION_STR,
+        "commit": commit,
+    }
+
+
+def compare(old, new, out=sys.stderr):
+    """Prints how each shared figure changed since an earlier run: throughputs (per_s) and latencies (_ms, seconds)."""
+    old_results = old.get("results", {})
+    for name, result in new["results"].items():
+        previous = old_results.get(name, {})
+        for field in ("per_s", "median_ms", "p95_ms", "seconds"):
+            before, after = previous.get(field), result.get(field)
+            if not before or after is None:
+                continue
+            change = (after / before - 1) * 100
+            better = change > 0 if field == "per_s" else change < 0
+            print(f"{name:24} {field:10} {before:14.4f} -> {after:14.4f}  {change:+7.1f}%"
+                  f"{'' if abs(change) < 5 else (' better' if better else ' WORSE')}", file=out)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the prompt generator's hot paths on synthetic data.")
+    parser.add_argument("--files", type=parse_count, default=parse_count("1k"),
+                        help="Caption files in the synthetic dataset, e.g. 1k, 100k, 1m")
+    parser.add_argument("--images", type=parse_count, default=100,
+                        help="How many captions get a paired image (decoding is timed on all of them)")
+    parser.add_argument("--tags", type=parse_count, default=20000, help="Distinct tags in the dataset")
+    parser.add_argument("--data-dir", default=None,
+                        help="Where to generate the dataset (default: a folder in the temp directory, reused between runs)")
+    parser.add_argument("--tokenizer", choices=tuple(TOKENIZERS), default="tags", help="Tokenizer for ingestion and shuffle mode")
+    parser.add_argument("--word-limit", type=int, default=15, help="Words per shuffled prompt")
+    parser.add_argument("--count", type=int, default=2000, help="Prompts / lookups per timed generation benchmark")
+    parser.add_argument("--workers", type=int, default=None, help="Ingestion worker processes (default: all CPUs)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip", action="append", default=[], choices=("ingest", "generation", "pairing", "images", "gallery"),
+                        help="Leave out a benchmark group (repeatable)")
+    parser.add_argument("-o", "--output", default="-", help="Results JSON file ('-' for stdout)")
+    parser.add_argument("--compare", default=None, help="Earlier results JSON to compare this run against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    data_dir = args.data_dir or os.path.join(
+        tempfile.gettempdir(), "prompt_generator_bench", f"synthetic_{args.files}_{args.images}_{args.tags}_{args.seed}")
+    dataset = generate_dataset(data_dir, args.files, args.images, args.tags, args.seed)
+    dataset.update(tokenizer=args.tokenizer, word_limit=args.word_limit, count=args.count)
+
+    # Indexes and thumbnails go to a throwaway cache, so runs start cold and the user's cache is untouched
+    cache_home = tempfile.mkdtemp(prefix="prompt_generator_cache_")
+    os.environ["XDG_CACHE_HOME"] = cache_home
+    results = {}
+    try:
+        if "ingest" not in args.skip or "generation" not in args.skip:
+            ingest = bench_ingest(data_dir, args.tokenizer, args.workers)  # Generation needs the index either way
+            if "ingest" not in args.skip:
+                results.update(ingest)
+        if "generation" not in args.skip:
+            results.update(bench_generation(data_dir, args.tokenizer, args.count, args.word_limit, args.seed))
+        if "pairing" not in args.skip:
+            results.update(bench_pairing(data_dir, args.count, args.seed))
+        if "images" not in args.skip:
+            results.update(bench_images(data_dir))
+        if "gallery" not in args.skip:
+            results.update(bench_gallery(data_dir))
+    finally:
+        shutil.rmtree(cache_home, ignore_errors=True)
+
+    from debug_utils import stats_snapshot
+    report = {
+        "benchmark_version": BENCHMARK_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": environment(),
+        "dataset": dataset,
+        "results": results,
+        "instrumentation": stats_snapshot(),  # The app's own timing spans and counters over the whole run
+    }
+    text = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+# cooccurrence.py
+import os
+import mmap
+import random
+import struct
+import tempfile
+from array import array
+from bisect import bisect_right
+from itertools import combinations, islice
+from import_utils import optional_import
+from debug_utils import timed_span
+
+MAGIC = b"RPGCOO01"
+HEADER = struct.Struct("<8sQQQQQ")  # magic, vocab file size, vocab mtime_ns, rows, pairs, running-total item size
+MAX_TOKENS_PER_FILE = 64  # Pairs grow with the square of this; long prose captions only keep their first tokens
+NEIGHBOUR_TRIES = 8  # Neighbour draws per slot before falling back to a frequency draw
+BUILD_CHUNK_FILES = 20000  # Files per vectorized pair-counting pass
+
+
+def capped_tokens(word_counts):
+    """The distinct tokens of one file that take part in co-occurrence, in first-seen order."""
+    return list(islice(word_counts, MAX_TOKENS_PER_FILE))
+
+
+class CooccurrenceGraph:
+    """
+    Sparse tag graph: how often two tokens appear in the same caption file.
+
+    Stored in CSR form over a frozen Vocabulary's word IDs: row i's neighbours
+    are indices[indptr[i]:indptr[i + 1]], and `cumulative` holds each row's
+    running pair counts, so drawing a neighbour in proportion to how often
+    it co-occurs is one bisect, O(log degree), however big the graph gets.
+    Like a Vocabulary, a saved graph can be memory-mapped.
+
+    Files added or removed after the build (watch mode) go into a small
+    word -> {word: delta} overlay that sampling takes into account.
+    """
+
+    def __init__(self, vocabulary, indptr=None, indices=None, cumulative=None):
+        self.vocabulary = vocabulary  # Row/column IDs are this (frozen) vocabulary's word IDs
+        self.indptr = indptr if indptr is not None else array("Q", bytes(8 * (vocabulary.frozen_size + 1)))
+        self.indices = indices if indices is not None else array("I")
+        self.cumulative = cumulative if cumulative is not None else array("Q")
+        self._extra = {}  # word -> {word: pair count delta}
+
+    def __len__(self):
+        """Number of (directed) co-occurrence pairs in the built graph."""
+        return len(self.indices)
+
+    def __getstate__(self):
+        # Memory-mapped buffers can't be pickled (e.g. to worker processes), so send plain copies
+        state = self.__dict__.copy()
+        state["indptr"] = array("Q", self.indptr)
+        state["indices"] = array("I", self.indices)
+        state["cumulative"] = array("I" if self.cumulative.itemsize == 4 else "Q", self.cumulative)
+        return state
+
+    # --- Persistence ---
+    def save(self, path, vocab_stamp):
+        """Writes the built graph atomically. vocab_stamp is the (size, mtime_ns) of the vocabulary file it belongs to."""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(HEADER.pack(MAGIC, vocab_stamp[0], vocab_stamp[1], len(self.indptr) - 1,
+                                    len(self.indices), self.cumulative.itemsize))
+                f.write(self.indptr)
+                f.write(self.cumulative)
+                f.write(self.indices)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def load(cls, path, vocabulary, vocab_stamp, use_mmap=True):
+        """
+        Loads a saved graph for a vocabulary. Raises OSError or ValueError if the
+        file is missing, malformed, or was built from a different vocabulary file.
+        """
+        with open(path, "rb") as f:
+            if use_mmap:
+                data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            else:
+                data = memoryview(f.read())
+        if len(data) < HEADER.size:
+            raise ValueError(f"Truncated co-occurrence file: {path}")
+        magic, vocab_size, vocab_mtime, rows, pairs, itemsize = HEADER.unpack_from(data)
+        if magic != MAGIC or itemsize not in (4, 8):
+            raise ValueError(f"Invalid co-occurrence file: {path}")
+        if [vocab_size, vocab_mtime] != list(vocab_stamp) or rows != vocabulary.frozen_size:
+            raise ValueError("Co-occurrence graph doesn't belong to this vocabulary")
+        indptr_end = HEADER.size + 8 * (rows + 1)
+        cumulative_end = indptr_end + itemsize * pairs
+        if cumulative_end + 4 * pairs != len(data):
+            raise ValueError(f"Invalid co-occurrence file: {path}")
+        return cls(vocabulary,
+                   indptr=data[HEADER.size:indptr_end].cast("Q"),
+                   indices=data[cumulative_end:].cast("I"),
+                   cumulative=data[indptr_end:cumulative_end].cast("I" if itemsize == 4 else "Q"))
+
+    # --- Updates ---
+    def add_file(self, word_counts, sign=1):
+        """Adds (or with sign=-1, removes) one file's tokens to the overlay."""
+        tokens = capped_tokens(word_counts)
+        for a, b in combinations(tokens, 2):
+            for word, other in ((a, b), (b, a)):
+                row = self._extra.setdefault(word, {})
+                row[other] = row.get(other, 0) + sign
+
+    # --- Sampling ---
+    def neighbour(self, word, rng=random):
+        """Draws a word that co-occurs with `word`, weighted by pair count. None if it has no neighbours."""
+        lo = hi = 0
+        word_id = self.vocabulary.id_of(word)
+        if word_id is not None and word_id < len(self.indptr) - 1:
+            lo, hi = self.indptr[word_id], self.indptr[word_id + 1]
+        base_total = self.cumulative[hi - 1] if hi > lo else 0
+        extra = self._extra.get(word)
+        extra_total = sum(delta for delta in extra.values() if delta > 0) if extra else 0
+        total = base_total + extra_total
+        if total <= 0:
+            return None
+
+        for _ in range(NEIGHBOUR_TRIES):
+            r = rng.random() * total
+            if r < base_total:
+                i = bisect_right(self.cumulative, r, lo, hi)
+                other = self.vocabulary.word_at(self.indices[i])
+                delta = extra.get(other, 0) if extra else 0
+                if delta >= 0:
+                    return other
+                # Pairs from removed files: keep the draw with the weight that's left
+                weight = self.cumulative[i] - (self.cumulative[i - 1] if i > lo else 0)
+                if rng.random() * weight < weight + delta:
+                    return other
+            else:
+                r -= base_total
+                for other, delta in extra.items():
+                    if delta > 0:
+                        r -= delta
+                        if r < 0:
+                            return other
+        return None
+
+    @timed_span("cooccurrence.sample")
+    def sample(self, k, fallback, rng=random, allowed=None):
+        """
+        Returns up to k distinct words that tend to appear together.
+        The first word (and any slot where the graph runs dry) is drawn by
+        frequency from `fallback`, a WeightedSampler; every other word is a
+        neighbour of a randomly chosen word already in the prompt.
+        `allowed` (any container) limits neighbours, e.g. to a tag filter's words.
+        """
+        chosen = []
+        seen = set()
+        misses = 0
+        while len(chosen) < k and misses < 4 * k:
+            word = None
+            if chosen:
+                for _ in range(NEIGHBOUR_TRIES):
+                    word = self.neighbour(rng.choice(chosen), rng)
+                    if word is not None and word not in seen and (allowed is None or word in allowed):
+                        break
+                    word = None
+            if word is None:
+                drawn = fallback.sample(1, rng)
+                if not drawn:
+                    break
+                word = drawn[0]
+                if word in seen:
+                    misses += 1
+                    continue
+            chosen.append(word)
+            seen.add(word)
+        return chosen
+
+
+class CooccurrenceBuilder:
+    """
+    Counts co-occurring token pairs file by file, then lays them out as a
+    CooccurrenceGraph. With NumPy, files are counted in vectorized chunks and
+    the sorted partial counts merged as they grow; otherwise pairs go through
+    a dict. Pairs are counted in both directions as row * size + column keys,
+    so the sorted keys already are the graph's CSR order.
+    """
+
+    def __init__(self, vocabulary):
+        self.vocabulary = vocabulary
+        self.size = vocabulary.frozen_size
+        self._ids = {}  # Word -> ID cache; binary searching every token of every file is slow
+        self._chunk = []  # Sorted ID lists of files not counted yet (NumPy path)
+        self._runs = []  # Counted chunks: (sorted unique keys, counts), merged as they pile up
+        self._pairs = {}  # Pure Python path: key -> count
+        self._np = optional_import("numpy")  # Optional: vectorizes pair counting
+
+    def _id(self, word):
+        word_id = self._ids.get(word)
+        if word_id is None:
+            word_id = self.vocabulary.id_of(word)
+            if word_id is None or word_id >= self.size:
+                word_id = -1  # Not in the frozen table (e.g. count dropped to zero)
+            self._ids[word] = word_id
+        return word_id
+
+    def add_file(self, word_counts):
+        ids = sorted({word_id for word_id in map(self._id, capped_tokens(word_counts)) if word_id >= 0})
+        if len(ids) < 2:
+            return
+        if self._np is None:
+            size, pairs = self.size, self._pairs
+            for a, b in combinations(ids, 2):
+                for key in (a * size + b, b * size + a):
+                    pairs[key] = pairs.get(key, 0) + 1
+            return
+        self._chunk.append(ids)
+        if len(self._chunk) >= BUILD_CHUNK_FILES:
+            self._flush()
+
+    def _flush(self):
+        """Counts the pending chunk's pairs, one vectorized pass per distinct file length."""
+        np = self._np
+        by_length = {}
+        for ids in self._chunk:
+            by_length.setdefault(len(ids), []).append(ids)
+        self._chunk = []
+        size = np.uint64(self.size)
+        keys = []
+        for length, files in by_length.items():
+            matrix = np.array(files, dtype=np.uint64)
+            first, second = np.triu_indices(length, 1)
+            a, b = matrix[:, first].ravel(), matrix[:, second].ravel()
+            keys.append(a * size + b)
+            keys.append(b * size + a)
+        if keys:
+            chunk_keys, chunk_counts = np.unique(np.concatenate(keys), return_counts=True)
+            self._runs.append((chunk_keys, chunk_counts.astype(np.uint32)))
+        # Merge like a log-structured store: only when the newer runs add up to the oldest one
+        while len(self._runs) > 1 and sum(len(k) for k, _ in self._runs[1:]) >= len(self._runs[0][0]):
+            self._runs = [self._merge(self._runs)]
+
+    def _merge(self, runs):
+        np = self._np
+        keys = np.concatenate([k for k, _ in runs])
+        counts = np.concatenate([c for _, c in runs])
+        order = np.argsort(keys, kind="stable")
+        keys, counts = keys[order], counts[order]
+        del order
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+        return keys[starts], np.add.reduceat(counts, starts).astype(np.uint32)
+
+    @timed_span("cooccurrence.build")
+    def build(self):
+        """Returns the CooccurrenceGraph of every file added so far."""
+        graph = CooccurrenceGraph(self.vocabulary)
+        np = self._np
+        if np is not None:
+            self._flush()
+            if not self._runs:
+                return graph
+            keys, counts = self._runs[0] if len(self._runs) == 1 else self._merge(self._runs)
+            self._runs = []
+            size = np.uint64(self.size)
+            indptr = np.searchsorted(keys, np.arange(self.size + 1, dtype=np.uint64) * size).astype(np.uint64)
+            running = np.cumsum(counts, dtype=np.uint64)
+            row_starts = np.concatenate((np.zeros(1, dtype=np.uint64), running))[indptr[:-1].astype(np.int64)]
+            cumulative = running - np.repeat(row_starts, np.diff(indptr).astype(np.int64))
+            del running
+            typecode = "I" if cumulative.size == 0 or cumulative.max() < 2 ** 32 else "Q"
+            graph.indptr = array("Q", indptr.tobytes())
+            graph.indices = array("I", (keys % size).astype(np.uint32).tobytes())
+            graph.cumulative = array(typecode, cumulative.astype(np.uint32 if typecode == "I" else np.uint64).tobytes())
+            return graph
+
+        indptr = array("Q", [0] * (self.size + 1))
+        indices = array("I")
+        cumulative = array("Q")
+        row, running = 0, 0
+        for key in sorted(self._pairs):
+            a, b = divmod(key, self.size)
+            while row < a:
+                row += 1
+                indptr[row] = len(indices)
+                running = 0
+            running += self._pairs[key]
+            indices.append(b)
+            cumulative.append(running)
+        for r in range(row + 1, self.size + 1):
+            indptr[r] = len(indices)
+        graph.indptr, graph.indices, graph.cumulative = indptr, indices, cumulative
+        return graph
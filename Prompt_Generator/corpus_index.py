@@ -0,0 +1,212 @@
+# corpus_index.py
+import os
+import json
+import hashlib
+import logging
+import tempfile
+from archive_utils import is_archive, open_archive
+from tokenizer_utils import DEFAULT_TOKENIZER
+from vocabulary import Vocabulary
+from cooccurrence import CooccurrenceBuilder, CooccurrenceGraph
+from debug_utils import timed_span
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 2
+USE_MMAP = os.name != "nt"  # Windows can't replace a file that is still mapped, which breaks re-saving
+
+
+def get_cache_dir(*parts):
+    """Returns (and creates) the per-user cache directory for the app, optionally a subdirectory of it."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache")
+    path = os.path.join(base, "random_prompt_generator", *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def iter_folder(folder_path, recursive=False):
+    """
+    Yields (name relative to folder_path, os.DirEntry) for every file in a folder,
+    with one os.scandir pass per directory. With recursive, subfolders are
+    included too (hidden ones and symlinked ones are skipped).
+    """
+    pending = [("", folder_path)]
+    while pending:
+        prefix, path = pending.pop()
+        subfolders = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if recursive and entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith("."):
+                        subfolders.append((prefix + entry.name + os.sep, entry.path))
+                elif entry.is_file():
+                    yield prefix + entry.name, entry
+        pending.extend(reversed(subfolders))  # Depth first, in directory order
+
+
+@timed_span("folder.scan")
+def scan_folder(folder_path, extensions=(".txt",), recursive=False):
+    """
+    Stats every matching file in a folder (and with recursive, its subfolders).
+    Returns a dict of filename -> (size, mtime_ns), in directory order; files in
+    subfolders are named by their relative path.
+    An archive is listed from its member table instead (names may contain '/').
+    """
+    if is_archive(folder_path):
+        return open_archive(folder_path).scan(extensions)
+    stats = {}
+    for name, entry in iter_folder(folder_path, recursive):
+        if name.endswith(extensions):
+            st = entry.stat()
+            stats[name] = (st.st_size, st.st_mtime_ns)
+    return stats
+
+
+class CorpusIndex:
+    """
+    On-disk index of a caption folder: per-file (size, mtime) and word counts,
+    plus the aggregated word-frequency table. Lets a reopen re-read only the
+    files that were added, changed or deleted since the index was saved.
+    Each tokenizer gets its own index, and so does a recursive scan of the
+    folder (subfolders included). The aggregated table is a Vocabulary
+    saved next to the JSON and memory-mapped back in where the OS allows it;
+    so is the co-occurrence graph, which is built on demand.
+    """
+
+    def __init__(self, folder_path, tokenizer=DEFAULT_TOKENIZER, index_path=None, use_mmap=USE_MMAP, recursive=False):
+        self.folder_path = os.path.abspath(folder_path)
+        self.tokenizer = tokenizer
+        self.recursive = recursive  # Whether the indexed files include subfolders (see scan_folder)
+        if index_path is None:
+            scope = "\0recursive" if recursive else ""
+            key = hashlib.sha1(f"{self.folder_path}\0{tokenizer}{scope}".encode("utf-8")).hexdigest()
+            index_path = os.path.join(get_cache_dir("index"), f"{key}.json")
+        self.index_path = index_path
+        self.vocab_path = os.path.splitext(index_path)[0] + ".vocab"
+        self.graph_path = os.path.splitext(index_path)[0] + ".cooc"
+        self.use_mmap = use_mmap
+        self.entries = {}  # filename -> [size, mtime_ns, {word: count}]
+        self.all_words = Vocabulary()
+        self.stamp = None  # vocab_stamp() of the file all_words was loaded from, if any
+        self.dirty = False
+
+    def load(self):
+        """Loads the saved index. A missing, corrupt or mismatched index just starts empty."""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return False
+        if (data.get("version") != INDEX_VERSION or data.get("folder") != self.folder_path
+                or data.get("tokenizer") != self.tokenizer):
+            return False
+        entries = data.get("entries", {})
+        try:
+            stamp = self.vocab_stamp()
+            if data.get("vocab_stamp") != stamp:
+                raise ValueError("Vocabulary doesn't belong to this index")  # e.g. a crash between the two writes
+            self.all_words = Vocabulary.load(self.vocab_path, use_mmap=self.use_mmap)
+            self.stamp = stamp
+        except (OSError, ValueError):
+            # Table missing or damaged: rebuild it from the per-file counts
+            self.all_words = Vocabulary()
+            for entry in entries.values():
+                for word, count in entry[2].items():
+                    self.all_words.add(word, count)
+            self.dirty = True
+        self.entries = entries
+        return True
+
+    def vocab_stamp(self):
+        """(size, mtime_ns) of the saved vocabulary file, which ties the JSON and the graph to it."""
+        st = os.stat(self.vocab_path)
+        return [st.st_size, st.st_mtime_ns]
+
+    def save(self):
+        """
+        Writes the index atomically (temp file + rename) so a crash never leaves half an index.
+        Afterwards all_words is the saved, fully frozen table, so its word IDs match the file.
+        """
+        self.all_words.save(self.vocab_path)
+        self.stamp = self.vocab_stamp()
+        self.all_words = Vocabulary.load(self.vocab_path, use_mmap=self.use_mmap)
+        data = {
+            "version": INDEX_VERSION,
+            "folder": self.folder_path,
+            "tokenizer": self.tokenizer,
+            "vocab_stamp": self.stamp,
+            "entries": self.entries,
+        }
+        # A unique temp name: the loader, the watcher's rescan and the graph build can all save at once
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.index_path),
+                                        prefix=os.path.basename(self.index_path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.index_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self.dirty = False
+
+    def diff(self, stats):
+        """
+        Compares a scan_folder() result against the index.
+        Returns (changed, removed): files that are new or whose size/mtime differ,
+        and indexed files that no longer exist.
+        """
+        changed = []
+        for name, (size, mtime) in stats.items():
+            entry = self.entries.get(name)
+            if entry is None or entry[0] != size or entry[1] != mtime:
+                changed.append(name)
+        removed = [name for name in self.entries if name not in stats]
+        return changed, removed
+
+    def counts_for(self, filename):
+        """Returns the indexed word counts of a file ({} if it isn't indexed)."""
+        entry = self.entries.get(filename)
+        return entry[2] if entry else {}
+
+    def update(self, filename, size, mtime, counts):
+        """Replaces a file's entry, keeping the aggregated table in sync."""
+        self.remove(filename)
+        self.entries[filename] = [size, mtime, counts]
+        for word, count in counts.items():
+            self.all_words.add(word, count)
+        self.dirty = True
+
+    def remove(self, filename):
+        """Drops a file's entry and subtracts its counts from the aggregated table."""
+        entry = self.entries.pop(filename, None)
+        if entry is None:
+            return
+        for word, count in entry[2].items():
+            self.all_words.add(word, -count)
+        self.dirty = True
+
+    def cooccurrence_graph(self):
+        """
+        Returns the folder's CooccurrenceGraph: the saved one if it was built from
+        the current vocabulary file, otherwise rebuilt from the per-file counts
+        and saved. Saves the index first if it has unsaved changes.
+        """
+        if self.dirty or self.stamp is None:
+            self.save()
+        stamp = self.stamp  # Of the table the graph's IDs come from, even if the file was replaced since
+        try:
+            return CooccurrenceGraph.load(self.graph_path, self.all_words, stamp, use_mmap=self.use_mmap)
+        except (OSError, ValueError):
+            pass
+        builder = CooccurrenceBuilder(self.all_words)
+        for entry in self.entries.values():
+            builder.add_file(entry[2])
+        graph = builder.build()
+        try:
+            graph.save(self.graph_path, stamp)
+        except OSError as e:
+            logger.warning("Could not save co-occurrence graph: %s", e)
+        return graph
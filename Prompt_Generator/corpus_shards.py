@@ -0,0 +1,236 @@
+# corpus_shards.py
+import random
+from bisect import bisect_right
+from sampler import WeightedSampler
+from vocabulary import Vocabulary
+from import_utils import optional_import
+from debug_utils import timed_span
+
+NO_FILTER = ((), ())  # Tag query (include, exclude) that matches everything
+
+
+def has_filter(query):
+    return bool(query[0] or query[1])
+
+
+def pick_weighted(items, weights, rng=random):
+    """Picks one item in proportion to its weight. A single item is returned without drawing, so rng stays untouched."""
+    if len(items) == 1:
+        return items[0]
+    cumulative = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    return items[min(bisect_right(cumulative, rng.random() * total), len(items) - 1)]
+
+
+class Shard:
+    """
+    One folder (or archive) of a multi-folder corpus. Each shard has its own
+    cached CorpusIndex, word table, samplers, tag index and co-occurrence graph,
+    so adding or removing a folder never touches the others.
+    `weight` is the shard's share of the draws, whatever its size: two shards
+    of weight 1 each supply half of the random picks and shuffled words.
+    """
+
+    def __init__(self, folder_path, weight=1.0, recursive=False):
+        self.folder_path = folder_path
+        self.weight = weight
+        self.recursive = recursive  # Include subfolders (each recursive folder has its own index)
+        self.text_files = []
+        self.image_files = []
+        self.all_words = Vocabulary()
+        self.word_sampler = None  # Built lazily from all_words, dropped whenever it changes
+        self.tag_index = None  # TagIndex, once the load has finished
+        self.cooccurrence = None  # CooccurrenceGraph, built on demand
+        self.filtered_words = None  # (cache key, word counts, sampler) of the files matching a tag filter
+        self.loaded = False
+        # Background workers, owned by the UI
+        self.load_thread = None
+        self.graph_thread = None
+        self.watcher = None
+        self.progress = (0, 0)  # Files done, files total of the running load
+
+    def set_words(self, all_words):
+        self.all_words = all_words
+        self.word_sampler = None
+
+    def add_word_counts(self, word_counts, sign=1):
+        """Adds (or with sign=-1, subtracts) a file's word counts to all_words."""
+        for word, count in word_counts.items():
+            self.all_words.add(word, sign * count)
+        self.word_sampler = None
+
+    def get_word_sampler(self):
+        """Returns the weighted sampler for all_words, rebuilding it only if the words changed."""
+        if self.word_sampler is None:
+            self.word_sampler = WeightedSampler(self.all_words)
+        return self.word_sampler
+
+    def get_shuffle_sampler(self, query=NO_FILTER):
+        """
+        Returns (sampler, allowed words) for shuffling: all words, or with a tag
+        filter only the words of matching files. allowed is None when unfiltered.
+        """
+        if not has_filter(query) or self.tag_index is None:
+            return self.get_word_sampler(), None
+        key = (query, self.tag_index.version)
+        if self.filtered_words is None or self.filtered_words[0] != key:
+            word_counts = self.tag_index.word_counts(*query)
+            self.filtered_words = (key, word_counts, WeightedSampler(word_counts))
+        return self.filtered_words[2], self.filtered_words[1]
+
+    def match_count(self, query=NO_FILTER):
+        """How many text files pass the tag filter; None while the tag index isn't ready."""
+        if not has_filter(query):
+            return len(self.text_files)
+        return self.tag_index.count(*query) if self.tag_index is not None else None
+
+    def pick_random_file(self, query=NO_FILTER, rng=random):
+        """Returns a random text file that passes the tag filter, or None if none does."""
+        if has_filter(query) and self.tag_index is not None:
+            return self.tag_index.random_file(*query, rng=rng)
+        return rng.choice(self.text_files) if self.text_files else None
+
+
+class MixtureSampler:
+    """
+    Draws words from several WeightedSamplers without merging their tables:
+    every draw first picks a sampler in proportion to its weight, then a word
+    from that sampler. Same interface as WeightedSampler (len, sample,
+    sample_batch), so callers don't care whether a corpus has one shard or many.
+    """
+
+    def __init__(self, samplers, weights):
+        pairs = [(sampler, weight) for sampler, weight in zip(samplers, weights) if weight > 0 and len(sampler)]
+        self.samplers = [sampler for sampler, _ in pairs]
+        self.weights = [weight for _, weight in pairs]
+        self.cumulative = []
+        total = 0.0
+        for weight in self.weights:
+            total += weight
+            self.cumulative.append(total)
+        self.size = sum(len(sampler) for sampler in self.samplers)
+
+    def __len__(self):
+        return self.size
+
+    def _pick(self, rng):
+        return min(bisect_right(self.cumulative, rng.random() * self.cumulative[-1]), len(self.samplers) - 1)
+
+    @timed_span("mixture.sample")
+    def sample(self, k, rng=random):
+        """Returns k words, each from a sampler picked by weight."""
+        if not self.samplers:
+            return []
+        if len(self.samplers) == 1:
+            return self.samplers[0].sample(k, rng)
+        picks = [self._pick(rng) for _ in range(k)]
+        drawn = [iter(sampler.sample(picks.count(i), rng)) for i, sampler in enumerate(self.samplers)]
+        return [next(drawn[i]) for i in picks]
+
+    @timed_span("mixture.sample_batch")
+    def sample_batch(self, count, k, seed=None):
+        """
+        Returns `count` lists of k words each. With NumPy, the sampler behind
+        every slot is chosen in one vectorized call and each sampler then fills
+        all of its slots with one sample_batch() call.
+        """
+        if len(self.samplers) == 1:
+            return self.samplers[0].sample_batch(count, k, seed)
+        np = optional_import("numpy")  # Optional: vectorizes the per-slot sampler choice
+        if np is None or not self.samplers:
+            rng = random.Random(seed)
+            return [self.sample(k, rng) for _ in range(count)]
+        rng = np.random.default_rng(seed)
+        cumulative = np.array(self.cumulative)
+        choice = np.minimum(np.searchsorted(cumulative, rng.random((count, k)) * cumulative[-1], side="right"),
+                            len(self.samplers) - 1)
+        words = np.empty((count, k), dtype=object)
+        for i, sampler in enumerate(self.samplers):
+            mask = choice == i
+            n = int(mask.sum())
+            if n:
+                words[mask] = sampler.sample_batch(1, n, seed=int(rng.integers(2 ** 63)))[0]
+        return words.tolist()
+
+
+class ShardedCorpus:
+    """
+    The folders currently loaded, each a Shard. Generation samples across the
+    shards by weight: random picks choose a shard, then a file in it; shuffles
+    draw every word through a MixtureSampler of the shards' samplers; coherent
+    shuffles pick a shard per prompt so its words come from one co-occurrence graph.
+    """
+
+    def __init__(self, shards=()):
+        self.shards = list(shards)
+        self._mixture = None  # (query, component samplers, weights, MixtureSampler)
+
+    def __len__(self):
+        return len(self.shards)
+
+    def __iter__(self):
+        return iter(self.shards)
+
+    def add(self, shard):
+        self.shards.append(shard)
+
+    def remove(self, shard):
+        self.shards.remove(shard)
+        self._mixture = None
+
+    def shard_for(self, folder_path):
+        for shard in self.shards:
+            if shard.folder_path == folder_path:
+                return shard
+        return None
+
+    def has_words(self):
+        return any(shard.weight > 0 and shard.all_words for shard in self.shards)
+
+    def match_count(self, query=NO_FILTER):
+        """Text files passing the tag filter across all shards; None while a tag index is still being built."""
+        total = 0
+        for shard in self.shards:
+            count = shard.match_count(query)
+            if count is None:
+                return None
+            total += count
+        return total
+
+    def pick_random_file(self, query=NO_FILTER, rng=random):
+        """Picks a shard by weight (among those with matching files), then a random matching file in it."""
+        candidates = [shard for shard in self.shards if shard.weight > 0 and shard.match_count(query) != 0]
+        if not candidates:
+            return None
+        shard = pick_weighted(candidates, [shard.weight for shard in candidates], rng)
+        return shard.pick_random_file(query, rng)
+
+    def shuffle_sampler(self, query=NO_FILTER):
+        """Returns a sampler over every shard's (tag-filtered) words, mixed by shard weight."""
+        shards = [shard for shard in self.shards if shard.weight > 0]
+        samplers = tuple(shard.get_shuffle_sampler(query)[0] for shard in shards)
+        weights = tuple(shard.weight for shard in shards)
+        if len(samplers) == 1:
+            return samplers[0]
+        cached = self._mixture
+        if (cached is None or cached[0] != query or cached[2] != weights or len(cached[1]) != len(samplers)
+                or any(a is not b for a, b in zip(cached[1], samplers))):
+            cached = self._mixture = (query, samplers, weights, MixtureSampler(samplers, weights))
+        return cached[3]
+
+    def coherent_sample(self, k, query=NO_FILTER, rng=random):
+        """
+        Up to k related words from one shard's co-occurrence graph, the shard picked by weight.
+        Returns None if no shard has its graph yet.
+        """
+        candidates = [shard for shard in self.shards
+                      if shard.weight > 0 and shard.cooccurrence is not None and shard.all_words
+                      and shard.match_count(query) != 0]
+        if not candidates:
+            return None
+        shard = pick_weighted(candidates, [shard.weight for shard in candidates], rng)
+        sampler, allowed = shard.get_shuffle_sampler(query)
+        return shard.cooccurrence.sample(k, sampler, rng, allowed)
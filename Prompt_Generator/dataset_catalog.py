@@ -0,0 +1,125 @@
+# dataset_catalog.py
+import os
+from file_utils import IMAGE_EXTENSIONS
+
+
+def file_stem(filepath):
+    """The pairing key of a file: its path without the extension."""
+    return os.path.splitext(filepath)[0]
+
+
+def image_priority(image_path):
+    """
+    Sort key deciding which image wins when several share a stem:
+    the earliest extension in IMAGE_EXTENSIONS, then the path alphabetically.
+    """
+    ext = os.path.splitext(image_path)[1].lower()
+    rank = IMAGE_EXTENSIONS.index(ext) if ext in IMAGE_EXTENSIONS else len(IMAGE_EXTENSIONS)
+    return rank, image_path
+
+
+class CatalogEntry:
+    __slots__ = ("stem", "caption", "images", "row")
+
+    def __init__(self, stem):
+        self.stem = stem
+        self.caption = None  # Caption (.txt) path
+        self.images = []  # Image paths, best first (see image_priority)
+        self.row = None  # Row of the caption in the file list
+
+    @property
+    def image(self):
+        return self.images[0] if self.images else None
+
+
+class DatasetCatalog:
+    """
+    Pairs captions with images by stem. Every lookup (image for a caption,
+    list row for a caption, orphan checks) is a dict/set operation, so nothing
+    scans the file lists per click.
+    """
+
+    def __init__(self):
+        self._entries = {}  # stem -> CatalogEntry
+        self._captionless = set()  # stems with images but no caption
+        self._imageless = set()  # stems with a caption but no image
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _entry(self, stem):
+        entry = self._entries.get(stem)
+        if entry is None:
+            entry = self._entries[stem] = CatalogEntry(stem)
+        return entry
+
+    def _update_orphans(self, entry):
+        stem = entry.stem
+        self._captionless.discard(stem)
+        self._imageless.discard(stem)
+        if entry.caption is None and not entry.images:
+            del self._entries[stem]
+        elif entry.caption is None:
+            self._captionless.add(stem)
+        elif not entry.images:
+            self._imageless.add(stem)
+
+    def add_captions(self, text_files, first_row):
+        """Adds caption paths shown in the file list from row first_row onwards."""
+        for row, text_file in enumerate(text_files, first_row):
+            entry = self._entry(file_stem(text_file))
+            entry.caption = text_file
+            entry.row = row
+            self._update_orphans(entry)
+
+    def add_images(self, image_files):
+        for image_file in image_files:
+            entry = self._entry(file_stem(image_file))
+            if image_file not in entry.images:
+                entry.images.append(image_file)
+                entry.images.sort(key=image_priority)
+            self._update_orphans(entry)
+
+    def remove_caption(self, text_file):
+        entry = self._entries.get(file_stem(text_file))
+        if entry is not None and entry.caption == text_file:
+            entry.caption = None
+            entry.row = None
+            self._update_orphans(entry)
+
+    def remove_image(self, image_file):
+        entry = self._entries.get(file_stem(image_file))
+        if entry is not None and image_file in entry.images:
+            entry.images.remove(image_file)
+            self._update_orphans(entry)
+
+    def entry_for(self, filepath):
+        """Returns the CatalogEntry a caption or image belongs to, or None."""
+        return self._entries.get(file_stem(filepath))
+
+    def image_for(self, text_file):
+        """Returns the image paired with a caption (best one if several), or None."""
+        entry = self._entries.get(file_stem(text_file))
+        return entry.image if entry else None
+
+    def row_for(self, text_file):
+        """Returns the file list row of a caption, or None."""
+        entry = self._entries.get(file_stem(text_file))
+        return entry.row if entry and entry.caption == text_file else None
+
+    def has_image(self, text_file):
+        return self.image_for(text_file) is not None
+
+    def has_caption(self, image_file):
+        entry = self._entries.get(file_stem(image_file))
+        return entry is not None and entry.caption is not None
+
+    def captions_without_images(self):
+        return [self._entries[stem].caption for stem in self._imageless]
+
+    def images_without_captions(self):
+        return [image for stem in self._captionless for image in self._entries[stem].images]
+
+    def orphan_counts(self):
+        """Returns (captions without images, stems with images but no caption)."""
+        return len(self._imageless), len(self._captionless)
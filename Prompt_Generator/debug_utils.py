@@ -1,12 +1,196 @@
 # debug_utils.py
+import logging
+import os
+import threading
+import time
+from functools import wraps
 
-# Example:  Print variable values with a label
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+# Example:  Log variable values with a label
 def print_debug(label, value):
-    """Prints a debug message with a label and the value."""
-    print(f"DEBUG: {label}: {value}")
+    """Logs a debug message with a label and the value."""
+    logger.debug("%s: %r", label, value)
 
 # Example:  Conditional breakpoint (useful for interactive debugging)
 def conditional_breakpoint(condition):
     """Sets a breakpoint if the condition is True."""
     if condition:
-        breakpoint()  # Requires Python 3.7+
\ No newline at end of file
+        breakpoint()  # Requires Python 3.7+
+
+
+def setup_logging(level="INFO"):
+    """Sends log records of `level` and up (a name like "DEBUG", or a number) to stderr."""
+    logging.basicConfig(level=level.upper() if isinstance(level, str) else level, format=LOG_FORMAT)
+
+# --- Startup timing ---
+STARTUP_TIME = time.perf_counter()  # main.py imports this module first, so this is (about) when the app started
+startup_marks = {}  # Milestone -> seconds after startup
+
+
+def mark_startup(label):
+    """Records and logs the first time a startup milestone (e.g. "first paint") is reached."""
+    if label not in startup_marks:
+        startup_marks[label] = time.perf_counter() - STARTUP_TIME
+        logger.info("Startup: %s after %.3fs", label, startup_marks[label])
+
+# --- Hot path instrumentation ---
+# Always on: a span costs two perf_counter() calls and a locked dict update, around a microsecond.
+# Numbers are per process, so work done in ingestion worker processes isn't included.
+_stats_lock = threading.Lock()
+_spans = {}  # Span name -> [calls, total seconds, max seconds]
+_counters = {}  # Counter name -> count
+
+
+def record_span(name, seconds):
+    with _stats_lock:
+        span = _spans.get(name)
+        if span is None:
+            _spans[name] = [1, seconds, seconds]
+        else:
+            span[0] += 1
+            span[1] += seconds
+            if seconds > span[2]:
+                span[2] = seconds
+
+
+def count(name, n=1):
+    """Adds n to a named counter (e.g. "thumbnail.miss")."""
+    with _stats_lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+class timed_span:
+    """
+    Times a block of code under a name:
+        with timed_span("folder.scan"):
+            ...
+    or, used as a decorator (@timed_span("sampler.sample")), every call of a function.
+    """
+    __slots__ = ("name", "_start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_span(self.name, time.perf_counter() - self._start)
+
+    def __call__(self, func):
+        name = self.name
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_span(name, time.perf_counter() - start)
+        return wrapper
+
+
+def stats_snapshot():
+    """Returns the spans ({name: calls, total_ms, mean_ms, max_ms}) and counters recorded so far."""
+    with _stats_lock:
+        spans = {name: {"calls": calls, "total_ms": 1000 * total, "mean_ms": 1000 * total / calls, "max_ms": 1000 * peak}
+                 for name, (calls, total, peak) in _spans.items()}
+        return {"spans": spans, "counters": dict(_counters)}
+
+
+def reset_stats():
+    with _stats_lock:
+        _spans.clear()
+        _counters.clear()
+
+
+def format_stats(snapshot=None):
+    """The stats as a table, slowest spans (by total time) first."""
+    snapshot = snapshot or stats_snapshot()
+    lines = [f"{'span':28} {'calls':>8} {'total ms':>11} {'mean ms':>9} {'max ms':>9}"]
+    for name, span in sorted(snapshot["spans"].items(), key=lambda item: -item[1]["total_ms"]):
+        lines.append(f"{name:28} {span['calls']:8d} {span['total_ms']:11.1f} {span['mean_ms']:9.3f} {span['max_ms']:9.2f}")
+    for name, value in sorted(snapshot["counters"].items()):
+        lines.append(f"{name:28} {value:8d}")
+    return "\n".join(lines)
+
+
+def log_stats():
+    logger.info("Stats:\n%s", format_stats())
+
+
+def start_stats_dump(interval):
+    """Logs the stats every `interval` seconds from a daemon thread. Returns an Event that stops it when set."""
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            log_stats()
+
+    threading.Thread(target=run, name="stats-dump", daemon=True).start()
+    return stop
+
+
+class Profiler:
+    """
+    Optional cProfile (CPU) and tracemalloc (memory) profiling that can be
+    switched on and off while the app runs. cProfile only sees the thread
+    that started it (the GUI thread); tracemalloc sees every thread.
+    stop() logs the top entries and saves the CPU profile for pstats/snakeviz.
+    """
+
+    def __init__(self, cpu=True, memory=False, output_dir=None):
+        self.cpu = cpu
+        self.memory = memory
+        self.output_dir = output_dir or os.getcwd()
+        self._profile = None
+        self.running = False
+
+    def start(self):
+        if self.running:
+            return
+        if self.cpu:
+            import cProfile  # Deferred: only needed when profiling
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        if self.memory:
+            import tracemalloc
+            tracemalloc.start(10)
+        self.running = True
+        logger.info("Profiling started (cpu=%s, memory=%s).", self.cpu, self.memory)
+
+    def stop(self, top=20):
+        """Stops profiling and logs the results. Returns the saved .prof path, if any."""
+        if not self.running:
+            return None
+        self.running = False
+        path = None
+        if self._profile is not None:
+            import io
+            import pstats
+            self._profile.disable()
+            path = os.path.join(self.output_dir, time.strftime("prompt_generator_%Y%m%d_%H%M%S.prof"))
+            self._profile.dump_stats(path)
+            report = io.StringIO()
+            pstats.Stats(self._profile, stream=report).sort_stats("cumulative").print_stats(top)
+            logger.info("CPU profile (saved to %s):\n%s", path, report.getvalue())
+            self._profile = None
+        if self.memory:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            sites = "\n".join(str(stat) for stat in snapshot.statistics("lineno")[:top])
+            logger.info("Memory: %.1f MB traced, %.1f MB peak. Top allocation sites:\n%s",
+                        current / 2 ** 20, peak / 2 ** 20, sites)
+        return path
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
@@ -1,5 +1,6 @@
 # error_utils.py
 from PyQt6.QtWidgets import QMessageBox
+from archive_utils import stat_path
 
 def show_error_message(parent, message):
     """Displays an error message using a QMessageBox."""
@@ -23,7 +24,7 @@ def check_file_size(file_path, max_size_mb, error_callback):
     Returns True if the file is OK, False if it's too large.
     """
     try:
-        file_size_mb = os.path.getsize(file_path) / (1024 * 1024)  # Size in MB
+        file_size_mb = stat_path(file_path)[0] / (1024 * 1024)  # Size in MB (works for archive members too)
         if file_size_mb > max_size_mb:
             error_callback(f"Image file too large ({file_size_mb:.2f} MB).  Please use an image smaller than {max_size_mb}MB.")
             return False  # Indicate file is too large
@@ -31,4 +32,3 @@ def check_file_size(file_path, max_size_mb, error_callback):
     except OSError as e:
         error_callback(f"Error checking file size: {e}")
         return False
-import os #Needed for filechecks
\ No newline at end of file
@@ -0,0 +1,125 @@
+# file_list_model.py
+import os
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex
+
+FETCH_BATCH = 1000  # Rows handed to the view per fetchMore()
+
+
+class FileListModel(QAbstractListModel):
+    """
+    Lazily populated list model over the loaded text file paths.
+    The model shares the caller's list instead of creating an item per file,
+    exposes rows to the view in FETCH_BATCH steps (canFetchMore/fetchMore),
+    and filters by case-insensitive substring of the file name.
+    Row numbers are view rows; "source index" means the position in the file list.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._files = []
+        self._known = 0  # Files of the shared list picked up so far (the caller may have appended more)
+        self._filter = ""
+        self._matches = None  # Source indices matching the filter, or None when unfiltered
+        self._view_rows = None  # Source index -> view row for the current filter, built on demand
+        self._loaded = 0  # Rows exposed to the view so far
+
+    # --- Qt model interface ---
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._loaded
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= self._loaded:
+            return None
+        filepath = self._files[self.source_index(index.row())]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return os.path.basename(filepath)
+        if role in (Qt.ItemDataRole.UserRole, Qt.ItemDataRole.ToolTipRole):
+            return filepath
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._loaded < self.match_count()
+
+    def fetchMore(self, parent=QModelIndex()):
+        self._fetch_to(self._loaded + FETCH_BATCH)
+
+    # --- Files ---
+    def set_files(self, files):
+        """Shows `files` (kept by reference: the caller appends to it and then calls files_appended)."""
+        self.beginResetModel()
+        self._files = files
+        self._known = len(files)
+        self._matches = self._match(range(len(files)), self._filter) if self._filter else None
+        self._view_rows = None
+        self._loaded = min(FETCH_BATCH, self.match_count())
+        self.endResetModel()
+
+    def files_appended(self, first_index):
+        """Picks up files the caller appended to the shared list from first_index on."""
+        new_indices = range(first_index, len(self._files))
+        self._known = len(self._files)
+        if self._filter:
+            new_matches = self._match(new_indices, self._filter)
+            if self._view_rows is not None:
+                self._view_rows.update((source, len(self._matches) + i) for i, source in enumerate(new_matches))
+            self._matches.extend(new_matches)
+        if self._loaded < FETCH_BATCH:  # The view may not be full yet, so it won't ask for more itself
+            self._fetch_to(FETCH_BATCH)
+
+    def match_count(self):
+        return len(self._files) if self._matches is None else len(self._matches)
+
+    def source_index(self, row):
+        return row if self._matches is None else self._matches[row]
+
+    def file_at(self, row):
+        return self._files[self.source_index(row)]
+
+    def view_row(self, source_index):
+        """
+        Returns the view row showing a source file (fetching up to it if needed),
+        or None if the filter hides it.
+        """
+        if self._matches is None:
+            row = source_index if 0 <= source_index < len(self._files) else None
+        else:
+            if self._view_rows is None:
+                self._view_rows = {source: row for row, source in enumerate(self._matches)}
+            row = self._view_rows.get(source_index)
+        if row is not None and row >= self._loaded:
+            self._fetch_to(row + 1)
+        return row
+
+    def _fetch_to(self, count):
+        count = min(count, self.match_count())
+        if count <= self._loaded:
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded, count - 1)
+        self._loaded = count
+        self.endInsertRows()
+
+    # --- Filtering ---
+    def set_filter(self, text):
+        """
+        Filters by case-insensitive substring of the file name. Typing more
+        characters only re-checks the current matches, not the whole list.
+        """
+        text = text.strip().lower()
+        if text == self._filter:
+            return
+        self.beginResetModel()
+        if not text:
+            self._matches = None
+        elif self._filter and text.startswith(self._filter) and self._matches is not None:
+            self._matches = self._match(self._matches, text)
+        else:
+            self._matches = self._match(range(self._known), text)
+        self._filter = text
+        self._view_rows = None
+        self._loaded = min(FETCH_BATCH, self.match_count())
+        self.endResetModel()
+
+    def _match(self, indices, text):
+        # Names are lowercased as they are checked rather than kept in a second list next to the files
+        files, basename = self._files, os.path.basename
+        return [i for i in indices if text in basename(files[i]).lower()]
@@ -1,6 +1,16 @@
 # file_utils.py
 import os
 import json
+import logging
+from archive_utils import is_archive, read_text
+from corpus_index import CorpusIndex, iter_folder, scan_folder
+from tokenizer_utils import DEFAULT_TOKENIZER, get_tokenizer
+from vocabulary import Vocabulary
+from debug_utils import count, timed_span
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
 
 def load_prefixes(prefixes_file, error_callback):
     """Loads prefixes from a JSON file, handling errors."""
@@ -22,30 +32,71 @@ def load_prefixes(prefixes_file, error_callback):
         return {}
 
 
-def load_files(folder_path, error_callback):
-    """Loads text files and counts words, handling errors."""
+def count_tokens(text, tokenizer=DEFAULT_TOKENIZER):
+    """Returns the token counts of a caption, using the named tokenizer (see tokenizer_utils)."""
+    counts = {}
+    for word in get_tokenizer(tokenizer)(text):
+        counts[word] = counts.get(word, 0) + 1
+    return counts
+
+
+def count_words(filepath, tokenizer=DEFAULT_TOKENIZER):
+    """Reads one text file (or archive member) and returns its token counts."""
+    return count_tokens(read_text(filepath), tokenizer)
+
+
+@timed_span("tokenize.batch")
+def count_words_batch(folder_path, filenames, tokenizer=DEFAULT_TOKENIZER):
+    """Counts words for a batch of files in one folder. Runs in pool workers, so it only returns plain data."""
+    count("tokenize.files", len(filenames))
+    results = []
+    for filename in filenames:
+        try:
+            counts = count_words(os.path.join(folder_path, filename), tokenizer)
+        except OSError:
+            counts = None  # Vanished or unreadable; the caller drops it
+        results.append((filename, counts))
+    return results
+
+
+def load_files(folder_path, error_callback, tokenizer=DEFAULT_TOKENIZER, recursive=False):
+    """
+    Loads text files and counts words, handling errors.
+    Word counts come from the folder's CorpusIndex, so only files that were
+    added, changed or deleted since the last load are actually re-read.
+    all_words is a Vocabulary (a compact, dict-like word -> count table).
+    """
     text_files = []
-    all_words = {}
+    all_words = Vocabulary()
     try:
-        for filename in os.listdir(folder_path):
-            if filename.endswith(".txt"):
-                filepath = os.path.join(folder_path, filename)
-                text_files.append(filepath)
-                with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
-                    for line in f:
-                        words = line.strip().split()
-                        for word in words:
-                            all_words[word] = all_words.get(word, 0) + 1
+        stats = scan_folder(folder_path, recursive=recursive)
+        index = CorpusIndex(folder_path, tokenizer, recursive=recursive)
+        index.load()
+        changed, removed = index.diff(stats)
+        for filename in removed:
+            index.remove(filename)
+        for filename in changed:
+            size, mtime = stats[filename]
+            index.update(filename, size, mtime, count_words(os.path.join(folder_path, filename), tokenizer))
+        text_files = [os.path.join(folder_path, filename) for filename in stats]
+        all_words = index.all_words
     except OSError as e:
         error_callback(f"Error accessing files: {e}")
+        return text_files, all_words
+    if index.dirty:
+        try:
+            index.save()
+            all_words = index.all_words  # The saved, frozen copy
+        except OSError as e:
+            logger.warning("Could not save corpus index: %s", e)  # Not fatal, we just re-read next time
     return text_files, all_words
 
-def load_images(folder_path):
-    """Loads image files from a folder."""
+def load_images(folder_path, recursive=False):
+    """Loads image files from a folder (or archive), and with recursive from its subfolders too."""
+    if is_archive(folder_path):
+        return [os.path.join(folder_path, name) for name in scan_folder(folder_path, IMAGE_EXTENSIONS)]
     image_files = []
-    supported_extensions = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
-    for filename in os.listdir(folder_path):
-        if filename.lower().endswith(supported_extensions):
-            filepath = os.path.join(folder_path, filename)
-            image_files.append(filepath)
+    for filename, entry in iter_folder(folder_path, recursive):
+        if filename.lower().endswith(IMAGE_EXTENSIONS):
+            image_files.append(os.path.join(folder_path, filename))
     return image_files
\ No newline at end of file
@@ -0,0 +1,189 @@
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PyQt6.QtCore import QThread, pyqtSignal
+from archive_utils import is_archive, open_archive
+from corpus_index import CorpusIndex, scan_folder
+from file_utils import count_tokens, count_words_batch, load_images
+from tag_index import TagIndex
+from tokenizer_utils import DEFAULT_TOKENIZER
+from debug_utils import count, timed_span
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 256  # Files per pool task; big enough to amortize pickling, small enough for smooth progress
+MIN_PARALLEL_FILES = 2 * BATCH_SIZE  # Below this, starting worker processes costs more than it saves
+
+
+def new_ingest_pool(max_workers=None):
+    """
+    Starts a process pool for tokenizing captions. Workers are spawned rather
+    than forked: the pool is started from a QThread while other threads run,
+    and a forked child could inherit a lock (e.g. the debug_utils stats lock)
+    held by one of them and hang on it.
+    """
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+class FolderLoadThread(QThread):
+    """
+    Ingests a folder in the background. Files the CorpusIndex already knows are
+    emitted straight away; changed files are tokenized across a process pool and
+    streamed back to the UI batch by batch. cancel() stops it between batches.
+    When done, the saved (frozen, memory-mapped) vocabulary is handed over so
+    the UI can drop the word table it built up from the batches, followed by
+    the folder's TagIndex for tag-filtered picks.
+    With recursive, subfolders are ingested too (as their own cached index).
+    Several loads (one per folder of a multi-folder corpus) can share one
+    process pool by passing the same executor.
+    """
+    imagesLoaded = pyqtSignal(list)
+    batchLoaded = pyqtSignal(list, object)  # text file paths, their summed word counts (dict or Vocabulary)
+    progress = pyqtSignal(int, int)  # files done, files total
+    loadFinished = pyqtSignal(object)  # The folder's compact Vocabulary, or None if it couldn't be saved
+    tagIndexReady = pyqtSignal(object)  # TagIndex of the folder, built right after loadFinished
+    loadFailed = pyqtSignal(str)
+
+    def __init__(self, folder_path, tokenizer=DEFAULT_TOKENIZER, max_workers=None, recursive=False, executor=None):
+        super().__init__()
+        self.folder_path = folder_path
+        self.tokenizer = tokenizer
+        self.max_workers = max_workers
+        self.recursive = recursive
+        self.executor = executor  # Shared ProcessPoolExecutor, or None to start (and stop) one for this load
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    @timed_span("ingest.folder")
+    def run(self):
+        try:
+            self.imagesLoaded.emit(load_images(self.folder_path, self.recursive))
+            stats = scan_folder(self.folder_path, recursive=self.recursive)
+            index = CorpusIndex(self.folder_path, self.tokenizer, recursive=self.recursive)
+            index.load()
+        except OSError as e:
+            self.loadFailed.emit(f"Error accessing files: {e}")
+            return
+
+        changed, removed = index.diff(stats)
+        for filename in removed + changed:
+            index.remove(filename)  # Changed files get their counts back once re-read
+
+        # Everything still in the index is up to date: hand it over in one go.
+        # The copy shares the (immutable) word buffer, so this stays cheap for big vocabularies.
+        changed_set = set(changed)
+        unchanged = [os.path.join(self.folder_path, name) for name in stats if name not in changed_set]
+        total = len(stats)
+        if unchanged:
+            self.batchLoaded.emit(unchanged, index.all_words.copy())
+        self.progress.emit(len(unchanged), total)
+
+        vocabulary = index.all_words if not index.dirty else None  # Unchanged: already the saved table
+        try:
+            self._load_changed(index, stats, changed, len(unchanged), total)
+        finally:
+            if index.dirty:
+                try:
+                    index.save()  # Even when cancelled: finished files won't be re-read next time
+                    vocabulary = index.all_words
+                except (OSError, ValueError) as e:
+                    logger.warning("Could not save corpus index: %s", e)
+        if self._cancelled:
+            return
+        self.loadFinished.emit(vocabulary)
+        with timed_span("tags.build"):
+            tag_index = TagIndex.from_corpus_index(index, self.folder_path)
+        self.tagIndexReady.emit(tag_index)
+
+    def _load_changed(self, index, stats, changed, done, total):
+        if is_archive(self.folder_path) and not open_archive(self.folder_path).random_access:
+            self._load_changed_streaming(index, stats, changed, done, total)
+            return
+        batches = [changed[i:i + BATCH_SIZE] for i in range(0, len(changed), BATCH_SIZE)]
+        if len(changed) < MIN_PARALLEL_FILES:
+            for batch in batches:
+                if self._cancelled:
+                    return
+                done += self._apply_batch(index, stats, count_words_batch(self.folder_path, batch, self.tokenizer))
+                self.progress.emit(done, total)
+            return
+
+        executor = self.executor or new_ingest_pool(self.max_workers)
+        futures = []
+        try:
+            futures = [executor.submit(count_words_batch, self.folder_path, batch, self.tokenizer) for batch in batches]
+            for future in as_completed(futures):
+                if self._cancelled:
+                    return
+                done += self._apply_batch(index, stats, future.result())
+                self.progress.emit(done, total)
+        finally:
+            if executor is self.executor:
+                for future in futures:
+                    future.cancel()  # Only this load's batches; the pool keeps serving the others
+            else:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def _load_changed_streaming(self, index, stats, changed, done, total):
+        """Compressed tarballs: read the changed captions in one pass through the archive, in archive order."""
+        batch = []
+        for name, data in open_archive(self.folder_path).iter_read(changed):
+            if self._cancelled:
+                return
+            with timed_span("tokenize.file"):
+                batch.append((name, count_tokens(data.decode("utf-8", errors="ignore"), self.tokenizer)))
+            count("tokenize.files")
+            if len(batch) >= BATCH_SIZE:
+                done += self._apply_batch(index, stats, batch)
+                self.progress.emit(done, total)
+                batch = []
+        if batch:
+            done += self._apply_batch(index, stats, batch)
+            self.progress.emit(done, total)
+
+    @timed_span("ingest.apply_batch")
+    def _apply_batch(self, index, stats, results):
+        """Folds a worker result into the index and streams it to the UI. Returns how many files it covered."""
+        files = []
+        batch_words = {}
+        for filename, counts in results:
+            if counts is None:
+                continue
+            size, mtime = stats[filename]
+            index.update(filename, size, mtime, counts)
+            files.append(os.path.join(self.folder_path, filename))
+            for word, n in counts.items():
+                batch_words[word] = batch_words.get(word, 0) + n
+        if files:
+            self.batchLoaded.emit(files, batch_words)
+        return len(results)
+
+
+class GraphBuildThread(QThread):
+    """Loads a folder's co-occurrence graph in the background, building (and saving) it if needed."""
+    graphReady = pyqtSignal(object)  # CooccurrenceGraph
+
+    def __init__(self, folder_path, tokenizer=DEFAULT_TOKENIZER, recursive=False):
+        super().__init__()
+        self.folder_path = folder_path
+        self.tokenizer = tokenizer
+        self.recursive = recursive
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True  # Building can't stop halfway, but the result is dropped
+
+    def run(self):
+        index = CorpusIndex(self.folder_path, self.tokenizer, recursive=self.recursive)
+        index.load()
+        try:
+            graph = index.cooccurrence_graph()
+        except (OSError, ValueError) as e:
+            logger.warning("Could not build co-occurrence graph: %s", e)
+            return
+        logger.info("Co-occurrence graph ready: %d pairs.", len(graph))
+        if not self._cancelled:
+            self.graphReady.emit(graph)
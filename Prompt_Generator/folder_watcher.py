@@ -0,0 +1,212 @@
+# folder_watcher.py
+import os
+import logging
+from PyQt6.QtCore import QObject, QThread, QTimer, QFileSystemWatcher, pyqtSignal
+from corpus_index import CorpusIndex, scan_folder
+from file_utils import IMAGE_EXTENSIONS, count_words
+from tokenizer_utils import DEFAULT_TOKENIZER
+from debug_utils import timed_span
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE_MS = 750  # Quiet time after the last change before rescanning
+DEFAULT_POLL_SECONDS = 10  # In-place edits don't change the directory, so they are only found by polling
+
+
+class FolderDelta:
+    """What changed in a folder since the last scan. Caption entries carry word counts."""
+
+    def __init__(self):
+        self.added_texts = {}  # path -> word counts
+        self.removed_texts = {}  # path -> word counts it had
+        self.modified_texts = {}  # path -> (old word counts, new word counts)
+        self.added_images = []
+        self.removed_images = []
+        self.modified_images = []
+
+    def __bool__(self):
+        return any((self.added_texts, self.removed_texts, self.modified_texts,
+                    self.added_images, self.removed_images, self.modified_images))
+
+
+class _RescanThread(QThread):
+    """Runs one stat pass off the GUI thread and re-reads only the captions that changed."""
+    deltaReady = pyqtSignal(object)
+
+    def __init__(self, folder_path, index, image_stats):
+        super().__init__()
+        self.folder_path = folder_path
+        self.index = index
+        self.image_stats = image_stats
+
+    @timed_span("watch.rescan")
+    def run(self):
+        delta = FolderDelta()
+        try:
+            text_stats = scan_folder(self.folder_path, recursive=self.index.recursive)
+            image_stats = scan_folder(self.folder_path, IMAGE_EXTENSIONS, recursive=self.index.recursive)
+        except OSError as e:
+            logger.warning("Rescan failed: %s", e)
+            return
+
+        changed, removed = self.index.diff(text_stats)
+        for filename in removed:
+            delta.removed_texts[os.path.join(self.folder_path, filename)] = self.index.counts_for(filename)
+            self.index.remove(filename)
+        for filename in changed:
+            filepath = os.path.join(self.folder_path, filename)
+            try:
+                counts = count_words(filepath, self.index.tokenizer)
+            except OSError:
+                continue  # Gone again already; the next rescan sorts it out
+            old_counts = self.index.counts_for(filename) if filename in self.index.entries else None
+            size, mtime = text_stats[filename]
+            self.index.update(filename, size, mtime, counts)
+            if old_counts is None:
+                delta.added_texts[filepath] = counts
+            else:
+                delta.modified_texts[filepath] = (old_counts, counts)
+
+        for filename, stat in image_stats.items():
+            old_stat = self.image_stats.get(filename)
+            if old_stat is None:
+                delta.added_images.append(os.path.join(self.folder_path, filename))
+            elif old_stat != stat:
+                delta.modified_images.append(os.path.join(self.folder_path, filename))
+        delta.removed_images = [os.path.join(self.folder_path, filename)
+                                for filename in self.image_stats if filename not in image_stats]
+        self.image_stats.clear()
+        self.image_stats.update(image_stats)
+
+        if self.index.dirty:
+            try:
+                self.index.save()
+            except OSError as e:
+                logger.warning("Could not save corpus index: %s", e)
+        if delta:
+            self.deltaReady.emit(delta)
+
+
+class _SetupThread(QThread):
+    """Loads the folder's CorpusIndex and takes the image baseline off the GUI thread."""
+    setupReady = pyqtSignal(object, object, object)  # CorpusIndex, image stats, folders to watch
+
+    def __init__(self, folder_path, image_files, tokenizer, recursive):
+        super().__init__()
+        self.folder_path = folder_path
+        self.image_files = image_files
+        self.tokenizer = tokenizer
+        self.recursive = recursive
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True  # The load can't stop halfway, but the result is dropped
+
+    @timed_span("watch.setup")
+    def run(self):
+        folder_path = self.folder_path
+        index = CorpusIndex(folder_path, self.tokenizer, recursive=self.recursive)
+        index.load()
+        # Baseline for images: the files the UI already has
+        known_images = {os.path.relpath(path, folder_path) for path in self.image_files}
+        try:
+            image_stats = {name: stat for name, stat in scan_folder(folder_path, IMAGE_EXTENSIONS, self.recursive).items()
+                           if name in known_images}
+        except OSError:
+            image_stats = {}
+        folders = {os.path.normpath(folder_path)}
+        if self.recursive:
+            for name in list(index.entries) + list(image_stats):
+                folders.add(os.path.normpath(os.path.join(folder_path, os.path.dirname(name))))
+        if not self._cancelled:
+            self.setupReady.emit(index, image_stats, sorted(folders))
+
+
+class FolderWatcher(QObject):
+    """
+    Watches a loaded folder and emits a FolderDelta after changes settle.
+    The folder's index is loaded in the background first, then one rescan
+    catches whatever changed meanwhile. Directory events (files added,
+    removed or renamed) are debounced, then a background stat pass works out
+    the delta against the folder's CorpusIndex.
+    In-place edits don't touch the directory, so every poll_seconds (0 turns
+    this off) a rescan runs anyway to pick them up. With recursive, the subfolders that held files when watching
+    started are watched too; files in brand-new subfolders turn up on the
+    next rescan.
+    """
+    folderChanged = pyqtSignal(object)  # FolderDelta
+
+    def __init__(self, folder_path, image_files, poll_seconds=DEFAULT_POLL_SECONDS, tokenizer=DEFAULT_TOKENIZER, parent=None, recursive=False):
+        super().__init__(parent)
+        self.folder_path = folder_path
+        self.index = None  # CorpusIndex, set up in the background along with image_stats
+        self.image_stats = {}
+        self.watcher = None
+        self._thread = None
+        self._pending = False
+
+        self.debounce_timer = QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.setInterval(DEBOUNCE_MS)
+        self.debounce_timer.timeout.connect(self.rescan)
+        self.poll_timer = QTimer(self)
+        self.poll_timer.timeout.connect(self.rescan)
+        self.poll_seconds = poll_seconds
+
+        # Loading the index and stat-ing every image takes seconds on big folders, so the GUI thread doesn't do it
+        self.setup_thread = _SetupThread(folder_path, list(image_files), tokenizer, recursive)
+        self.setup_thread.setupReady.connect(self._on_setup_ready)
+        self.setup_thread.start()
+
+    def _on_setup_ready(self, index, image_stats, folders):
+        if self.setup_thread is None:
+            return  # Stopped meanwhile
+        self.index = index
+        self.image_stats = image_stats
+        self.watcher = QFileSystemWatcher(folders, self)
+        self.watcher.directoryChanged.connect(self.schedule_rescan)
+        self.set_poll_seconds(self.poll_seconds)
+        self.rescan()  # Catches whatever changed before the directories were being watched
+
+    def set_poll_seconds(self, seconds):
+        """Rescans every `seconds` (0 stops polling). Takes effect once the setup is done."""
+        self.poll_seconds = seconds
+        if self.index is None:
+            return
+        if seconds > 0:
+            self.poll_timer.start(int(seconds * 1000))
+        else:
+            self.poll_timer.stop()
+
+    def schedule_rescan(self, *args):
+        self.debounce_timer.start()  # Restarting pushes the rescan back until things go quiet
+
+    def rescan(self):
+        if self.index is None or (self._thread is not None and self._thread.isRunning()):
+            self._pending = True  # One more pass once the current one is done
+            return
+        self._pending = False
+        self._thread = _RescanThread(self.folder_path, self.index, self.image_stats)
+        self._thread.deltaReady.connect(self.folderChanged)
+        self._thread.finished.connect(self._on_rescan_finished)
+        self._thread.start()
+
+    def _on_rescan_finished(self):
+        if self._pending:
+            self.rescan()
+
+    def stop(self):
+        """
+        Stops watching; waits for a running rescan so the index isn't written
+        concurrently. A setup still running is only cancelled, since it writes nothing.
+        """
+        self.debounce_timer.stop()
+        self.poll_timer.stop()
+        if self.watcher is not None:
+            self.watcher.removePaths(self.watcher.directories())
+        self._pending = False
+        if self.setup_thread is not None:
+            self.setup_thread.cancel()  # The owner keeps it alive until it exits (see PromptGenerator.retire_thread)
+            self.setup_thread = None
+        if self._thread is not None:
+            self._thread.wait()
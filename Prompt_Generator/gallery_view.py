@@ -0,0 +1,252 @@
+# gallery_view.py
+from PyQt6.QtWidgets import QListView, QStyledItemDelegate, QStyle
+from PyQt6.QtCore import Qt, QObject, QRunnable, QThread, QThreadPool, QTimer, QSize, QRect, pyqtSignal
+from PyQt6.QtGui import QColor
+from prompt_utils import read_prompt_file
+from debug_utils import count, timed_span
+
+THUMBNAIL_SIZE = (160, 160)  # Decoded size of a gallery image (fits inside this box)
+CAPTION_HEIGHT = 34  # Two lines of caption under the image
+CELL_PADDING = 8
+CAPTION_CHARS = 200  # Characters of the caption kept for drawing
+LOOKAHEAD_SCREENS = 1  # Cells this many screens above and below the viewport are decoded too, at lower priority
+UPDATE_DELAY_MS = 15  # Scroll events within this are merged into one viewport update
+
+
+class _CellSignals(QObject):
+    finished = pyqtSignal(str, object, str)  # text file, QImage (or None), caption snippet
+
+
+class _CellTask(QRunnable):
+    def __init__(self, loader, text_file, image_path):
+        super().__init__()
+        self.loader = loader
+        self.text_file = text_file
+        self.image_path = image_path
+
+    def run(self):
+        loader = self.loader
+        if self.text_file not in loader.wanted:
+            count("gallery.skipped")  # Scrolled out of view while queued
+            return
+        loader.running.add(self.text_file)
+        try:
+            try:
+                snippet = read_prompt_file(self.text_file)[:CAPTION_CHARS]
+            except OSError:
+                snippet = ""
+            qimage = None
+            if self.image_path:
+                from image_thread import load_thumbnail  # Deferred: Pillow isn't needed to start up
+                try:
+                    qimage = load_thumbnail(self.image_path, loader.thumbnail_size, loader.cache)
+                except Exception:
+                    pass  # Drawn as "No image"; errors only pop up for the image being viewed
+            loader.signals.finished.emit(self.text_file, qimage, snippet)
+        finally:
+            loader.running.discard(self.text_file)
+
+
+class GalleryLoader(QObject):
+    """
+    Decodes gallery cells (thumbnail plus caption snippet) on a bounded thread
+    pool, driven by what is on screen. set_wanted() replaces the wanted cells
+    on every scroll: queued work for cells that left is dropped, visible cells
+    are queued before the lookahead ones, and only the wanted cells are kept
+    here, so memory stays flat however far the gallery is scrolled. Decoded
+    thumbnails also go to the shared ThumbnailCache (memory budget plus disk).
+    """
+    cellReady = pyqtSignal(str)  # text file
+
+    def __init__(self, cache=None, thumbnail_size=THUMBNAIL_SIZE, max_threads=None, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.thumbnail_size = thumbnail_size
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(max_threads or min(4, max(2, QThread.idealThreadCount())))
+        self.signals = _CellSignals()
+        self.signals.finished.connect(self._on_finished)
+        self.wanted = frozenset()  # Text files of the wanted cells; read by the workers, replaced (not mutated) here
+        self.running = set()  # Text files being decoded right now (updated by the workers)
+        self.cells = {}  # Text file -> (QImage or None, caption snippet), wanted cells only
+
+    def cell(self, text_file):
+        """Returns (QImage or None, caption snippet) of a decoded cell, or None if it isn't ready."""
+        return self.cells.get(text_file)
+
+    @timed_span("gallery.set_wanted")
+    def set_wanted(self, items):
+        """
+        Makes `items`, a list of (text file, image path or None) in priority
+        order, the cells to decode. Everything else queued is cancelled.
+        """
+        self.pool.clear()  # Drops queued tasks; running decodes finish, and keep their result if still wanted
+        self.wanted = frozenset(text_file for text_file, _ in items)
+        self.cells = {text_file: cell for text_file, cell in self.cells.items() if text_file in self.wanted}
+        running = set(self.running)
+        priority = len(items)
+        for text_file, image_path in items:
+            priority -= 1
+            if text_file in self.cells or text_file in running:
+                continue
+            self.pool.start(_CellTask(self, text_file, image_path), priority)
+
+    def invalidate(self, text_files=()):
+        """Forgets decoded cells (all of them if text_files is empty), e.g. after their files changed."""
+        if text_files:
+            for text_file in text_files:
+                self.cells.pop(text_file, None)
+        else:
+            self.cells.clear()
+
+    def _on_finished(self, text_file, qimage, snippet):
+        if text_file in self.wanted:
+            self.cells[text_file] = (qimage, snippet)
+            self.cellReady.emit(text_file)
+
+    def shutdown(self):
+        """Drops queued work and waits for running decodes to finish."""
+        self.wanted = frozenset()
+        self.pool.clear()
+        self.pool.waitForDone()
+
+
+class GalleryDelegate(QStyledItemDelegate):
+    """Draws a cell: the thumbnail centered in its box (or a placeholder), with the caption under it."""
+
+    def __init__(self, loader, parent=None):
+        super().__init__(parent)
+        self.loader = loader
+        self.cell_size = QSize(THUMBNAIL_SIZE[0] + 2 * CELL_PADDING, THUMBNAIL_SIZE[1] + CAPTION_HEIGHT + 2 * CELL_PADDING)
+
+    def sizeHint(self, option, index):
+        return self.cell_size
+
+    def paint(self, painter, option, index):
+        text_file = index.data(Qt.ItemDataRole.UserRole)
+        if text_file is None:
+            return
+        rect = option.rect.adjusted(CELL_PADDING // 2, CELL_PADDING // 2, -(CELL_PADDING // 2), -(CELL_PADDING // 2))
+        palette = option.palette
+        selected = option.state & QStyle.StateFlag.State_Selected
+        painter.save()
+        if selected:
+            painter.fillRect(rect, palette.highlight())
+        image_box = QRect(rect.x() + CELL_PADDING // 2, rect.y() + CELL_PADDING // 2, THUMBNAIL_SIZE[0], THUMBNAIL_SIZE[1])
+        cell = self.loader.cell(text_file)
+        if cell is not None and cell[0] is not None:
+            qimage = cell[0]
+            x = image_box.x() + (image_box.width() - qimage.width()) // 2
+            y = image_box.y() + (image_box.height() - qimage.height()) // 2
+            painter.drawImage(x, y, qimage)
+        else:
+            painter.fillRect(image_box, QColor(0, 0, 0, 24))
+            painter.setPen(palette.placeholderText().color())
+            painter.drawText(image_box, Qt.AlignmentFlag.AlignCenter, "..." if cell is None else "No image")
+        caption_box = QRect(rect.x() + CELL_PADDING // 2, image_box.bottom() + 2, THUMBNAIL_SIZE[0], CAPTION_HEIGHT)
+        painter.setPen(palette.highlightedText().color() if selected else palette.text().color())
+        caption = cell[1] if cell is not None else index.data(Qt.ItemDataRole.DisplayRole)
+        painter.drawText(caption_box, Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop | Qt.TextFlag.TextWordWrap,
+                         caption)
+        painter.restore()
+
+
+class GalleryView(QListView):
+    """
+    The text file list as a scrolling grid of thumbnails with their captions.
+    Shares the file list's model (and so its name filter). Whenever the
+    viewport moves, the cells on screen plus a screen of lookahead either way
+    are handed to a GalleryLoader; painting only reads what has been decoded.
+    """
+
+    def __init__(self, model, image_for, cache=None, parent=None):
+        super().__init__(parent)
+        self.image_for = image_for  # Text file -> paired image path (or None)
+        self.loader = GalleryLoader(cache, parent=self)
+        self.loader.cellReady.connect(self.schedule_repaint)
+        self.delegate = GalleryDelegate(self.loader, self)
+        self.setItemDelegate(self.delegate)
+        self.setViewMode(QListView.ViewMode.IconMode)
+        self.setMovement(QListView.Movement.Static)
+        self.setResizeMode(QListView.ResizeMode.Adjust)
+        self.setUniformItemSizes(True)  # One sizeHint for every cell, so layout doesn't touch each row
+        self.setGridSize(self.delegate.cell_size)
+        self.setVerticalScrollMode(QListView.ScrollMode.ScrollPerPixel)
+        self.verticalScrollBar().setSingleStep(self.delegate.cell_size.height() // 4)
+        self.setModel(model)
+
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(UPDATE_DELAY_MS)
+        self.update_timer.timeout.connect(self.update_wanted)
+        self.repaint_timer = QTimer(self)
+        self.repaint_timer.setSingleShot(True)
+        self.repaint_timer.timeout.connect(self.viewport().update)  # Cells that finish together are painted together
+        self.verticalScrollBar().valueChanged.connect(self.schedule_update)
+        model.modelReset.connect(self.schedule_update)
+        model.rowsInserted.connect(self.schedule_update)
+
+    def schedule_update(self, *args):
+        if self.isVisible() and not self.update_timer.isActive():
+            self.update_timer.start()
+
+    def schedule_repaint(self, text_file=None):
+        if not self.repaint_timer.isActive():
+            self.repaint_timer.start(0)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.schedule_update()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.loader.set_wanted([])  # Nothing is decoded for a hidden gallery
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.schedule_update()
+
+    def visible_rows(self):
+        """(first, last) rows on screen, from the grid geometry rather than a per-row hit test. None if empty."""
+        rows = self.model().rowCount()
+        if not rows:
+            return None
+        grid = self.gridSize()
+        columns = max(1, self.viewport().width() // grid.width())
+        top = self.verticalScrollBar().value()
+        first = (top // grid.height()) * columns
+        last = ((top + self.viewport().height()) // grid.height() + 1) * columns - 1
+        return min(first, rows - 1), min(last, rows - 1)
+
+    def update_wanted(self):
+        """Hands the cells on screen, then those a screen above and below, to the loader."""
+        visible = self.visible_rows()
+        if visible is None:
+            self.loader.set_wanted([])
+            return
+        first, last = visible
+        span = last - first + 1
+        rows = self.model().rowCount()
+        below = range(last + 1, min(rows, last + 1 + LOOKAHEAD_SCREENS * span))
+        above = range(first - 1, max(-1, first - 1 - LOOKAHEAD_SCREENS * span), -1)
+        model = self.model()
+        items = []
+        for row in list(range(first, last + 1)) + list(below) + list(above):
+            text_file = model.file_at(row)
+            items.append((text_file, self.image_for(text_file)))
+        self.loader.set_wanted(items)
+        self.viewport().update()
+
+    def invalidate(self, text_files=()):
+        self.loader.invalidate(text_files)
+        self.schedule_update()
+
+    def select_file(self, row):
+        """Selects and scrolls to a view row (e.g. a random pick), if the gallery is showing."""
+        if self.isVisible():
+            index = self.model().index(row)
+            self.setCurrentIndex(index)
+            self.scrollTo(index)
+
+    def shutdown(self):
+        self.loader.shutdown()
@@ -0,0 +1,97 @@
+# image_pool.py
+from PyQt6.QtCore import QObject, QRunnable, QThread, QThreadPool, pyqtSignal
+
+DISPLAY_PRIORITY = 10  # The image the user is waiting for jumps ahead of prefetches
+PREFETCH_PRIORITY = 0
+
+
+class _TaskSignals(QObject):
+    finished = pyqtSignal(int, str, object)  # request id, image path, QImage
+    failed = pyqtSignal(int, str, str)  # request id, image path, error message
+
+
+class _ImageTask(QRunnable):
+    def __init__(self, loader, request_id, image_path, target_size, prefetch):
+        super().__init__()
+        self.loader = loader
+        self.request_id = request_id
+        self.image_path = image_path
+        self.target_size = target_size
+        self.prefetch = prefetch
+
+    def run(self):
+        if not self.loader.is_current(self.request_id, self.prefetch):
+            return  # Superseded while queued: don't bother decoding
+        from image_thread import load_thumbnail, image_error_message  # Deferred: Pillow isn't needed to start up
+        try:
+            qimage = load_thumbnail(self.image_path, self.target_size, self.loader.cache)
+        except Exception as e:
+            if not self.prefetch:
+                self.loader.signals.failed.emit(self.request_id, self.image_path, image_error_message(self.image_path, e))
+            return
+        if not self.prefetch:
+            self.loader.signals.finished.emit(self.request_id, self.image_path, qimage)
+
+
+class ImageLoader(QObject):
+    """
+    Persistent pool of image workers. A new request() supersedes the previous
+    one instead of waiting for it: stale queued work is skipped and stale
+    results are dropped. prefetch() decodes likely-next images into the cache.
+    """
+    imageLoaded = pyqtSignal(object, str)  # QImage, image path
+    imageLoadFailed = pyqtSignal(str)
+
+    def __init__(self, cache=None, max_threads=None, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.pool = QThreadPool()
+        # Enough threads that a display request rarely waits behind prefetches
+        self.pool.setMaxThreadCount(max_threads or min(4, max(2, QThread.idealThreadCount())))
+        self.signals = _TaskSignals()
+        self.signals.finished.connect(self._on_finished)
+        self.signals.failed.connect(self._on_failed)
+        self._request_id = 0
+        self._prefetch_id = 0
+
+    def is_current(self, request_id, prefetch=False):
+        return request_id == (self._prefetch_id if prefetch else self._request_id)
+
+    def request(self, image_path, target_size):
+        """Loads an image for display. Memory-cached images are delivered immediately."""
+        self._request_id += 1
+        if self.cache is not None:
+            qimage = self.cache.peek(image_path, target_size)
+            if qimage is not None:
+                self.imageLoaded.emit(qimage, image_path)
+                return
+        task = _ImageTask(self, self._request_id, image_path, target_size, prefetch=False)
+        self.pool.start(task, DISPLAY_PRIORITY)
+
+    def cancel(self):
+        """Drops the pending display request, e.g. when switching to shuffle mode."""
+        self._request_id += 1
+
+    def prefetch(self, image_paths, target_size):
+        """Decodes images into the cache ahead of time. Replaces any earlier prefetch batch."""
+        if self.cache is None:
+            return
+        self._prefetch_id += 1
+        for image_path in image_paths:
+            if not self.cache.contains(image_path, target_size):
+                self.pool.start(_ImageTask(self, self._prefetch_id, image_path, target_size, prefetch=True), PREFETCH_PRIORITY)
+
+    def _on_finished(self, request_id, image_path, qimage):
+        if request_id == self._request_id:
+            self.imageLoaded.emit(qimage, image_path)
+
+    def _on_failed(self, request_id, image_path, error_message):
+        if request_id == self._request_id:
+            self.imageLoadFailed.emit(error_message)
+
+    def shutdown(self):
+        """Drops queued work and waits for running decodes to finish."""
+        self._request_id += 1
+        self._prefetch_id += 1
+        self.pool.clear()
+        self.pool.waitForDone()
@@ -1,71 +1,162 @@
-from PyQt6.QtCore import QThread, pyqtSignal, Qt
+from PyQt6.QtCore import QThread, pyqtSignal
 from PyQt6.QtGui import QPixmap, QImage
-from PIL import Image, UnidentifiedImageError, ImageOps
+from PIL import Image, UnidentifiedImageError
 import os
+import sys
 from error_utils import check_file_size
+from archive_utils import open_binary, split_archive_path
+from debug_utils import timed_span
+
+MAX_IMAGE_SIZE_MB = 50
+
+EXIF_ORIENTATION = 0x0112
+# Same mapping as ImageOps.exif_transpose, applied after resizing
+EXIF_TRANSPOSE_METHODS = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+# PIL mode -> (QImage format, bytes per pixel)
+QIMAGE_FORMATS = {
+    "RGBA": (QImage.Format.Format_RGBA8888, 4),
+    "RGB": (QImage.Format.Format_RGB888, 3),
+    "L": (QImage.Format.Format_Grayscale8, 1),
+    "I;16": (QImage.Format.Format_Grayscale16, 2),
+}
+
+
+def load_thumbnail(image_path, target_size, cache=None):
+    """
+    Decodes and resizes an image to fit target_size, returning a QImage.
+    Uses (and fills) the optional ThumbnailCache. Safe to call from any thread.
+    Raises on failure; image_error_message() turns the exception into UI text.
+
+    JPEGs are decoded at reduced resolution (Image.draft), other formats are
+    box-reduced before the final filter (reducing_gap), and there is exactly
+    one resample. EXIF rotation is applied to the small image, not the original.
+    """
+    if cache is not None:
+        qimage = cache.get(image_path, target_size)
+        if qimage is not None:  # Cache hit: skip decoding entirely
+            return qimage
+
+    with timed_span("image.decode"):
+        errors = []
+        if not check_file_size(image_path, MAX_IMAGE_SIZE_MB, errors.append):
+            raise ValueError(errors[0])
+
+        # Archive members are opened through archive_utils (stored ones straight from a memory map)
+        img = Image.open(image_path if split_archive_path(image_path) is None else open_binary(image_path))
+        orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+        transpose_method = EXIF_TRANSPOSE_METHODS.get(orientation)
+        swap_axes = orientation in (5, 6, 7, 8)  # Rotated by 90 degrees: width and height trade places
+
+        width, height = img.size
+        if swap_axes:
+            width, height = height, width
+        new_width, new_height = fit_size((width, height), target_size)
+        if swap_axes:  # Back to the stored (unrotated) orientation for decoding and resizing
+            new_width, new_height = new_height, new_width
+
+        if img.format == "JPEG":
+            img.draft(None, (new_width, new_height))  # Lets libjpeg decode at 1/2, 1/4 or 1/8 scale
+        img = normalize_mode(img)
+        if img.size != (new_width, new_height):
+            img = img.resize((new_width, new_height), Image.Resampling.BICUBIC, reducing_gap=2.0)
+        if transpose_method is not None:
+            img = img.transpose(transpose_method)  # Correct orientation
+
+        qimage = pil_to_qimage(img)
+    if cache is not None:
+        cache.put(image_path, target_size, qimage)
+    return qimage
+
+
+def fit_size(size, target_size):
+    """Returns the largest size with the same aspect ratio as `size` that fits in target_size."""
+    width, height = size
+    target_width, target_height = target_size
+
+    # Calculate aspect ratios
+    aspect_ratio = width / height
+    target_aspect_ratio = target_width / target_height
+
+    if aspect_ratio > target_aspect_ratio:
+        # Wider than target: scale to target width
+        new_width = target_width
+        new_height = max(1, round(new_width / aspect_ratio))  # Clamp to >= 1
+    else:
+        # Taller or same aspect ratio: scale to target height
+        new_height = target_height
+        new_width = max(1, round(new_height * aspect_ratio))  # Clamp to >= 1
+    return new_width, new_height
+
+
+def image_error_message(image_path, error):
+    """Turns an exception from load_thumbnail() into a message for the user."""
+    if isinstance(error, FileNotFoundError):
+        return f"Image file not found: {image_path}"
+    if isinstance(error, UnidentifiedImageError):
+        return f"Could not open or read image: {image_path}"
+    if isinstance(error, ValueError):
+        return str(error)
+    return f"An unexpected error occurred: {error}"
+
+
+def normalize_mode(img):
+    """
+    Converts an image to a mode pil_to_qimage() can wrap directly
+    (RGB, RGBA, L or I;16), picking the cheapest conversion that keeps alpha.
+    """
+    mode = img.mode
+    if mode in ("RGB", "RGBA", "L"):
+        return img
+    if mode == "I;16" and sys.byteorder == "little":
+        return img  # Wrapped as Grayscale16, which is native-endian
+    if mode in ("P", "PA"):
+        return img.convert("RGBA" if mode == "PA" or "transparency" in img.info else "RGB")
+    if mode in ("LA", "La", "RGBa", "RGBX"):
+        return img.convert("RGBA" if mode != "RGBX" else "RGB")
+    if mode.startswith("I;16") or mode == "I":
+        return img.convert("I").point(lambda v: v * (1 / 256)).convert("L")  # 16-bit to 8-bit gray
+    if mode in ("1", "F"):
+        return img.convert("L")
+    return img.convert("RGB")  # CMYK, YCbCr, LAB, HSV
+
+
+def pil_to_qimage(img):
+    """
+    Helper function to convert a PIL Image to a QImage.
+    The pixel bytes are wrapped with an explicit row stride, then copied into
+    a QImage that owns its buffer: the wrapper only borrows the Python bytes,
+    and the result is cached, sent across threads and shared implicitly.
+    """
+    fmt, bytes_per_pixel = QIMAGE_FORMATS.get(img.mode, (None, 0))
+    if fmt is None:
+        raise ValueError(f"Unsupported image mode: {img.mode}")
+    width, height = img.size
+    return QImage(img.tobytes(), width, height, width * bytes_per_pixel, fmt).copy()
+
 
 class ImageLoadThread(QThread):
+    """Loads a single image in its own thread. The app uses ImageLoader (image_pool.py) instead."""
     imageLoaded = pyqtSignal(QPixmap)
     imageLoadFailed = pyqtSignal(str)
 
-    def __init__(self, image_path, target_size):
+    def __init__(self, image_path, target_size, cache=None):
         super().__init__()
         self.image_path = image_path
         self.target_size = target_size
+        self.cache = cache  # Optional ThumbnailCache
 
     def run(self):
         try:
-            if not check_file_size(self.image_path, 50, self.imageLoadFailed.emit):
-                return
-
-            img = Image.open(self.image_path)
-            img = ImageOps.exif_transpose(img)  # Correct orientation
-            width, height = img.size
-            target_width, target_height = self.target_size
-
-            # Calculate aspect ratios
-            aspect_ratio = width / height
-            target_aspect_ratio = target_width / target_height
-
-            # Determine scaling method and calculate new dimensions
-            if aspect_ratio > target_aspect_ratio:
-                # Wider than target: scale to target width
-                new_width = target_width
-                new_height = max(1, int(new_width / aspect_ratio))  # Clamp to >= 1
-            else:
-                # Taller or same aspect ratio: scale to target height
-                new_height = target_height
-                new_width = max(1, int(new_height * aspect_ratio))  # Clamp to >= 1
-
-            # Resize and convert to QImage/QPixmap
-            img = img.resize((new_width, new_height), Image.Resampling.BICUBIC) # Example: Bicubic
-            qimage = self.pil_to_qimage(img)
-
-            if aspect_ratio > target_aspect_ratio:
-                pixmap = QPixmap.fromImage(qimage).scaledToWidth(target_width, Qt.TransformationMode.SmoothTransformation)
-            else:
-                pixmap = QPixmap.fromImage(qimage).scaledToHeight(target_height, Qt.TransformationMode.SmoothTransformation)
-
-            self.imageLoaded.emit(pixmap)
-
-
-        except FileNotFoundError:
-            self.imageLoadFailed.emit(f"Image file not found: {self.image_path}")
-        except UnidentifiedImageError:
-            self.imageLoadFailed.emit(f"Could not open or read image: {self.image_path}")
-        except ValueError as e:
-            self.imageLoadFailed.emit(str(e))
+            qimage = load_thumbnail(self.image_path, self.target_size, self.cache)
+            self.imageLoaded.emit(QPixmap.fromImage(qimage))
         except Exception as e:
-            self.imageLoadFailed.emit(f"An unexpected error occurred: {e}")
-
-    def pil_to_qimage(self, img):
-        """Helper function to convert a PIL Image to a QImage."""
-        if img.mode == 'RGBA':
-            qimage = QImage(img.tobytes(), img.size[0], img.size[1], QImage.Format.Format_RGBA8888)
-        elif img.mode == 'RGB':
-            qimage = QImage(img.tobytes(), img.size[0], img.size[1], QImage.Format.Format_RGB888)
-        elif img.mode == 'L':
-            qimage = QImage(img.tobytes(), img.size[0], img.size[1], QImage.Format.Format_Grayscale8)
-        else:
-            raise ValueError(f"Unsupported image mode: {img.mode}")
-        return qimage
\ No newline at end of file
+            self.imageLoadFailed.emit(image_error_message(self.image_path, e))
@@ -0,0 +1,22 @@
+# import_utils.py
+"""
+Deferred imports for heavy optional modules, so starting the app doesn't pay
+for them up front (NumPy alone takes around 100 ms to import).
+"""
+import importlib
+
+_modules = {}  # Module name -> module, or None if it isn't installed
+
+
+def optional_import(name):
+    """Imports a module on first use and caches it. Returns None if it isn't installed."""
+    try:
+        return _modules[name]
+    except KeyError:
+        pass
+    try:
+        module = importlib.import_module(name)
+    except ImportError:
+        module = None
+    _modules[name] = module
+    return module
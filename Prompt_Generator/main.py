@@ -1,9 +1,30 @@
 # main.py
+import debug_utils  # First, so startup timing includes the imports below
+import argparse
 import sys
 from PyQt6.QtWidgets import QApplication
 from prompt_generator import PromptGenerator
 
+
+def parse_args(argv):
+    """Our own options; everything else is left for Qt (e.g. -platform)."""
+    parser = argparse.ArgumentParser(description="Random Prompt Generator")
+    parser.add_argument("--log-level", default="INFO", help="DEBUG, INFO, WARNING or ERROR (DEBUG logs every click)")
+    parser.add_argument("--stats-interval", type=float, default=0,
+                        help="Log timing stats every this many seconds (0: only on exit and Ctrl+Shift+S)")
+    parser.add_argument("--profile", choices=("cpu", "memory", "both"), default=None,
+                        help="Profile from startup until exit or Ctrl+Shift+P (which also toggles it later)")
+    return parser.parse_known_args(argv)
+
+
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    ex = PromptGenerator()
-    sys.exit(app.exec())
\ No newline at end of file
+    args, qt_args = parse_args(sys.argv[1:])
+    debug_utils.setup_logging(args.log_level)
+    profiler = debug_utils.Profiler(cpu=args.profile in ("cpu", "both", None), memory=args.profile in ("memory", "both"))
+    if args.profile:
+        profiler.start()
+    if args.stats_interval > 0:
+        debug_utils.start_stats_dump(args.stats_interval)
+    app = QApplication(sys.argv[:1] + qt_args)
+    ex = PromptGenerator(profiler)
+    sys.exit(app.exec())
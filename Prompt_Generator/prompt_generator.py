@@ -1,112 +1,579 @@
 # prompt_generator.py
 
 import os
+import json
 import random
+import logging
+from collections import deque
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
                              QComboBox, QPushButton, QTextEdit, QFileDialog,
-                             QGroupBox, QListWidget, QListWidgetItem, QSpinBox,
-                             QMessageBox)
-from PyQt6.QtCore import Qt, QSize, pyqtSignal
-from PyQt6.QtGui import QDropEvent, QDragEnterEvent
-from image_thread import ImageLoadThread
+                             QGroupBox, QSpinBox,
+                             QMessageBox, QApplication)
+from PyQt6.QtCore import Qt, QSize, QModelIndex, QTimer, pyqtSignal
+from PyQt6.QtGui import QDropEvent, QDragEnterEvent, QPixmap, QKeySequence, QShortcut
+from image_pool import ImageLoader
+from folder_load_thread import FolderLoadThread, GraphBuildThread, new_ingest_pool
+from folder_watcher import DEFAULT_POLL_SECONDS, FolderWatcher
+from archive_utils import ARCHIVE_EXTENSIONS, is_archive
 from ui_utils import setup_ui  # Import UI setup function
-from file_utils import load_prefixes, load_files, load_images
+from file_utils import load_prefixes
 from settings_manager import SettingsManager
+from vocabulary import Vocabulary
+from corpus_shards import Shard, ShardedCorpus, has_filter
+from tokenizer_utils import DEFAULT_TOKENIZER, TOKENIZERS, join_tokens
+from tag_index import parse_tag_query
+from dataset_catalog import DatasetCatalog, file_stem
+from thumbnail_cache import ThumbnailCache, DEFAULT_MAX_BYTES, DEFAULT_MAX_DISK_BYTES
+from prompt_utils import read_prompt_file, build_prompt
 from error_utils import show_error_message  # Import error handling
+from debug_utils import mark_startup, timed_span, log_stats, Profiler
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_COUNT = 3  # Random picks chosen (and their images decoded) ahead of time
+RESTORE_FALLBACK_MS = 500  # Restore the last folder after this even if the window hasn't been painted (e.g. minimized)
 
 class PromptGenerator(QWidget):
     imageLoaded = pyqtSignal(object)  # Use object for QPixmap
     imageLoadFailed = pyqtSignal(str)
 
-    def __init__(self):
+    def __init__(self, profiler=None):
         super().__init__()
-        print("Initializing PromptGenerator...")
+        logger.debug("Initializing PromptGenerator...")
 
         self.setWindowTitle("Random Prompt Generator")
         self.setGeometry(100, 100, 800, 600)
         self.setAcceptDrops(True)
 
         # --- Data ---
-        self.folder_path = ""
-        self.text_files = []
+        self.corpus = ShardedCorpus()  # One Shard (words, samplers, tag index, graph) per loaded folder
+        self.text_files = []  # Every shard's text files, in list order
         self.image_files = []
-        self.all_words = {}
+        self.catalog = DatasetCatalog()  # Caption <-> image pairing and list rows, by stem
+        self.tag_query = ([], [])  # Parsed tag filter: (include, exclude) tokens
         self.current_text_file = None
+        self.upcoming_files = deque()  # Pre-chosen random picks whose images are being prefetched
         self.is_shuffling = False
         self.word_limit = 15
+        self.tokenizer = DEFAULT_TOKENIZER
+        self.recursive_scan = False  # Include subfolders of every folder
 
         # --- Load Prefixes ---
         self.prefixes_file = "prefixes.json"
         self.prefixes = load_prefixes(self.prefixes_file, show_error_message) #Simplified
 
+        # --- Settings ---
+        self.settings_manager = SettingsManager("YourOrganization", "PromptGenerator")
+        cache_mb = int(self.settings_manager.load_setting("thumbnail_cache_mb", DEFAULT_MAX_BYTES // (1024 * 1024)))
+        disk_cache_mb = int(self.settings_manager.load_setting("thumbnail_disk_cache_mb", DEFAULT_MAX_DISK_BYTES // (1024 * 1024)))
+        self.thumbnail_cache = ThumbnailCache(max_bytes=cache_mb * 1024 * 1024,  # Shared by the image view and the gallery
+                                              max_disk_bytes=disk_cache_mb * 1024 * 1024)
+        self.thumbnail_cache.start_disk_prune()
+
         # --- UI Setup ---
         setup_ui(self, self.prefixes) # Pass self and prefixes to setup_ui
+        self.prompt_text.textChanged.connect(self.on_prompt_text_changed)
 
-        # --- Settings ---
-        self.settings_manager = SettingsManager("YourOrganization", "PromptGenerator")
-        # No signals connections here
-        self.current_thread = None
+        self.image_loader = ImageLoader(self.thumbnail_cache, parent=self)
+        self.image_loader.imageLoaded.connect(self.set_image)
+        self.image_loader.imageLoadFailed.connect(self.show_image_error)
+        self.ingest_pool = None  # Process pool shared by the folder loads, started with the first one
+        self.retired_folder_threads = []  # Cancelled loads, kept alive until their thread exits
+        self.pending_folders = None  # Saved folders, reopened once the window is on screen
+        self.first_paint_done = False
+
+        # --- Diagnostics ---
+        self.profiler = profiler or Profiler()
+        QShortcut(QKeySequence("Ctrl+Shift+P"), self, activated=self.profiler.toggle)
+        QShortcut(QKeySequence("Ctrl+Shift+S"), self, activated=log_stats)
 
         self.load_settings()
         self.show()
-        print("PromptGenerator initialization complete.")
+        QTimer.singleShot(RESTORE_FALLBACK_MS, self.restore_last_folder)
+        logger.debug("PromptGenerator initialization complete.")
 
     # --- UI Update Methods (kept here for simplicity) ---
     def update_prefix_type(self, prefix_type):
-        print(f"Updating prefix type to: {prefix_type}")
+        logger.debug("Updating prefix type to: %s", prefix_type)
         self.current_prefix_type = prefix_type
         self.settings_manager.save_setting("prefix", self.current_prefix_type)
 
     def update_word_limit(self, value):
-        print(f"Updating word limit to: {value}")
+        logger.debug("Updating word limit to: %s", value)
         self.word_limit = value
 
+    def update_tokenizer(self, tokenizer):
+        logger.debug("Updating tokenizer to: %s", tokenizer)
+        if tokenizer == self.tokenizer:
+            return
+        self.tokenizer = tokenizer
+        self.settings_manager.save_setting("tokenizer", tokenizer)
+        self.update_tag_query()  # Query terms are tokenized like the captions
+        self.reload_folders()  # Each tokenizer has its own index, so this is a normal (cached) load
+
+    def set_recursive_enabled(self, enabled):
+        if enabled == self.recursive_scan:
+            return
+        self.recursive_scan = enabled
+        self.settings_manager.save_setting("recursive_scan", enabled)
+        self.reload_folders()  # A recursive scan has its own index next to the flat one
+
     def select_folder(self):
         selected_folder = QFileDialog.getExistingDirectory(self, "Select Folder")
-        print(f"Selected folder: {selected_folder}")
+        logger.debug("Selected folder: %s", selected_folder)
         if selected_folder:
             self.set_folder(selected_folder)
 
+    def select_archive(self):
+        selected_archive = self.ask_archive_path()
+        if selected_archive:
+            self.set_folder(selected_archive)  # An archive is browsed like a folder
+
+    def add_folder_dialog(self):
+        selected_folder = QFileDialog.getExistingDirectory(self, "Add Folder")
+        logger.debug("Added folder: %s", selected_folder)
+        if selected_folder:
+            self.add_folder(selected_folder)
+
+    def add_archive_dialog(self):
+        selected_archive = self.ask_archive_path()
+        if selected_archive:
+            self.add_folder(selected_archive)
+
+    def ask_archive_path(self):
+        patterns = " ".join(f"*{ext}" for ext in ARCHIVE_EXTENSIONS)
+        selected_archive, _ = QFileDialog.getOpenFileName(self, "Open Archive", "", f"Archives ({patterns})")
+        logger.debug("Selected archive: %s", selected_archive)
+        return selected_archive
+
     def set_folder(self, folder_path):
-        print(f"Setting folder to: {folder_path}")
-        if not os.path.isdir(folder_path):
+        """Replaces the loaded folders with this one."""
+        self.set_folders([(folder_path, 1.0)])
+
+    def set_folders(self, folders):
+        """Replaces the loaded folders with `folders`, a list of (path, weight); each loads as its own shard."""
+        logger.info("Setting folders to: %s", ", ".join(path for path, _ in folders))
+        valid = [(path, weight) for path, weight in folders if os.path.isdir(path) or is_archive(path)]
+        if len(valid) < len(folders):
             show_error_message(self,"Invalid folder path.") # Use from error_utils
-            return
+            if not valid:
+                return
 
-        self.folder_path = folder_path
-        self.folder_label.setText(self.folder_path)
-        self.text_files, self.all_words = load_files(self.folder_path, show_error_message)  # Pass error handler
-        self.image_files = load_images(self.folder_path)
+        for shard in list(self.corpus):
+            self.unload_shard(shard)
+        self.corpus = ShardedCorpus()
+        self.text_files = []
+        self.image_files = []
+        self.catalog = DatasetCatalog()
+        self.current_text_file = None
+        self.upcoming_files.clear()
         self.populate_file_list()
-        self.generate_random_prompt()
-        self.settings_manager.save_setting("folder", self.folder_path)
+        for path, weight in valid:
+            self.add_folder(path, weight)
+        if not valid:
+            self.update_folder_list()
+
+    def add_folder(self, folder_path, weight=1.0):
+        """Adds a folder (or archive) to the corpus as a new shard and starts loading it."""
+        logger.info("Adding folder: %s", folder_path)
+        if not (os.path.isdir(folder_path) or is_archive(folder_path)):
+            show_error_message(self,"Invalid folder path.") # Use from error_utils
+            return
+        if self.corpus.shard_for(folder_path) is not None:
+            logger.info("%s is already loaded.", folder_path)
+            return
+        shard = Shard(folder_path, weight, recursive=self.recursive_scan and not is_archive(folder_path))
+        self.corpus.add(shard)
+        self.upcoming_files.clear()  # The new folder changes the odds of every pick
+        self.update_folder_list()
+        self.start_loading(shard)
+        self.save_folders()
+
+    def remove_folder(self, shard):
+        """Drops a shard and its files; the other folders stay loaded as they are."""
+        logger.info("Removing folder: %s", shard.folder_path)
+        self.unload_shard(shard)
+        self.corpus.remove(shard)
+        removed_texts = set(shard.text_files)
+        removed_images = set(shard.image_files)
+        self.text_files = [f for other in self.corpus for f in other.text_files]
+        self.image_files = [img for img in self.image_files if img not in removed_images]
+        self.catalog = DatasetCatalog()
+        self.catalog.add_images(self.image_files)
+        self.catalog.add_captions(self.text_files, 0)
+        self.upcoming_files = deque(f for f in self.upcoming_files if f not in removed_texts)
+        if self.current_text_file in removed_texts:
+            self.current_text_file = None
+        self.populate_file_list()
+        self.update_folder_list()
+        self.update_tag_match_label()
+        self.update_load_progress()
+        self.save_folders()
+
+    def reload_folders(self):
+        """Reloads every folder (same weights), e.g. after the tokenizer or the subfolder setting changed."""
+        if len(self.corpus):
+            self.set_folders([(shard.folder_path, shard.weight) for shard in self.corpus])
+
+    def save_folders(self):
+        folders = [[shard.folder_path, shard.weight] for shard in self.corpus]
+        self.settings_manager.save_setting("folders", json.dumps(folders))
+        self.settings_manager.save_setting("folder", folders[0][0] if folders else "")  # For older versions
+
+    def start_loading(self, shard):
+        # Ingestion runs in the background and streams files in as they are read.
+        # All shards share one process pool, so loading several folders doesn't oversubscribe the CPU.
+        if self.ingest_pool is None:
+            self.ingest_pool = new_ingest_pool()
+        thread = shard.load_thread = FolderLoadThread(shard.folder_path, self.tokenizer,
+                                                      recursive=shard.recursive, executor=self.ingest_pool)
+        thread.imagesLoaded.connect(self.on_images_loaded)
+        thread.batchLoaded.connect(self.on_files_loaded)
+        thread.progress.connect(self.on_load_progress)
+        thread.loadFinished.connect(self.on_folder_loaded)
+        thread.loadFailed.connect(self.on_folder_load_failed)
+        thread.tagIndexReady.connect(self.on_tag_index_ready)
+        shard.loaded = False
+        shard.progress = (0, 0)
+        self.update_load_progress()
+        thread.start()
+
+    def unload_shard(self, shard):
+        """Cancels a shard's background work without blocking; its late signals are ignored."""
+        if shard.load_thread and shard.load_thread.isRunning():
+            logger.info("Cancelling load of %s...", shard.folder_path)
+        self.retire_thread(shard.load_thread)
+        self.retire_thread(shard.graph_thread)
+        shard.load_thread = shard.graph_thread = None
+        self.stop_watching(shard)
+
+    def retire_thread(self, thread):
+        """Cancels a background thread and keeps it alive until it exits; signals check sender() to drop its results."""
+        if thread and thread.isRunning():
+            thread.cancel()
+            self.retired_folder_threads.append(thread)
+            thread.finished.connect(lambda: self.retired_folder_threads.remove(thread))
+
+    def sender_shard(self, attribute):
+        """The shard whose `attribute` (load_thread, graph_thread or watcher) sent the current signal, or None if stale."""
+        sender = self.sender()
+        for shard in self.corpus:
+            if getattr(shard, attribute) is sender:
+                return shard
+        return None
+
+    def on_images_loaded(self, image_files):
+        shard = self.sender_shard("load_thread")
+        if shard is None:
+            return
+        shard.image_files = image_files
+        self.image_files.extend(image_files)
+        self.catalog.add_images(image_files)
+
+    @timed_span("ui.files_loaded")
+    def on_files_loaded(self, text_files, word_counts):
+        shard = self.sender_shard("load_thread")
+        if shard is None:
+            return
+        first_index = len(self.text_files)
+        self.catalog.add_captions(text_files, first_index)
+        self.text_files.extend(text_files)
+        shard.text_files.extend(text_files)
+        if isinstance(word_counts, Vocabulary) and not shard.all_words:
+            shard.set_words(word_counts)  # First batch: the indexed table, taken over as is
+        else:
+            shard.add_word_counts(word_counts)
+        self.file_list_model.files_appended(first_index)
+        if first_index == 0 and self.current_text_file is None:
+            self.generate_random_prompt()  # Something to look at while the rest of the folders load
+
+    def on_load_progress(self, done, total):
+        shard = self.sender_shard("load_thread")
+        if shard is None:
+            return
+        shard.progress = (done, total)
+        self.update_load_progress()
+
+    def update_load_progress(self):
+        """One progress bar for all folders still loading."""
+        loading = [shard for shard in self.corpus if shard.load_thread is not None and not shard.loaded]
+        if not loading:
+            self.load_progress.hide()
+            return
+        self.load_progress.setMaximum(max(sum(shard.progress[1] for shard in loading), 1))
+        self.load_progress.setValue(sum(shard.progress[0] for shard in loading))
+        self.load_progress.show()
+
+    def on_folder_loaded(self, vocabulary):
+        shard = self.sender_shard("load_thread")
+        if shard is None:
+            return
+        if vocabulary is not None:
+            shard.set_words(vocabulary)  # Same counts, but frozen and memory-mapped
+        shard.loaded = True
+        logger.info("Folder loaded: %s (%d text files, %d images).",
+                    shard.folder_path, len(shard.text_files), len(shard.image_files))
+        self.update_load_progress()
+        if self.watch_checkbox.isChecked():
+            self.start_watching(shard)
+        if self.coherent_checkbox.isChecked():
+            self.build_cooccurrence(shard)
+        if self.current_text_file is None:
+            self.generate_random_prompt()
+
+    def on_tag_index_ready(self, tag_index):
+        shard = self.sender_shard("load_thread")
+        if shard is None:
+            return
+        shard.tag_index = tag_index
+        self.upcoming_files.clear()  # Picked before the filter could apply
+        self.update_tag_match_label()
+
+    # --- Folder list and weights ---
+    def update_folder_list(self):
+        """Shows the folder path, or with several folders the list of them and the selected one's weight."""
+        shards = list(self.corpus)
+        if not shards:
+            self.folder_label.setText("No folder selected")
+        elif len(shards) == 1:
+            self.folder_label.setText(shards[0].folder_path)
+        else:
+            self.folder_label.setText(f"{len(shards)} folders")
+        row = self.folder_list.currentRow()
+        self.folder_list.blockSignals(True)
+        self.folder_list.clear()
+        for shard in shards:
+            self.folder_list.addItem(shard.folder_path)
+        self.folder_list.blockSignals(False)
+        self.folder_list_widget.setVisible(len(shards) > 1)
+        if shards:
+            self.folder_list.setCurrentRow(min(max(row, 0), len(shards) - 1))
+
+    def selected_shard(self):
+        row = self.folder_list.currentRow()
+        return self.corpus.shards[row] if 0 <= row < len(self.corpus) else None
+
+    def on_folder_selected(self, row):
+        shard = self.selected_shard()
+        if shard is not None:
+            self.folder_weight_spinbox.blockSignals(True)
+            self.folder_weight_spinbox.setValue(shard.weight)
+            self.folder_weight_spinbox.blockSignals(False)
+
+    def update_folder_weight(self, weight):
+        shard = self.selected_shard()
+        if shard is None or weight == shard.weight:
+            return
+        logger.debug("Weight of %s: %s", shard.folder_path, weight)
+        shard.weight = weight
+        self.upcoming_files.clear()
+        self.save_folders()
+
+    def remove_selected_folder(self):
+        shard = self.selected_shard()
+        if shard is not None:
+            self.remove_folder(shard)
+
+    # --- Tag filter ---
+    def update_tag_query(self):
+        query = parse_tag_query(self.tag_query_edit.text(), self.tokenizer)
+        if query == self.tag_query:
+            return
+        logger.debug("Tag filter: include %s, exclude %s", query[0], query[1])
+        self.tag_query = query
+        self.upcoming_files.clear()
+        self.update_tag_match_label()
+
+    def has_tag_filter(self):
+        return has_filter(self.tag_query)
+
+    def update_tag_match_label(self):
+        if not self.has_tag_filter():
+            self.tag_match_label.setText("")
+            return
+        match_count = self.corpus.match_count(self.tag_query)
+        self.tag_match_label.setText("Indexing..." if match_count is None else f"{match_count} files")
+
+    def pick_random_file(self):
+        """Returns a random text file that passes the tag filter (from a folder picked by weight), or None."""
+        return self.corpus.pick_random_file(self.tag_query)
+
+    def get_shuffle_sampler(self):
+        """Returns the sampler for shuffle mode: every folder's (tag-filtered) words, mixed by folder weight."""
+        return self.corpus.shuffle_sampler(self.tag_query)
+
+    # --- Coherent shuffle ---
+    def set_coherent_enabled(self, enabled):
+        self.settings_manager.save_setting("coherent_shuffle", enabled)
+        if enabled:
+            for shard in self.corpus:
+                if shard.loaded:
+                    self.build_cooccurrence(shard)
+
+    def build_cooccurrence(self, shard):
+        """Loads or builds a folder's co-occurrence graph in the background (once per folder load)."""
+        if shard.cooccurrence is not None or (shard.graph_thread is not None and shard.graph_thread.isRunning()):
+            return
+        shard.graph_thread = GraphBuildThread(shard.folder_path, self.tokenizer, shard.recursive)
+        shard.graph_thread.graphReady.connect(self.on_cooccurrence_ready)
+        shard.graph_thread.start()
+
+    def on_cooccurrence_ready(self, graph):
+        shard = self.sender_shard("graph_thread")
+        if shard is None:
+            return
+        shard.cooccurrence = graph
+
+    # --- Watch mode ---
+    def set_watch_enabled(self, enabled):
+        self.settings_manager.save_setting("watch_folder", enabled)
+        for shard in self.corpus:
+            if not enabled:
+                self.stop_watching(shard)
+            elif shard.loaded:
+                self.start_watching(shard)
+
+    def update_watch_poll(self, seconds):
+        self.settings_manager.save_setting("watch_poll_seconds", seconds)
+        for shard in self.corpus:
+            if shard.watcher is not None:
+                shard.watcher.set_poll_seconds(seconds)
+
+    def start_watching(self, shard):
+        self.stop_watching(shard)
+        if is_archive(shard.folder_path):
+            logger.warning("Watch mode isn't available for archives.")
+            return
+        shard.watcher = FolderWatcher(shard.folder_path, shard.image_files, self.watch_poll_spinbox.value(), self.tokenizer,
+                                      parent=self, recursive=shard.recursive)
+        shard.watcher.folderChanged.connect(self.apply_folder_delta)
+        logger.info("Watching %s for changes.", shard.folder_path)
+
+    def stop_watching(self, shard):
+        if shard.watcher is not None:
+            self.retire_thread(shard.watcher.setup_thread)
+            shard.watcher.stop()
+            shard.watcher.deleteLater()
+            shard.watcher = None
+
+    @timed_span("ui.folder_delta")
+    def apply_folder_delta(self, delta):
+        """Applies a FolderDelta from a folder's watcher to its shard without reloading anything."""
+        shard = self.sender_shard("watcher")
+        if shard is None:
+            return
+        logger.info("Folder changed: %s: +%d -%d ~%d text files, +%d -%d ~%d images.", shard.folder_path,
+                    len(delta.added_texts), len(delta.removed_texts), len(delta.modified_texts),
+                    len(delta.added_images), len(delta.removed_images), len(delta.modified_images))
+        for counts in delta.removed_texts.values():
+            shard.add_word_counts(counts, -1)
+        for old_counts, new_counts in delta.modified_texts.values():
+            shard.add_word_counts(old_counts, -1)
+            shard.add_word_counts(new_counts)
+        for counts in delta.added_texts.values():
+            shard.add_word_counts(counts)
+        if shard.tag_index is not None:
+            for text_file in delta.removed_texts:
+                shard.tag_index.remove_file(text_file)
+            for text_file, (_, new_counts) in delta.modified_texts.items():
+                shard.tag_index.add_file(text_file, new_counts)
+            for text_file, counts in delta.added_texts.items():
+                shard.tag_index.add_file(text_file, counts)
+            self.update_tag_match_label()
+        if shard.cooccurrence is not None:
+            for counts in delta.removed_texts.values():
+                shard.cooccurrence.add_file(counts, -1)
+            for old_counts, new_counts in delta.modified_texts.values():
+                shard.cooccurrence.add_file(old_counts, -1)
+                shard.cooccurrence.add_file(new_counts)
+            for counts in delta.added_texts.values():
+                shard.cooccurrence.add_file(counts)
+
+        changed_images = set(delta.removed_images) | set(delta.modified_images)
+        for image_path in changed_images:
+            self.thumbnail_cache.invalidate(image_path)
+        if changed_images or delta.added_images or delta.modified_texts:
+            self.gallery_view.invalidate()  # Cheap: the cells on screen are re-read, mostly from the thumbnail cache
+        if delta.removed_images:
+            removed = set(delta.removed_images)
+            self.image_files = [img for img in self.image_files if img not in removed]
+            shard.image_files = [img for img in shard.image_files if img not in removed]
+            for image_path in delta.removed_images:
+                self.catalog.remove_image(image_path)
+        self.image_files.extend(delta.added_images)
+        shard.image_files.extend(delta.added_images)
+        self.catalog.add_images(delta.added_images)
+
+        if delta.removed_texts:
+            # Removing shifts list positions, so renumber; additions below just append
+            removed = set(delta.removed_texts)
+            for text_file in removed:
+                self.catalog.remove_caption(text_file)
+            self.text_files[:] = [f for f in self.text_files if f not in removed]
+            shard.text_files[:] = [f for f in shard.text_files if f not in removed]
+            self.upcoming_files = deque(f for f in self.upcoming_files if f not in removed)
+            self.catalog.add_captions(self.text_files, 0)
+            self.populate_file_list()
+            if self.current_text_file in removed:
+                self.current_text_file = None
+        if delta.added_texts:
+            first_index = len(self.text_files)
+            added = list(delta.added_texts)
+            self.catalog.add_captions(added, first_index)
+            self.text_files.extend(added)
+            shard.text_files.extend(added)
+            self.file_list_model.files_appended(first_index)
+
+        # Refresh the image on screen if its file (or its pairing) changed
+        if self.current_text_file and not self.is_shuffling:
+            current_stem = file_stem(self.current_text_file)
+            if any(file_stem(img) == current_stem for img in changed_images.union(delta.added_images)):
+                self.display_matching_image()
+
+    def on_folder_load_failed(self, error_message):
+        shard = self.sender_shard("load_thread")
+        if shard is None:
+            return
+        shard.load_thread = None
+        self.update_load_progress()
+        show_error_message(self, error_message)
+
+    # --- Gallery ---
+    def set_gallery_enabled(self, enabled):
+        self.settings_manager.save_setting("gallery_view", enabled)
+        self.image_stack.setCurrentIndex(1 if enabled else 0)
+        if enabled:
+            self.image_loader.cancel()  # The single image isn't on screen any more
+            row = self.file_list_view.currentIndex().row()
+            if row >= 0:
+                self.gallery_view.select_file(row)
+        elif not self.is_shuffling:
+            self.display_matching_image()
+
+    def is_gallery_enabled(self):
+        return self.gallery_checkbox.isChecked()
+
+    def open_gallery_file(self, index):
+        """Double-clicking a gallery cell opens it in the single image view."""
+        self.select_text_file(index)
+        self.file_list_view.setCurrentIndex(self.file_list_model.index(index.row()))
+        self.gallery_checkbox.setChecked(False)
 
     def populate_file_list(self):
-        print("Populating file list...")
-        self.file_list_widget.clear()
-        for filepath in self.text_files:
-            item = QListWidgetItem(os.path.basename(filepath))
-            item.setData(Qt.ItemDataRole.UserRole, filepath)
-            self.file_list_widget.addItem(item)
-        print("File list populated.")
-
-    def select_text_file(self, item):
-        print(f"Selected text file: {item.data(Qt.ItemDataRole.UserRole)}")
+        self.file_list_model.set_files(self.text_files)  # The model reads the list in place, no per-file items
+
+    def select_text_file(self, index):
+        logger.debug("Selected text file: %s", index.data(Qt.ItemDataRole.UserRole))
         self.is_shuffling = False
-        self.current_text_file = item.data(Qt.ItemDataRole.UserRole)
+        self.current_text_file = index.data(Qt.ItemDataRole.UserRole)
         self.display_prompt_and_image()
 
+    @timed_span("ui.display_prompt")
     def display_prompt_and_image(self):
-        print("Displaying prompt and image...")
         if self.current_text_file:
             try:
-                with open(self.current_text_file, "r", encoding="utf-8", errors="ignore") as f:
-                    content = f.read().strip()
-
-                print(f"Current prefix type: {self.current_prefix_type}")
-                print(f"Available prefixes: {self.prefixes}")
-                prefix = random.choice(self.prefixes.get(self.current_prefix_type, []))
-                self.prompt_text.setText(f"{prefix} {content}")
+                content = read_prompt_file(self.current_text_file)
+                self.prompt_text.setText(build_prompt(self.prefixes.get(self.current_prefix_type, []), content))
 
                 if not self.is_shuffling:
                     self.display_matching_image()
@@ -120,64 +587,89 @@ class PromptGenerator(QWidget):
                 show_error_message(self,f"Prefix List '{self.current_prefix_type}' Is empty.") # Use from error_utils
                 self.prompt_text.setText("")
 
+    def find_matching_image(self, text_file):
+        """Returns the image with the same base name as text_file, or None."""
+        return self.catalog.image_for(text_file)
+
     def display_matching_image(self):
-        print("Displaying matching image...")
+        if self.is_gallery_enabled():
+            return  # The gallery draws its own thumbnails
         if self.current_text_file:
-            base_name = os.path.splitext(os.path.basename(self.current_text_file))[0]
-            print(f"Looking for image matching: {base_name}")
-            matching_image = next((img for img in self.image_files if os.path.splitext(os.path.basename(img))[0] == base_name), None)
+            matching_image = self.find_matching_image(self.current_text_file)
 
             if matching_image:
                 self.load_image(matching_image)
             else:
-                print("No matching image found.")
+                logger.debug("No matching image for %s", self.current_text_file)
+                self.image_loader.cancel()
                 self.image_label.setText("No Matching Image")
         else:
-            print("No current text file selected.")
             self.image_label.setText("No Image")
 
-    def load_image(self, image_path):
-        """Loads an image using a QThread."""
-        if self.current_thread and self.current_thread.isRunning():
-            self.current_thread.quit()
-            self.current_thread.wait()
+    def image_target_size(self):
+        return (self.image_label.width(), self.image_label.height())
 
-        self.current_thread = ImageLoadThread(image_path, (self.image_label.width(), self.image_label.height()))
-        self.current_thread.imageLoaded.connect(self.set_image)  # Connect HERE
-        self.current_thread.imageLoadFailed.connect(self.show_image_error)  # And HERE
-        self.current_thread.start()
+    def load_image(self, image_path):
+        """Loads an image on the worker pool, superseding any request still in flight."""
+        self.image_loader.request(image_path, self.image_target_size())
 
-    def set_image(self, pixmap):
-        print("Setting image...")
-        self.image_label.setPixmap(pixmap)
-        print("Image set.")
+    @timed_span("ui.set_image")
+    def set_image(self, qimage, image_path=None):
+        self.image_label.setPixmap(QPixmap.fromImage(qimage))
+        mark_startup("first image")
 
     def show_image_error(self, error_message):
-        print(f"Image error: {error_message}")
+        logger.warning("Image error: %s", error_message)
         show_error_message(self, error_message) # Use from error_utils
 
 
+    @timed_span("ui.random_prompt")
     def generate_random_prompt(self):
-        print("Generating random prompt...")
         self.is_shuffling = False
         if self.text_files:
-            self.current_text_file = random.choice(self.text_files)
-            for i in range(self.file_list_widget.count()):
-                item = self.file_list_widget.item(i)
-                if item.data(Qt.ItemDataRole.UserRole) == self.current_text_file:
-                    self.file_list_widget.setCurrentItem(item)
-                    break
+            text_file = self.upcoming_files.popleft() if self.upcoming_files else self.pick_random_file()
+            if text_file is None:
+                self.prompt_text.setText("")
+                self.image_label.setText("No captions match the tag filter")
+                return
+            self.current_text_file = text_file
+            source_index = self.catalog.row_for(self.current_text_file)
+            row = self.file_list_model.view_row(source_index) if source_index is not None else None
+            if row is not None:
+                index = self.file_list_model.index(row)
+                self.file_list_view.setCurrentIndex(index)
+                self.file_list_view.scrollTo(index)
+                self.gallery_view.select_file(row)
+            else:
+                self.file_list_view.clearSelection()
             self.display_prompt_and_image()
-
+            self.prefetch_upcoming()
+
+    def prefetch_upcoming(self):
+        """Pre-chooses the next few random picks and decodes their images ahead of time."""
+        if self.is_gallery_enabled():
+            return  # Picks show up as gallery cells, not as full-size images
+        while len(self.upcoming_files) < PREFETCH_COUNT:
+            text_file = self.pick_random_file()
+            if text_file is None:
+                break
+            self.upcoming_files.append(text_file)
+        images = [img for img in map(self.find_matching_image, self.upcoming_files) if img]
+        self.image_loader.prefetch(images, self.image_target_size())
+
+    @timed_span("ui.shuffled_prompt")
     def generate_shuffled_prompt(self):
-        print("Generating shuffled prompt...")
         self.is_shuffling = True
         self.current_text_file = None
-        self.file_list_widget.setCurrentItem(None)
-
-        if self.all_words:
-            words, weights = zip(*self.all_words.items())
-            shuffled_words = random.choices(words, weights=weights, k=self.word_limit)
+        self.file_list_view.setCurrentIndex(QModelIndex())
+        self.image_loader.cancel()
+
+        if self.corpus.has_words():
+            shuffled_words = None
+            if self.coherent_checkbox.isChecked():
+                shuffled_words = self.corpus.coherent_sample(self.word_limit, self.tag_query)  # None until a graph is in
+            if shuffled_words is None:
+                shuffled_words = self.get_shuffle_sampler().sample(self.word_limit)
             try:
                 prefix = random.choice(self.prefixes.get(self.current_prefix_type, []))
             except KeyError:
@@ -186,46 +678,109 @@ class PromptGenerator(QWidget):
             except IndexError:
                 show_error_message(self,f"Prefix List '{self.current_prefix_type}' Is empty.") # Use from error_utils
                 prefix = ""
-            print(f"Shuffled prompt: {prefix} {' '.join(shuffled_words)}")
-            self.prompt_text.setText(f"{prefix} {' '.join(shuffled_words)}")
+            shuffled_text = join_tokens(shuffled_words, self.tokenizer)
+            logger.debug("Shuffled prompt: %s %s", prefix, shuffled_text)
+            self.prompt_text.setText(f"{prefix} {shuffled_text}")
             self.image_label.setText("No Image (Shuffling)")
 
+    def generate_shuffled_prompts(self, count):
+        """Generates `count` shuffled prompts in one batched sampler call (no UI updates)."""
+        if not self.corpus.has_words():
+            return []
+        prefixes = self.prefixes.get(self.current_prefix_type, []) or [""]
+        batches = self.get_shuffle_sampler().sample_batch(count, self.word_limit)
+        return [build_prompt(prefixes, join_tokens(words, self.tokenizer)) for words in batches]
 
     def copy_prompt(self):
-        print("Copying prompt to clipboard...")
         clipboard = QApplication.clipboard()
         clipboard.setText(self.prompt_text.toPlainText())
-        print("Prompt copied.")
+        logger.debug("Prompt copied.")
 
     def dragEnterEvent(self, event: QDragEnterEvent):
         if event.mimeData().hasUrls():
             urls = event.mimeData().urls()
-            if len(urls) == 1 and urls[0].isLocalFile() and os.path.isdir(urls[0].toLocalFile()):
+            if all(url.isLocalFile() and (os.path.isdir(url.toLocalFile()) or is_archive(url.toLocalFile())) for url in urls):
                 event.acceptProposedAction()
         else:
             event.ignore()
 
     def dropEvent(self, event: QDropEvent):
-        folder_path = event.mimeData().urls()[0].toLocalFile()
-        self.set_folder(folder_path)
+        """Dropped folders replace the loaded ones; with Ctrl held they are added to them."""
+        folder_paths = [url.toLocalFile() for url in event.mimeData().urls()]
+        if event.modifiers() & Qt.KeyboardModifier.ControlModifier:
+            for folder_path in folder_paths:
+                self.add_folder(folder_path)
+        else:
+            self.set_folders([(folder_path, 1.0) for folder_path in folder_paths])
 
     def load_settings(self):
-        print("Loading settings...")
         self.current_prefix_type = self.settings_manager.load_setting("prefix", list(self.prefixes.keys())[0] if self.prefixes else "")
         if self.current_prefix_type in self.prefixes:
             self.prefix_combo.setCurrentText(self.current_prefix_type)
         else:
-            print(f"Saved prefix '{self.current_prefix_type}' not found.")
-        folder_path = self.settings_manager.load_setting("folder", "")
-        if folder_path:
-            self.set_folder(folder_path)
-        print("Settings loaded.")
+            logger.warning("Saved prefix '%s' not found.", self.current_prefix_type)
+        tokenizer = self.settings_manager.load_setting("tokenizer", DEFAULT_TOKENIZER)
+        self.tokenizer = tokenizer if tokenizer in TOKENIZERS else DEFAULT_TOKENIZER
+        self.tokenizer_combo.setCurrentText(self.tokenizer)
+        try:
+            poll_seconds = int(float(self.settings_manager.load_setting("watch_poll_seconds", DEFAULT_POLL_SECONDS)))
+        except (TypeError, ValueError):
+            poll_seconds = DEFAULT_POLL_SECONDS
+        self.watch_poll_spinbox.setValue(poll_seconds)
+        self.watch_checkbox.setChecked(self.settings_manager.load_setting("watch_folder", False) in (True, "true"))
+        self.coherent_checkbox.setChecked(self.settings_manager.load_setting("coherent_shuffle", False) in (True, "true"))
+        self.recursive_scan = self.settings_manager.load_setting("recursive_scan", False) in (True, "true")
+        self.recursive_checkbox.setChecked(self.recursive_scan)
+        self.gallery_checkbox.setChecked(self.settings_manager.load_setting("gallery_view", False) in (True, "true"))
+        # The last folders are reopened after the first paint (restore_last_folder), so the window shows up right away
+        self.pending_folders = self.load_saved_folders()
+
+    def load_saved_folders(self):
+        """The saved (path, weight) list; older versions only saved a single "folder"."""
+        try:
+            folders = [(path, float(weight)) for path, weight in json.loads(self.settings_manager.load_setting("folders", "") or "[]")]
+        except (ValueError, TypeError):
+            logger.warning("Ignoring unreadable saved folder list.")
+            folders = []
+        if not folders:
+            folder_path = self.settings_manager.load_setting("folder", "")
+            folders = [(folder_path, 1.0)] if folder_path else []
+        return folders or None
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.first_paint_done:
+            self.first_paint_done = True
+            mark_startup("first paint")
+            QTimer.singleShot(0, self.restore_last_folder)  # Next event loop pass, after this frame is on screen
+
+    def restore_last_folder(self):
+        folders = self.pending_folders
+        self.pending_folders = None
+        if folders and not len(self.corpus):
+            logger.info("Restoring last folders: %s", ", ".join(path for path, _ in folders))
+            self.set_folders(folders)
+
+    def on_prompt_text_changed(self):
+        if self.prompt_text.toPlainText():
+            mark_startup("first prompt")
+            self.prompt_text.textChanged.disconnect(self.on_prompt_text_changed)
 
     def closeEvent(self, event):
-        print("Closing application...")
-        if self.current_thread and self.current_thread.isRunning():
-            print("Waiting for thread to finish...")
-            self.current_thread.quit()
-            self.current_thread.wait()
-            print("Thread finished.")
+        logger.info("Closing application...")
+        threads = []
+        for shard in self.corpus:
+            self.stop_watching(shard)
+            threads += [shard.load_thread, shard.graph_thread]
+        threads += self.retired_folder_threads
+        for thread in threads:
+            if thread and thread.isRunning():
+                thread.cancel()
+                thread.wait()
+        if self.ingest_pool is not None:
+            self.ingest_pool.shutdown(wait=False, cancel_futures=True)
+        self.image_loader.shutdown()
+        self.gallery_view.shutdown()
+        self.profiler.stop()
+        log_stats()
         event.accept()
\ No newline at end of file
@@ -0,0 +1,415 @@
+# prompt_server.py
+"""
+Local prompt service: loads a caption folder once and serves prompts over
+HTTP (TCP on localhost, or a Unix socket), so other local tools don't each
+re-ingest the folder. No Qt required.
+
+Example:
+    python prompt_server.py /path/to/dataset --port 8765
+    curl "http://127.0.0.1:8765/shuffle?n=4&words=12&tags=long%20hair,-hat"
+
+Endpoints (GET with query parameters, or POST with the same fields as a JSON body):
+    /random   Whole caption files.                  n, prefix, tags
+    /shuffle  Words drawn from the captions.        n, prefix, tags, words, coherent
+    /info     Folder, file and word counts.
+    /reload   Re-ingest the folder (POST).
+Every response is JSON: {"prompts": [...]} (plus "sources" for /random), or {"error": "..."}.
+
+Concurrent /shuffle requests are coalesced: everything that arrives within one
+event loop pass (or --batch-window-ms) is drawn in one vectorized
+sample_batch() call per (tag filter, word count) group.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import signal
+import sys
+from collections import OrderedDict
+from functools import lru_cache
+from urllib.parse import parse_qsl, urlsplit
+from archive_utils import is_archive
+from corpus_index import CorpusIndex
+from debug_utils import count, log_stats, setup_logging, timed_span
+from file_utils import load_files, load_prefixes
+from prompt_utils import build_prompt, read_prompt_file
+from sampler import WeightedSampler
+from tag_index import TagIndex, parse_tag_query
+from tokenizer_utils import DEFAULT_TOKENIZER, TOKENIZERS, join_tokens
+
+logger = logging.getLogger(__name__)
+
+MAX_PROMPTS_PER_REQUEST = 10000
+MAX_BODY_BYTES = 64 * 1024
+FILTERED_SAMPLERS = 64  # Per-tag-filter samplers kept around, least recently used dropped first
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+
+class RequestError(Exception):
+    """A bad request; turned into an error response with this status."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class Corpus:
+    """Everything loaded from one folder. Replaced as a whole on reload, so requests never see half of one."""
+
+    def __init__(self, folder_path, tokenizer):
+        errors = []
+        self.text_files, self.all_words = load_files(folder_path, errors.append, tokenizer)
+        if errors:
+            raise RequestError(errors[0], 500)
+        self.index = CorpusIndex(folder_path, tokenizer)
+        self.index.load()  # Just saved by load_files
+        self.tag_index = TagIndex.from_corpus_index(self.index, folder_path)
+        self.sampler = WeightedSampler(self.all_words)
+        self.graph = None  # CooccurrenceGraph, built on the first coherent request
+        self.graph_task = None  # Future of that build, so concurrent requests share it
+        self._filtered = OrderedDict()  # Tag query -> (word counts, sampler)
+        self.filtered_tasks = {}  # Tag query -> future of its build_filtered() call
+
+    def cached_filtered(self, query):
+        """(word counts, sampler) of the files matching a tag query, or None if it hasn't been built."""
+        entry = self._filtered.get(query)
+        if entry is not None:
+            self._filtered.move_to_end(query)
+        return entry
+
+    def build_filtered(self, query):
+        """Sums the matching files' word counts and builds their sampler. Slow on big corpora: run it in a worker."""
+        word_counts = self.tag_index.word_counts(*query)
+        return word_counts, WeightedSampler(word_counts)
+
+    def store_filtered(self, query, entry):
+        self._filtered[query] = entry
+        if len(self._filtered) > FILTERED_SAMPLERS:
+            self._filtered.popitem(last=False)
+
+
+@lru_cache(maxsize=65536)
+def _cached_prompt_file(filepath):
+    return read_prompt_file(filepath)
+
+
+class PromptService:
+    """Keeps a folder's corpus, prefixes and samplers in memory and generates prompts from them."""
+
+    def __init__(self, folder_path, prefixes, tokenizer=DEFAULT_TOKENIZER, seed=None, batch_window=0.0):
+        self.folder_path = folder_path
+        self.prefixes = prefixes
+        self.tokenizer = tokenizer
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.batch_window = batch_window  # Seconds to wait for more shuffle requests before sampling
+        self.corpus = Corpus(folder_path, tokenizer)
+        self._pending = {}  # (sampler, word count) -> [(prompt count, future)], waiting for the next batch
+        self._flush_scheduled = False
+        self._reload_task = None
+
+    def prefix_list(self, prefix_type):
+        if prefix_type is None:
+            prefix_type = next(iter(self.prefixes), "")
+        if prefix_type not in self.prefixes:
+            raise RequestError(f"Prefix '{prefix_type}' not found")
+        return self.prefixes[prefix_type] or [""]
+
+    def parse_query(self, tags):
+        return tuple(map(tuple, parse_tag_query(tags, self.tokenizer))) if tags else ((), ())
+
+    # --- Generation ---
+    def random_prompts(self, n, prefix_type=None, tags=""):
+        """Returns (sources, prompts) for n random caption files that pass the tag filter."""
+        corpus, rng = self.corpus, self.rng
+        prefix_list = self.prefix_list(prefix_type)
+        query = self.parse_query(tags)
+        if query != ((), ()):
+            ids = corpus.tag_index.matching_ids(*query)
+            files = corpus.tag_index.files
+            sources = [files[ids[int(rng.random() * len(ids))]] for _ in range(n)] if len(ids) else []
+        else:
+            text_files = corpus.text_files
+            sources = [rng.choice(text_files) for _ in range(n)] if text_files else []
+        if not sources:
+            raise RequestError("No captions match" + (f" '{tags}'" if tags else ""))
+        prompts = []
+        for filepath in sources:
+            try:
+                prompts.append(build_prompt(prefix_list, _cached_prompt_file(filepath), rng))
+            except OSError as e:
+                raise RequestError(f"Error reading file: {e}", 500) from None
+        return sources, prompts
+
+    async def shuffled_prompts(self, n, word_limit, prefix_type=None, tags="", coherent=False):
+        prefix_list = self.prefix_list(prefix_type)
+        query = self.parse_query(tags)
+        if coherent:
+            word_lists = await self._coherent_words(n, word_limit, query)
+        else:
+            sampler = (await self._filtered(self.corpus, query))[1] if query != ((), ()) else self.corpus.sampler
+            if not len(sampler):
+                raise RequestError("No captions match the tag filter" if query != ((), ()) else "No words loaded")
+            future = asyncio.get_running_loop().create_future()
+            self._pending.setdefault((sampler, word_limit), []).append((n, future))
+            self._schedule_flush()
+            word_lists = await future
+        rng = self.rng
+        return [build_prompt(prefix_list, join_tokens(words, self.tokenizer), rng) for words in word_lists]
+
+    def _schedule_flush(self):
+        if self._flush_scheduled:
+            return
+        self._flush_scheduled = True
+        loop = asyncio.get_running_loop()
+        if self.batch_window > 0:
+            loop.call_later(self.batch_window, self._flush)
+        else:
+            loop.call_soon(self._flush)  # After every request already read in this loop pass has been queued
+
+    @timed_span("server.batch")
+    def _flush(self):
+        """Draws the words for every waiting shuffle request, one sample_batch() call per group."""
+        self._flush_scheduled = False
+        pending, self._pending = self._pending, {}
+        for (sampler, word_limit), waiters in pending.items():
+            try:
+                seed = None if self.seed is None else self.rng.getrandbits(63)
+                word_lists = sampler.sample_batch(sum(n for n, _ in waiters), word_limit, seed=seed)
+            except Exception as e:
+                for _, future in waiters:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            count("server.batched_requests", len(waiters))
+            start = 0
+            for n, future in waiters:
+                if not future.done():  # The client may have gone away
+                    future.set_result(word_lists[start:start + n])
+                start += n
+
+    async def _coherent_words(self, n, word_limit, query):
+        """Coherent shuffles can't be vectorized; each prompt walks the co-occurrence graph."""
+        corpus = self.corpus
+        graph, rng = await self._graph(corpus), self.rng
+        sampler, allowed = corpus.sampler, None
+        if query != ((), ()):
+            allowed, sampler = await self._filtered(corpus, query)
+        if not len(sampler):
+            raise RequestError("No captions match the tag filter")
+        return [graph.sample(word_limit, sampler, rng, allowed) for _ in range(n)]
+
+    async def _filtered(self, corpus, query):
+        """
+        (word counts, sampler) of a tag query on `corpus`. A new query's alias
+        table is built in a worker thread, so requests already in flight don't
+        wait for it; concurrent requests for the same query share one build.
+        """
+        entry = corpus.cached_filtered(query)
+        if entry is not None:
+            return entry
+        task = corpus.filtered_tasks.get(query)
+        if task is None:
+            task = corpus.filtered_tasks[query] = asyncio.get_running_loop().run_in_executor(None, corpus.build_filtered, query)
+
+            def done(task):
+                corpus.filtered_tasks.pop(query, None)
+                if not task.cancelled() and task.exception() is None:
+                    corpus.store_filtered(query, task.result())  # On the event loop, like every other cache access
+            task.add_done_callback(done)
+        return await asyncio.shield(task)
+
+    async def _graph(self, corpus):
+        """
+        The co-occurrence graph of `corpus`, built once in a worker thread.
+        The build belongs to the corpus, so a reload meanwhile can't give the
+        new corpus the old folder's graph.
+        """
+        if corpus.graph is None:
+            if corpus.graph_task is None:
+                corpus.graph_task = asyncio.get_running_loop().run_in_executor(None, corpus.index.cooccurrence_graph)
+            try:
+                graph = await asyncio.shield(corpus.graph_task)
+            except Exception:
+                corpus.graph_task = None  # The next request tries again
+                raise
+            corpus.graph = graph
+        return corpus.graph
+
+    # --- Management ---
+    def info(self):
+        corpus = self.corpus
+        return {"folder": self.folder_path, "tokenizer": self.tokenizer, "files": len(corpus.text_files),
+                "words": len(corpus.all_words), "prefixes": list(self.prefixes)}
+
+    async def reload(self):
+        """Re-ingests the folder in a worker thread (only changed files are re-read), then swaps the corpus in."""
+        if self._reload_task is None or self._reload_task.done():
+            self._reload_task = asyncio.get_running_loop().run_in_executor(None, Corpus, self.folder_path, self.tokenizer)
+        self.corpus = await asyncio.shield(self._reload_task)
+        _cached_prompt_file.cache_clear()
+        logger.info("Reloaded %s: %d text files.", self.folder_path, len(self.corpus.text_files))
+        return self.info()
+
+
+class PromptServer:
+    """Minimal HTTP/1.1 front end (keep-alive, JSON only) for a PromptService."""
+
+    def __init__(self, service):
+        self.service = service
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "Malformed request"}, keep_alive=False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self.respond(writer, 413, {"error": "Request body too large"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+                status, payload = await self.dispatch(method, target, body)
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: application/json; charset=utf-8\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                     .encode("latin-1") + body)
+        await writer.drain()
+
+    async def dispatch(self, method, target, body):
+        """Routes one request. Returns (status, JSON-able payload)."""
+        count("server.requests")
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+        try:
+            if body:
+                try:
+                    params.update(json.loads(body))
+                except (json.JSONDecodeError, TypeError, ValueError):
+                    raise RequestError("Body must be a JSON object") from None
+            service = self.service
+            if url.path == "/random":
+                sources, prompts = service.random_prompts(self.int_param(params, "n", 1), self.str_param(params, "prefix"),
+                                                          self.str_param(params, "tags", ""))
+                return 200, {"prompts": prompts, "sources": sources}
+            if url.path == "/shuffle":
+                prompts = await service.shuffled_prompts(self.int_param(params, "n", 1), self.int_param(params, "words", 15),
+                                                         self.str_param(params, "prefix"), self.str_param(params, "tags", ""),
+                                                         str(params.get("coherent", "")).lower() in ("1", "true", "yes"))
+                return 200, {"prompts": prompts}
+            if url.path == "/info":
+                return 200, service.info()
+            if url.path == "/reload":
+                if method != "POST":
+                    raise RequestError("Use POST to reload", 405)
+                return 200, await service.reload()
+            raise RequestError(f"Unknown endpoint: {url.path}", 404)
+        except RequestError as e:
+            return e.status, {"error": str(e)}
+        except Exception as e:  # A bug shouldn't take the whole server down
+            logger.exception("Error handling %s %s", method, target)
+            return 500, {"error": str(e)}
+
+    @staticmethod
+    def int_param(params, name, default):
+        try:
+            value = int(params.get(name, default))
+        except (TypeError, ValueError):
+            raise RequestError(f"'{name}' must be an integer") from None
+        if not 1 <= value <= MAX_PROMPTS_PER_REQUEST:
+            raise RequestError(f"'{name}' must be between 1 and {MAX_PROMPTS_PER_REQUEST}")
+        return value
+
+    @staticmethod
+    def str_param(params, name, default=None):
+        value = params.get(name, default)
+        if value is not None and not isinstance(value, str):
+            raise RequestError(f"'{name}' must be a string")
+        return value
+
+
+async def serve(server, host, port, unix_path=None):
+    if unix_path:
+        listener = await asyncio.start_unix_server(server.handle_connection, unix_path)
+        logger.info("Serving prompts on unix:%s", unix_path)
+    else:
+        listener = await asyncio.start_server(server.handle_connection, host, port)
+        logger.info("Serving prompts on http://%s:%d", host, port)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C still ends the server through KeyboardInterrupt
+    async with listener:
+        await stop.wait()
+    logger.info("Shutting down.")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve prompts from a caption folder to other local tools.")
+    parser.add_argument("folder", help="Folder (or .zip/.tar archive) containing .txt caption files")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: localhost only)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", dest="unix_path", default=None, help="Listen on this Unix socket instead of TCP")
+    parser.add_argument("--prefixes", dest="prefixes_file", default="prefixes.json", help="Prefixes JSON file")
+    parser.add_argument("--tokenizer", choices=tuple(TOKENIZERS), default=DEFAULT_TOKENIZER,
+                        help="How captions are split into words for shuffles")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible output (given the same request order)")
+    parser.add_argument("--batch-window-ms", type=float, default=0,
+                        help="Wait this long for more shuffle requests before sampling (0: batch what arrives together)")
+    parser.add_argument("--log-level", default="INFO")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_logging(args.log_level)
+    if not (os.path.isdir(args.folder) or is_archive(args.folder)):
+        logger.error("Invalid folder path: %s", args.folder)
+        return 1
+    prefixes = load_prefixes(args.prefixes_file, logger.error)
+    try:
+        service = PromptService(args.folder, prefixes, args.tokenizer, args.seed, args.batch_window_ms / 1000)
+    except RequestError as e:
+        logger.error("%s", e)
+        return 1
+    logger.info("Loaded %d text files, %d words.", len(service.corpus.text_files), len(service.corpus.all_words))
+    try:
+        asyncio.run(serve(PromptServer(service), args.host, args.port, args.unix_path))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log_stats()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,28 @@
+# prompt_utils.py
+import random
+from archive_utils import read_text
+from tokenizer_utils import DEFAULT_TOKENIZER, join_tokens
+
+
+def read_prompt_file(filepath):
+    """Reads a text file's prompt, as displayed in the UI."""
+    return read_text(filepath).strip()
+
+
+def build_prompt(prefix_list, body, rng=random):
+    """
+    Prepends a random prefix from prefix_list to body.
+    Raises IndexError if prefix_list is empty, like random.choice.
+    """
+    return f"{rng.choice(prefix_list)} {body}"
+
+
+def random_file_prompt(text_files, prefix_list, rng=random):
+    """Picks a random text file and returns (filepath, prompt)."""
+    filepath = rng.choice(text_files)
+    return filepath, build_prompt(prefix_list, read_prompt_file(filepath), rng)
+
+
+def shuffled_prompt(sampler, prefix_list, word_limit, rng=random, tokenizer=DEFAULT_TOKENIZER):
+    """Returns a prompt of word_limit words drawn from a WeightedSampler."""
+    return build_prompt(prefix_list, join_tokens(sampler.sample(word_limit, rng), tokenizer), rng)
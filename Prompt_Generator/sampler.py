@@ -0,0 +1,95 @@
+# sampler.py
+import random
+from array import array
+from vocabulary import Vocabulary
+from import_utils import optional_import
+from debug_utils import timed_span
+
+
+class WeightedSampler:
+    """
+    Draws words in proportion to their counts using Vose's alias method.
+    Building the table is O(vocabulary) and happens once per word table;
+    every draw after that is O(1), whatever the vocabulary size.
+    Works on word IDs: a Vocabulary is sampled in place through its counts
+    array, a plain dict through a list of its keys.
+    """
+
+    @timed_span("sampler.build")
+    def __init__(self, word_counts):
+        if isinstance(word_counts, Vocabulary):
+            self.word_at = word_counts.word_at
+            weights = word_counts.counts
+        else:
+            self.word_at = list(word_counts.keys()).__getitem__
+            weights = list(word_counts.values())
+        n = len(weights)
+        self.size = n
+        self.prob = array("d", bytes(8 * n))
+        self.alias = array("q", bytes(8 * n))
+        self._np_tables = None
+        total = sum(weights)
+        if n == 0 or total <= 0:
+            self.size = 0
+            return
+
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        for i in large + small:  # Leftovers are 1.0 up to float rounding
+            self.prob[i] = 1.0
+            self.alias[i] = i
+
+    def __len__(self):
+        return self.size
+
+    def sample_indices(self, k, rng=random):
+        """Returns k word IDs, drawn with replacement."""
+        n = self.size
+        prob, alias = self.prob, self.alias
+        picks = []
+        for _ in range(k):
+            i = int(rng.random() * n)
+            picks.append(i if rng.random() < prob[i] else alias[i])
+        return picks
+
+    @timed_span("sampler.sample")
+    def sample(self, k, rng=random):
+        """Returns k words, drawn with replacement in proportion to their counts."""
+        if not self.size:
+            return []
+        word_at = self.word_at
+        return [word_at(i) for i in self.sample_indices(k, rng)]
+
+    @timed_span("sampler.sample_batch")
+    def sample_batch(self, count, k, seed=None):
+        """
+        Returns `count` lists of k words each. With NumPy installed the whole
+        batch is drawn in one vectorized call; otherwise it falls back to sample().
+        """
+        if not self.size:
+            return [[] for _ in range(count)]
+        np = optional_import("numpy")  # Optional: only used to vectorize batch generation
+        if np is None:
+            rng = random.Random(seed)
+            return [self.sample(k, rng) for _ in range(count)]
+
+        if self._np_tables is None:
+            self._np_tables = (np.frombuffer(self.prob, dtype=np.float64),
+                               np.frombuffer(self.alias, dtype=np.int64))
+        prob, alias = self._np_tables
+        rng = np.random.default_rng(seed)
+        idx = rng.integers(0, self.size, size=(count, k))
+        idx = np.where(rng.random((count, k)) < prob[idx], idx, alias[idx])
+        word_at = self.word_at
+        return [[word_at(i) for i in row] for row in idx.tolist()]
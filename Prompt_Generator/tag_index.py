@@ -0,0 +1,205 @@
+# tag_index.py
+import os
+import random
+import string
+from array import array
+from tokenizer_utils import DEFAULT_TOKENIZER, get_tokenizer
+from import_utils import optional_import
+from debug_utils import count, timed_span
+
+
+def tag_key(token):
+    """
+    Normalizes a token for tag matching by stripping surrounding punctuation,
+    so the whitespace tokenizer's "hat," matches the query term "hat".
+    Tokens that are nothing but punctuation (e.g. "^_^") are kept as they are.
+    """
+    return token.strip(string.punctuation) or token
+
+
+def parse_tag_query(text, tokenizer=DEFAULT_TOKENIZER):
+    """
+    Parses a filter like "long hair, smile, -hat" into (include, exclude) token lists.
+    Terms are comma-separated and a leading '-' excludes one. Each term is run
+    through the caption tokenizer and tag_key(), so it matches the indexed tokens;
+    with the whitespace tokenizer a multi-word term becomes several tokens.
+    """
+    tokenize = get_tokenizer(tokenizer)
+    include, exclude = [], []
+    for term in text.split(","):
+        term = term.strip()
+        target = include
+        if term.startswith("-"):
+            target = exclude
+            term = term[1:].strip()
+        target.extend(tag_key(token) for token in tokenize(term))
+    return include, exclude
+
+
+class TagIndex:
+    """
+    Inverted index of a caption folder: token -> sorted array of the IDs of the
+    files containing it. "Files with A and B but not C" is then an intersection
+    of posting lists rather than a scan of every caption.
+
+    File IDs are handed out in order and never reused, so postings stay sorted
+    by appending. Removed files are only marked dead and filtered out of
+    results; a changed file is removed and added again under a new ID.
+    A flat forward index (file -> tokens and counts) lets shuffle mode sum
+    the word counts of just the matching files. Postings are keyed by
+    tag_key() while the forward index keeps the tokens as written, so shuffled
+    prompts still read like the captions.
+    """
+
+    def __init__(self):
+        self.files = []  # File ID -> path (None once removed)
+        self._file_ids = {}  # Path -> file ID
+        self._dead = set()  # IDs of removed files
+        self._term_ids = {}  # Token -> term ID
+        self.terms = []  # Term ID -> token
+        self._tag_ids = {}  # tag_key() of a token -> tag ID
+        self.postings = []  # Tag ID -> array("I") of file IDs, ascending
+        self._fwd_offsets = array("Q", [0])  # File ID -> start of its entries in the arrays below
+        self._fwd_terms = array("I")
+        self._fwd_counts = array("I")
+        self.version = 0  # Bumped on every change, so callers can tell when cached results went stale
+        self._cache = {}
+
+    def __len__(self):
+        return len(self._file_ids)
+
+    def __contains__(self, path):
+        return path in self._file_ids
+
+    @classmethod
+    def from_corpus_index(cls, corpus_index, folder_path=None):
+        """Builds the tag index of every file in a CorpusIndex. Paths are joined onto folder_path (default: the index's)."""
+        tag_index = cls()
+        folder_path = folder_path or corpus_index.folder_path
+        for filename, entry in corpus_index.entries.items():
+            tag_index.add_file(os.path.join(folder_path, filename), entry[2])
+        return tag_index
+
+    # --- Updates ---
+    def add_file(self, path, word_counts):
+        """Indexes a file's tokens (a word -> count mapping). Re-adding a path replaces it."""
+        if path in self._file_ids:
+            self.remove_file(path)
+        file_id = len(self.files)
+        self.files.append(path)
+        self._file_ids[path] = file_id
+        tag_ids = set()  # "hat" and "hat," share a posting, which lists the file once
+        for word, n in word_counts.items():
+            term_id = self._term_ids.get(word)
+            if term_id is None:
+                term_id = len(self.terms)
+                self._term_ids[word] = term_id
+                self.terms.append(word)
+            self._fwd_terms.append(term_id)
+            self._fwd_counts.append(n)
+            key = tag_key(word)
+            tag_id = self._tag_ids.get(key)
+            if tag_id is None:
+                tag_id = len(self.postings)
+                self._tag_ids[key] = tag_id
+                self.postings.append(array("I"))
+            tag_ids.add(tag_id)
+        for tag_id in sorted(tag_ids):
+            self.postings[tag_id].append(file_id)
+        self._fwd_offsets.append(len(self._fwd_terms))
+        self._changed()
+
+    def remove_file(self, path):
+        file_id = self._file_ids.pop(path, None)
+        if file_id is None:
+            return
+        self.files[file_id] = None
+        self._dead.add(file_id)
+        self._changed()
+
+    def _changed(self):
+        self.version += 1
+        self._cache.clear()
+
+    # --- Queries ---
+    def matching_ids(self, include=(), exclude=()):
+        """
+        Returns the ascending IDs of files containing every include token and no
+        exclude token (a NumPy array or an array("I")). Results are cached until the index changes.
+        """
+        key = (tuple(include), tuple(exclude))
+        ids = self._cache.get(key)
+        if ids is None:
+            count("tags.query_cache_miss")
+            ids = self._cache[key] = self._match(include, exclude)
+        return ids
+
+    @timed_span("tags.query")
+    def _match(self, include, exclude):
+        postings = []
+        for word in include:
+            tag_id = self._tag_ids.get(tag_key(word))
+            if tag_id is None:
+                return array("I")  # Nothing contains an unknown tag
+            postings.append(self.postings[tag_id])
+        postings.sort(key=len)  # Start from the rarest tag; the result can only shrink
+        excluded = [self.postings[self._tag_ids[key]] for key in map(tag_key, exclude) if key in self._tag_ids]
+        np = optional_import("numpy")  # Optional: vectorizes the intersections
+
+        if np is not None:
+            # np.array copies: views would stop the posting arrays from growing
+            ids = np.array(postings[0], dtype=np.uint32) if postings else np.arange(len(self.files), dtype=np.uint32)
+            for posting in postings[1:]:
+                ids = np.intersect1d(ids, np.array(posting, dtype=np.uint32), assume_unique=True)
+            for posting in excluded:
+                ids = np.setdiff1d(ids, np.array(posting, dtype=np.uint32), assume_unique=True)
+            if self._dead:
+                ids = np.setdiff1d(ids, np.fromiter(self._dead, dtype=np.uint32), assume_unique=True)
+            return ids
+
+        ids = set(postings[0]) if postings else set(range(len(self.files)))
+        for posting in postings[1:]:
+            ids.intersection_update(posting)
+        for posting in excluded:
+            ids.difference_update(posting)
+        ids -= self._dead
+        return array("I", sorted(ids))
+
+    def count(self, include=(), exclude=()):
+        return len(self.matching_ids(include, exclude))
+
+    def matching_files(self, include=(), exclude=()):
+        files = self.files
+        return [files[file_id] for file_id in self.matching_ids(include, exclude)]
+
+    def random_file(self, include=(), exclude=(), rng=random):
+        """Returns a random matching file's path, or None if nothing matches."""
+        ids = self.matching_ids(include, exclude)
+        if not len(ids):
+            return None
+        return self.files[ids[int(rng.random() * len(ids))]]
+
+    @timed_span("tags.word_counts")
+    def word_counts(self, include=(), exclude=()):
+        """Returns the summed word counts ({word: count}) of the matching files."""
+        ids = self.matching_ids(include, exclude)
+        offsets = self._fwd_offsets
+        np = optional_import("numpy")
+        if np is not None:
+            # Gather every forward entry that belongs to a matching file, then count per term in one go
+            file_matches = np.zeros(len(self.files), dtype=bool)
+            file_matches[np.asarray(ids, dtype=np.int64)] = True
+            mask = np.repeat(file_matches, np.diff(np.array(offsets, dtype=np.int64)))
+            totals = np.bincount(np.array(self._fwd_terms, dtype=np.int64)[mask],
+                                 weights=np.array(self._fwd_counts, dtype=np.float64)[mask],
+                                 minlength=len(self.terms))
+            terms = self.terms
+            return {terms[term_id]: int(totals[term_id]) for term_id in np.flatnonzero(totals)}
+
+        counts = {}
+        fwd_terms, fwd_counts, terms = self._fwd_terms, self._fwd_counts, self.terms
+        for file_id in ids:
+            for i in range(offsets[file_id], offsets[file_id + 1]):
+                word = terms[fwd_terms[i]]
+                counts[word] = counts.get(word, 0) + fwd_counts[i]
+        return counts
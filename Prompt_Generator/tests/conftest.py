@@ -0,0 +1,6 @@
+# conftest.py
+import os
+import sys
+
+# The app is a folder of flat modules (run as `python main.py`), so make them importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
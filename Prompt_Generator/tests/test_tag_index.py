@@ -0,0 +1,45 @@
+# test_tag_index.py
+from file_utils import count_words
+from tag_index import TagIndex, parse_tag_query
+
+
+def build_index(tmp_path, captions, tokenizer):
+    tag_index = TagIndex()
+    for name, text in captions.items():
+        path = tmp_path / name
+        path.write_text(text, encoding="utf-8")
+        tag_index.add_file(str(path), count_words(str(path), tokenizer))
+    return tag_index
+
+
+def test_comma_separated_captions_with_default_tokenizer(tmp_path):
+    captions = {
+        "a.txt": "1girl, long hair, smile, hat, outdoors",
+        "b.txt": "1girl, short hair, smile, indoors",
+        "c.txt": "1boy, hat, smile",
+    }
+    tag_index = build_index(tmp_path, captions, "whitespace")
+    query = parse_tag_query("smile, -hat", "whitespace")
+    assert query == (["smile"], ["hat"])
+    assert tag_index.matching_files(*query) == [str(tmp_path / "b.txt")]
+    assert tag_index.count(*parse_tag_query("long hair, smile", "whitespace")) == 1
+    # Shuffle still draws the tokens as written in the captions
+    assert "hat," in tag_index.word_counts(*parse_tag_query("outdoors", "whitespace"))
+
+
+def test_tags_tokenizer(tmp_path):
+    captions = {
+        "a.txt": "long hair, smile, ^_^",
+        "b.txt": "short hair, smile",
+    }
+    tag_index = build_index(tmp_path, captions, "tags")
+    assert tag_index.matching_files(*parse_tag_query("smile, -long hair", "tags")) == [str(tmp_path / "b.txt")]
+    assert tag_index.count(*parse_tag_query("^_^", "tags")) == 1
+
+
+def test_changed_file_is_reindexed(tmp_path):
+    tag_index = build_index(tmp_path, {"a.txt": "hat, smile"}, "whitespace")
+    path = str(tmp_path / "a.txt")
+    tag_index.add_file(path, {"smile": 1})
+    assert tag_index.count(*parse_tag_query("hat", "whitespace")) == 0
+    assert tag_index.count(*parse_tag_query("smile", "whitespace")) == 1
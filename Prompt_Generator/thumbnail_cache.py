@@ -0,0 +1,226 @@
+# thumbnail_cache.py
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from PyQt6.QtGui import QImage
+from archive_utils import stat_path
+from corpus_index import get_cache_dir
+from debug_utils import count
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_DISK_BYTES = 512 * 1024 * 1024
+DISK_PRUNE_TARGET = 0.9  # Pruning goes a bit below the disk budget, so it doesn't run again on the next put
+
+
+class ThumbnailCache:
+    """
+    Two-tier cache of ready-to-display thumbnails.
+    Tier 1 is an in-memory LRU of QImages bounded by a byte budget; tier 2 is a
+    folder of PNGs that survives restarts. Entries are keyed by path, mtime,
+    file size and target size, so an edited image never serves a stale thumbnail.
+    QImage (unlike QPixmap) is safe to share between threads; all methods lock.
+
+    The disk tier is bounded by max_disk_bytes once prune_disk() has measured
+    it (start_disk_prune() does that in the background): from then on, a put()
+    that goes over budget deletes the least recently used PNGs, oldest
+    modification time first (disk hits touch their file).
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, disk_dir=None, use_disk=True, max_disk_bytes=DEFAULT_MAX_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_dir = (disk_dir or get_cache_dir("thumbnails")) if use_disk else None
+        self._memory = OrderedDict()  # key -> QImage, least recently used first
+        self._memory_bytes = 0
+        self._disk_bytes = None  # Size of the disk tier; None until prune_disk() has measured it
+        self._pruning = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(image_path, target_size):
+        """Returns the cache key for an image, or None if the file can't be stat'ed."""
+        try:
+            size, mtime_ns = stat_path(image_path)
+        except OSError:
+            return None
+        return (os.path.abspath(image_path), mtime_ns, size, tuple(target_size))
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, digest[:2], f"{digest}.png")
+
+    def get(self, image_path, target_size):
+        """Returns the cached QImage thumbnail, or None on a miss."""
+        key = self.make_key(image_path, target_size)
+        if key is None:
+            return None
+        with self._lock:
+            qimage = self._memory.get(key)
+            if qimage is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                count("thumbnail.hit")
+                return qimage
+
+        if self.disk_dir:
+            disk_path = self._disk_path(key)
+            if os.path.exists(disk_path):
+                qimage = QImage(disk_path)
+                if not qimage.isNull():
+                    try:
+                        os.utime(disk_path)  # Recently used, so pruning keeps it
+                    except OSError:
+                        pass
+                    with self._lock:
+                        self.disk_hits += 1
+                        self._store(key, qimage)
+                    count("thumbnail.disk_hit")
+                    return qimage
+        with self._lock:
+            self.misses += 1
+        count("thumbnail.miss")
+        return None
+
+    def peek(self, image_path, target_size):
+        """Memory-only lookup, cheap enough for the GUI thread. Returns None on a miss."""
+        key = self.make_key(image_path, target_size)
+        if key is None:
+            return None
+        with self._lock:
+            qimage = self._memory.get(key)
+            if qimage is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                count("thumbnail.hit")
+            return qimage
+
+    def contains(self, image_path, target_size):
+        """True if the thumbnail is in memory. Doesn't touch LRU order or the hit counters."""
+        key = self.make_key(image_path, target_size)
+        with self._lock:
+            return key is not None and key in self._memory
+
+    def put(self, image_path, target_size, qimage):
+        """Adds a thumbnail to memory and (if enabled) to the disk store."""
+        key = self.make_key(image_path, target_size)
+        if key is None or qimage.isNull():
+            return
+        with self._lock:
+            self._store(key, qimage)
+        if self.disk_dir:
+            disk_path = self._disk_path(key)
+            try:
+                os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+                tmp_path = f"{disk_path}.{threading.get_ident()}.tmp.png"  # Per thread: a display and a prefetch can race
+                if qimage.save(tmp_path, "PNG"):
+                    written = os.path.getsize(tmp_path)
+                    os.replace(tmp_path, disk_path)
+                    with self._lock:
+                        if self._disk_bytes is not None:
+                            self._disk_bytes += written  # Only an estimate (overwrites count twice); pruning re-measures
+                        over_budget = self._disk_bytes is not None and self._disk_bytes > self.max_disk_bytes
+                    if over_budget:
+                        self.prune_disk()
+            except OSError as e:
+                logger.warning("Could not write thumbnail cache: %s", e)  # The memory tier still works
+
+    def _store(self, key, qimage):
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key).sizeInBytes()
+        self._memory[key] = qimage
+        self._memory_bytes += qimage.sizeInBytes()
+        self._evict()
+
+    def _evict(self):
+        while self._memory and self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.sizeInBytes()
+
+    def set_max_bytes(self, max_bytes):
+        """Changes the memory budget, evicting right away if it shrank."""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def invalidate(self, image_path):
+        """
+        Drops every in-memory thumbnail of an image, along with their PNGs. Disk
+        entries of older versions that were no longer in memory are left to prune_disk().
+        """
+        abs_path = os.path.abspath(image_path)
+        with self._lock:
+            keys = [k for k in self._memory if k[0] == abs_path]
+            for key in keys:
+                self._memory_bytes -= self._memory.pop(key).sizeInBytes()
+        if self.disk_dir:
+            for key in keys:
+                try:
+                    os.remove(self._disk_path(key))
+                except OSError:
+                    pass  # Never written, or already pruned
+
+    def prune_disk(self):
+        """
+        Measures the disk tier and, if it is over max_disk_bytes, deletes the
+        least recently used PNGs until it is below DISK_PRUNE_TARGET of it.
+        Walks the whole cache folder, so call it off the GUI thread.
+        """
+        if not self.disk_dir:
+            return
+        with self._lock:
+            if self._pruning:
+                return
+            self._pruning = True
+        try:
+            files = []
+            total = 0
+            for root, _, names in os.walk(self.disk_dir):
+                for name in names:
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((st.st_mtime_ns, st.st_size, path))
+                    total += st.st_size
+            if total > self.max_disk_bytes:
+                files.sort()
+                target = self.max_disk_bytes * DISK_PRUNE_TARGET
+                removed = 0
+                for _, size, path in files:
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    total -= size
+                    removed += 1
+                count("thumbnail.disk_pruned", removed)
+                logger.info("Pruned %d thumbnails from the disk cache (%.0f MB left).", removed, total / (1024 * 1024))
+            with self._lock:
+                self._disk_bytes = total
+        finally:
+            with self._lock:
+                self._pruning = False
+
+    def start_disk_prune(self):
+        """Runs prune_disk() on a background thread, e.g. at startup."""
+        if self.disk_dir:
+            threading.Thread(target=self.prune_disk, name="thumbnail-prune", daemon=True).start()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+    @property
+    def memory_bytes(self):
+        return self._memory_bytes
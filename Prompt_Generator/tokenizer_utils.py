@@ -0,0 +1,54 @@
+# tokenizer_utils.py
+"""
+Caption tokenizers. They are looked up by name so the choice can be saved in
+settings, stored in the corpus index and passed to worker processes.
+"""
+
+DEFAULT_TOKENIZER = "whitespace"
+
+
+def tokenize_whitespace(text):
+    """Splits on any whitespace: 'long hair, blue eyes' -> ['long', 'hair,', 'blue', 'eyes']."""
+    return text.split()
+
+
+def tokenize_tags(text):
+    """Splits booru-style tagger output on commas and newlines: -> ['long hair', 'blue eyes']."""
+    tags = []
+    for tag in text.replace("\n", ",").split(","):
+        tag = " ".join(tag.split())  # Trim and collapse inner whitespace
+        if tag:
+            tags.append(tag)
+    return tags
+
+
+def tokenize_lines(text):
+    """One token per non-empty line, for captions written as one phrase per line."""
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+TOKENIZERS = {
+    "whitespace": tokenize_whitespace,
+    "tags": tokenize_tags,
+    "lines": tokenize_lines,
+}
+
+# How tokens are joined back into a prompt
+TOKEN_SEPARATORS = {
+    "whitespace": " ",
+    "tags": ", ",
+    "lines": ", ",
+}
+
+
+def get_tokenizer(name):
+    """Returns the tokenizer function for a name, raising ValueError for unknown names."""
+    try:
+        return TOKENIZERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown tokenizer: {name}") from None
+
+
+def join_tokens(tokens, tokenizer=DEFAULT_TOKENIZER):
+    """Joins tokens back into prompt text, with the separator that suits the tokenizer."""
+    return TOKEN_SEPARATORS.get(tokenizer, " ").join(tokens)
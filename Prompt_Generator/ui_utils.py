@@ -2,8 +2,13 @@
 
 from PyQt6.QtWidgets import (QHBoxLayout, QLabel, QComboBox,
                              QPushButton, QTextEdit, QGroupBox,
-                             QListWidget, QSpinBox, QVBoxLayout, QWidget)
+                             QListView, QSpinBox, QVBoxLayout, QWidget,
+                             QProgressBar, QLineEdit, QCheckBox, QMenu,
+                             QListWidget, QDoubleSpinBox, QStackedWidget)
 from PyQt6.QtCore import Qt, QSize
+from file_list_model import FileListModel
+from gallery_view import GalleryView
+from tokenizer_utils import TOKENIZERS
 
 def setup_ui(prompt_generator, prefixes):
     """Sets up the UI elements for the PromptGenerator with a side-by-side layout."""
@@ -26,21 +31,94 @@ def setup_ui(prompt_generator, prefixes):
 
     # --- Folder Selection ---
     folder_group = QGroupBox("Folder")
-    folder_layout = QHBoxLayout()
+    folder_layout = QVBoxLayout()
+    folder_row_layout = QHBoxLayout()
     prompt_generator.folder_label = QLabel("No folder selected")
     prompt_generator.folder_button = QPushButton("Select Folder")
     prompt_generator.folder_button.clicked.connect(prompt_generator.select_folder)
-    folder_layout.addWidget(prompt_generator.folder_label)
-    folder_layout.addWidget(prompt_generator.folder_button)
+    folder_row_layout.addWidget(prompt_generator.folder_label)
+    folder_row_layout.addWidget(prompt_generator.folder_button)
+    prompt_generator.archive_button = QPushButton("Open Archive")
+    prompt_generator.archive_button.setToolTip("Browse a .zip or .tar dataset without extracting it")
+    prompt_generator.archive_button.clicked.connect(prompt_generator.select_archive)
+    folder_row_layout.addWidget(prompt_generator.archive_button)
+    prompt_generator.add_folder_button = QPushButton("Add...")
+    prompt_generator.add_folder_button.setToolTip("Add another folder or archive; prompts mix all of them by weight")
+    add_folder_menu = QMenu(prompt_generator.add_folder_button)
+    add_folder_menu.addAction("Folder...", prompt_generator.add_folder_dialog)
+    add_folder_menu.addAction("Archive...", prompt_generator.add_archive_dialog)
+    prompt_generator.add_folder_button.setMenu(add_folder_menu)
+    folder_row_layout.addWidget(prompt_generator.add_folder_button)
+    folder_layout.addLayout(folder_row_layout)
+
+    # Loaded folders with their sampling weights, shown once there is more than one
+    prompt_generator.folder_list_widget = QWidget()
+    folder_list_layout = QHBoxLayout()
+    folder_list_layout.setContentsMargins(0, 0, 0, 0)
+    prompt_generator.folder_list = QListWidget()
+    prompt_generator.folder_list.setMaximumHeight(80)
+    prompt_generator.folder_list.currentRowChanged.connect(prompt_generator.on_folder_selected)
+    folder_list_layout.addWidget(prompt_generator.folder_list)
+    folder_weight_layout = QVBoxLayout()
+    folder_weight_layout.addWidget(QLabel("Weight:"))
+    prompt_generator.folder_weight_spinbox = QDoubleSpinBox()
+    prompt_generator.folder_weight_spinbox.setRange(0.0, 100.0)
+    prompt_generator.folder_weight_spinbox.setSingleStep(0.5)
+    prompt_generator.folder_weight_spinbox.setValue(1.0)
+    prompt_generator.folder_weight_spinbox.setToolTip("Share of the random picks and shuffled words that come from "
+                                                      "the selected folder, relative to the others (0 mutes it)")
+    prompt_generator.folder_weight_spinbox.valueChanged.connect(prompt_generator.update_folder_weight)
+    folder_weight_layout.addWidget(prompt_generator.folder_weight_spinbox)
+    prompt_generator.remove_folder_button = QPushButton("Remove")
+    prompt_generator.remove_folder_button.clicked.connect(prompt_generator.remove_selected_folder)
+    folder_weight_layout.addWidget(prompt_generator.remove_folder_button)
+    folder_list_layout.addLayout(folder_weight_layout)
+    prompt_generator.folder_list_widget.setLayout(folder_list_layout)
+    prompt_generator.folder_list_widget.hide()
+    folder_layout.addWidget(prompt_generator.folder_list_widget)
+
+    folder_options_layout = QHBoxLayout()
+    prompt_generator.watch_checkbox = QCheckBox("Watch folder for changes")
+    prompt_generator.watch_checkbox.toggled.connect(prompt_generator.set_watch_enabled)
+    folder_options_layout.addWidget(prompt_generator.watch_checkbox)
+    prompt_generator.watch_poll_spinbox = QSpinBox()
+    prompt_generator.watch_poll_spinbox.setRange(0, 3600)
+    prompt_generator.watch_poll_spinbox.setPrefix("Rescan every ")
+    prompt_generator.watch_poll_spinbox.setSuffix(" s")
+    prompt_generator.watch_poll_spinbox.setSpecialValueText("No rescans")
+    prompt_generator.watch_poll_spinbox.setToolTip("Added and removed files are seen right away; edits to existing "
+                                                   "captions and images are only found by these periodic rescans")
+    prompt_generator.watch_poll_spinbox.valueChanged.connect(prompt_generator.update_watch_poll)
+    folder_options_layout.addWidget(prompt_generator.watch_poll_spinbox)
+    prompt_generator.recursive_checkbox = QCheckBox("Include subfolders")
+    prompt_generator.recursive_checkbox.setToolTip("Also load captions and images from subfolders (archives always include everything)")
+    prompt_generator.recursive_checkbox.toggled.connect(prompt_generator.set_recursive_enabled)
+    folder_options_layout.addWidget(prompt_generator.recursive_checkbox)
+    folder_layout.addLayout(folder_options_layout)
+    prompt_generator.load_progress = QProgressBar()  # Shown while a folder is being ingested
+    prompt_generator.load_progress.hide()
+    folder_layout.addWidget(prompt_generator.load_progress)
     folder_group.setLayout(folder_layout)
     controls_layout.addWidget(folder_group)
 
     # --- Text File List ---
     file_list_group = QGroupBox("Text Files")
     file_list_layout = QVBoxLayout()
-    prompt_generator.file_list_widget = QListWidget()
-    prompt_generator.file_list_widget.itemClicked.connect(prompt_generator.select_text_file)
-    file_list_layout.addWidget(prompt_generator.file_list_widget)
+    prompt_generator.file_filter_edit = QLineEdit()
+    prompt_generator.file_filter_edit.setPlaceholderText("Filter file names...")
+    prompt_generator.file_filter_edit.setClearButtonEnabled(True)
+    prompt_generator.file_list_model = FileListModel(prompt_generator)
+    prompt_generator.file_filter_edit.textChanged.connect(prompt_generator.file_list_model.set_filter)
+    prompt_generator.file_list_view = QListView()
+    prompt_generator.file_list_view.setModel(prompt_generator.file_list_model)
+    prompt_generator.file_list_view.setUniformItemSizes(True)  # Lets the view skip measuring every row
+    prompt_generator.file_list_view.clicked.connect(prompt_generator.select_text_file)
+    prompt_generator.gallery_checkbox = QCheckBox("Show as gallery")
+    prompt_generator.gallery_checkbox.setToolTip("Show the files as a grid of images with their captions in place of the single image")
+    prompt_generator.gallery_checkbox.toggled.connect(prompt_generator.set_gallery_enabled)
+    file_list_layout.addWidget(prompt_generator.file_filter_edit)
+    file_list_layout.addWidget(prompt_generator.file_list_view)
+    file_list_layout.addWidget(prompt_generator.gallery_checkbox)
     file_list_group.setLayout(file_list_layout)
     controls_layout.addWidget(file_list_group)
 
@@ -54,9 +132,34 @@ def setup_ui(prompt_generator, prefixes):
     prompt_generator.word_limit_spinbox.valueChanged.connect(prompt_generator.update_word_limit)
     word_limit_layout.addWidget(QLabel("Max Words:"))
     word_limit_layout.addWidget(prompt_generator.word_limit_spinbox)
+    prompt_generator.tokenizer_combo = QComboBox()
+    prompt_generator.tokenizer_combo.addItems(list(TOKENIZERS.keys()))
+    prompt_generator.tokenizer_combo.setToolTip("How captions are split into words: whitespace, comma-separated tags, or lines")
+    prompt_generator.tokenizer_combo.currentTextChanged.connect(prompt_generator.update_tokenizer)
+    word_limit_layout.addWidget(QLabel("Split By:"))
+    word_limit_layout.addWidget(prompt_generator.tokenizer_combo)
+    prompt_generator.coherent_checkbox = QCheckBox("Keep related tags together")
+    prompt_generator.coherent_checkbox.setToolTip("Shuffle picks tags that appear in the same captions, without repeats")
+    prompt_generator.coherent_checkbox.toggled.connect(prompt_generator.set_coherent_enabled)
+    word_limit_layout.addWidget(prompt_generator.coherent_checkbox)
     word_limit_group.setLayout(word_limit_layout)
     controls_layout.addWidget(word_limit_group)
 
+    # --- Tag Filter ---
+    tag_filter_group = QGroupBox("Tag Filter")
+    tag_filter_layout = QHBoxLayout()
+    prompt_generator.tag_query_edit = QLineEdit()
+    prompt_generator.tag_query_edit.setPlaceholderText("long hair, smile, -hat")
+    prompt_generator.tag_query_edit.setToolTip("Random and shuffled prompts only use captions with all of these tags "
+                                               "and none of the '-' ones. Press Enter to apply.")
+    prompt_generator.tag_query_edit.setClearButtonEnabled(True)
+    prompt_generator.tag_query_edit.editingFinished.connect(prompt_generator.update_tag_query)
+    prompt_generator.tag_match_label = QLabel("")
+    tag_filter_layout.addWidget(prompt_generator.tag_query_edit)
+    tag_filter_layout.addWidget(prompt_generator.tag_match_label)
+    tag_filter_group.setLayout(tag_filter_layout)
+    controls_layout.addWidget(tag_filter_group)
+
     # --- Prompt Display ---
     prompt_group = QGroupBox("Prompt")
     prompt_layout = QVBoxLayout()
@@ -64,11 +167,14 @@ def setup_ui(prompt_generator, prefixes):
     prompt_generator.prompt_text.setReadOnly(True)
     prompt_generator.copy_button = QPushButton("Copy Prompt")
     prompt_generator.copy_button.clicked.connect(prompt_generator.copy_prompt)
+    prompt_generator.random_button = QPushButton("Random Prompt")
+    prompt_generator.random_button.clicked.connect(prompt_generator.generate_random_prompt)
     prompt_generator.shuffle_button = QPushButton("Shuffle Prompt")
     prompt_generator.shuffle_button.clicked.connect(prompt_generator.generate_shuffled_prompt)
     prompt_layout.addWidget(prompt_generator.prompt_text)
     buttons_layout = QHBoxLayout()
     buttons_layout.addWidget(prompt_generator.copy_button)
+    buttons_layout.addWidget(prompt_generator.random_button)
     buttons_layout.addWidget(prompt_generator.shuffle_button)
     prompt_layout.addLayout(buttons_layout)
     prompt_group.setLayout(prompt_layout)
@@ -79,7 +185,7 @@ def setup_ui(prompt_generator, prefixes):
     main_layout.addWidget(controls_widget)  # Add the controls widget to the main layout
 
 
-    # --- Right Side: Image ---
+    # --- Right Side: Image (or the gallery grid) ---
     image_layout = QVBoxLayout()
     prompt_generator.image_label = QLabel()
     prompt_generator.image_label.setFixedSize(QSize(400, 400))  # Larger image size!
@@ -88,6 +194,14 @@ def setup_ui(prompt_generator, prefixes):
 
     image_widget = QWidget() # Create a widget to hold the image
     image_widget.setLayout(image_layout)
-    main_layout.addWidget(image_widget) # Add the image widget
+    prompt_generator.gallery_view = GalleryView(prompt_generator.file_list_model, prompt_generator.find_matching_image,
+                                                prompt_generator.thumbnail_cache)
+    prompt_generator.gallery_view.setMinimumSize(QSize(400, 400))
+    prompt_generator.gallery_view.clicked.connect(prompt_generator.select_text_file)
+    prompt_generator.gallery_view.doubleClicked.connect(prompt_generator.open_gallery_file)
+    prompt_generator.image_stack = QStackedWidget()
+    prompt_generator.image_stack.addWidget(image_widget)
+    prompt_generator.image_stack.addWidget(prompt_generator.gallery_view)
+    main_layout.addWidget(prompt_generator.image_stack, 1) # The gallery takes the spare width
 
     prompt_generator.setLayout(main_layout)
\ No newline at end of file
@@ -0,0 +1,201 @@
+# vocabulary.py
+import os
+import mmap
+import struct
+import tempfile
+from array import array
+
+MAGIC = b"RPGVOC01"
+HEADER = struct.Struct("<8sQQ")  # magic, word count, blob size
+
+
+class Vocabulary:
+    """
+    Compact word -> count table with integer word IDs.
+
+    The bulk of the words live "frozen": UTF-8 encoded, sorted, concatenated
+    in one buffer and addressed by an offsets array, with counts in a parallel
+    array. That is a few dozen bytes per word instead of a dict entry plus two
+    Python objects. A frozen table can be memory-mapped straight from its
+    on-disk form (load(use_mmap=True)), so it costs page cache, not heap.
+
+    Words added later (add() of an unknown word) get the next free IDs in a
+    small overlay; IDs never change until compact() builds a new table.
+    Supports the read-only dict API the app uses: get, in, len, items, iteration.
+    """
+
+    def __init__(self):
+        self._blob = b""  # Sorted UTF-8 words, concatenated (bytes or a memoryview of an mmap)
+        self._offsets = array("Q", [0])  # Word i is _blob[_offsets[i]:_offsets[i + 1]]
+        self.counts = array("q")  # Count per word ID: frozen words first, then overlay words
+        self._extra_ids = {}  # Overlay: word -> ID
+        self._extra_words = []  # Overlay: ID - frozen size -> word
+        self._nonzero = 0  # Words with a positive count
+
+    # --- Construction ---
+    @classmethod
+    def from_counts(cls, word_counts):
+        """Builds a frozen vocabulary from any mapping (or Vocabulary) of word -> count."""
+        vocab = cls()
+        encoded = sorted((word.encode("utf-8"), count) for word, count in word_counts.items() if count > 0)
+        offsets = array("Q", [0])
+        position = 0
+        for word_bytes, _ in encoded:
+            position += len(word_bytes)
+            offsets.append(position)
+        vocab._blob = b"".join(word_bytes for word_bytes, _ in encoded)
+        vocab._offsets = offsets
+        vocab.counts = array("q", (count for _, count in encoded))
+        vocab._nonzero = len(encoded)
+        return vocab
+
+    def copy(self):
+        """Independent copy. The frozen words are immutable, so only counts and the overlay are copied."""
+        vocab = Vocabulary()
+        vocab._blob = self._blob
+        vocab._offsets = self._offsets
+        vocab.counts = array("q", self.counts)
+        vocab._extra_ids = dict(self._extra_ids)
+        vocab._extra_words = list(self._extra_words)
+        vocab._nonzero = self._nonzero
+        return vocab
+
+    def compact(self):
+        """Returns a new fully frozen vocabulary, merging the overlay and dropping zero counts."""
+        return Vocabulary.from_counts(self)
+
+    def __getstate__(self):
+        # Memory-mapped buffers can't be pickled (e.g. to worker processes), so send plain copies
+        state = self.__dict__.copy()
+        state["_blob"] = bytes(self._blob)
+        state["_offsets"] = array("Q", self._offsets)
+        return state
+
+    # --- Persistence ---
+    def save(self, path):
+        """Writes the frozen form atomically (unique temp file + rename), compacting first if needed."""
+        vocab = self if not self._extra_words and self._nonzero == len(self.counts) else self.compact()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(HEADER.pack(MAGIC, vocab.frozen_size, len(vocab._blob)))
+                f.write(vocab._offsets.tobytes())
+                f.write(vocab.counts.tobytes())
+                f.write(vocab._blob)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def load(cls, path, use_mmap=True):
+        """
+        Loads a saved vocabulary. With use_mmap the words and offsets stay in
+        the mapped file; only the (mutable) counts are copied into memory.
+        Raises OSError or ValueError if the file is missing or malformed.
+        """
+        with open(path, "rb") as f:
+            if use_mmap:
+                data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            else:
+                data = memoryview(f.read())
+        if len(data) < HEADER.size:
+            raise ValueError(f"Truncated vocabulary file: {path}")
+        magic, size, blob_size = HEADER.unpack_from(data)
+        offsets_end = HEADER.size + 8 * (size + 1)
+        counts_end = offsets_end + 8 * size
+        if magic != MAGIC or counts_end + blob_size != len(data):
+            raise ValueError(f"Invalid vocabulary file: {path}")
+
+        vocab = cls()
+        vocab._offsets = data[HEADER.size:offsets_end].cast("Q")
+        vocab.counts = array("q")
+        vocab.counts.frombytes(data[offsets_end:counts_end])
+        vocab._blob = data[counts_end:]
+        vocab._nonzero = sum(1 for count in vocab.counts if count > 0)
+        return vocab
+
+    # --- Lookups ---
+    @property
+    def frozen_size(self):
+        return len(self._offsets) - 1
+
+    def word_at(self, word_id):
+        """Returns the word with a given ID."""
+        frozen_size = self.frozen_size
+        if word_id < frozen_size:
+            return bytes(self._blob[self._offsets[word_id]:self._offsets[word_id + 1]]).decode("utf-8")
+        return self._extra_words[word_id - frozen_size]
+
+    def id_of(self, word):
+        """Returns a word's ID, or None if it isn't in the vocabulary. O(log n) for frozen words."""
+        word_id = self._extra_ids.get(word)
+        if word_id is not None:
+            return word_id
+        key = word.encode("utf-8")
+        blob, offsets = self._blob, self._offsets
+        lo, hi = 0, self.frozen_size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if bytes(blob[offsets[mid]:offsets[mid + 1]]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.frozen_size and bytes(blob[offsets[lo]:offsets[lo + 1]]) == key:
+            return lo
+        return None
+
+    def add(self, word, count):
+        """Adds (or, with a negative count, subtracts) occurrences of a word. Counts never go below zero."""
+        word_id = self.id_of(word)
+        if word_id is None:
+            if count <= 0:
+                return
+            word_id = self.frozen_size + len(self._extra_words)
+            self._extra_ids[word] = word_id
+            self._extra_words.append(word)
+            self.counts.append(0)
+        old = self.counts[word_id]
+        new = max(0, old + count)
+        self.counts[word_id] = new
+        self._nonzero += (new > 0) - (old > 0)
+
+    # --- dict-like API ---
+    def get(self, word, default=None):
+        word_id = self.id_of(word)
+        if word_id is None or self.counts[word_id] <= 0:
+            return default
+        return self.counts[word_id]
+
+    def __getitem__(self, word):
+        count = self.get(word)
+        if count is None:
+            raise KeyError(word)
+        return count
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+    def __len__(self):
+        return self._nonzero
+
+    def __bool__(self):
+        return self._nonzero > 0
+
+    def items(self):
+        counts = self.counts
+        for word_id in range(len(counts)):
+            if counts[word_id] > 0:
+                yield self.word_at(word_id), counts[word_id]
+
+    def keys(self):
+        return (word for word, _ in self.items())
+
+    def values(self):
+        return (count for count in self.counts if count > 0)
+
+    def __iter__(self):
+        return self.keys()